@@ -20,9 +20,10 @@ app.secret_key = os.getenv('SECRET_KEY', os.urandom(24))
 # INICIALIZAÇÃO DE MÓDULOS
 # ============================================================================
 
-# Inicializa banco de dados (pool de conexões)
-from utils.db import init_db_pool
-init_db_pool()
+# Abre o pool de conexões em background (o pool também é criado sob demanda
+# na primeira consulta; DB_DISABLED=1 sobe a aplicação sem banco)
+from utils.db import warm_up_db_pool
+warm_up_db_pool()
 
 # Inicializa OAuth
 from routes.auth import init_oauth
@@ -86,6 +87,14 @@ app.register_blueprint(arr_bp)
 from routes.api.themes import themes_bp
 app.register_blueprint(themes_bp)
 
+# Respostas condicionais (ETag/304) para as APIs de dados
+from utils.cache import add_conditional_headers
+app.after_request(add_conditional_headers)
+
+# Log de requisições lentas com o uso do pool de conexões
+from utils.slow_requests import register_slow_request_log
+register_slow_request_log(app)
+
 print("[OK] Aplicacao Flask inicializada com estrutura modular")
 
 if __name__ == '__main__':
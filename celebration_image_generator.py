@@ -100,23 +100,13 @@ def get_padrao_background_base64():
 
 
 def get_celebration_theme():
-    """Obtém o tema de celebração configurado do arquivo JSON"""
-    import json
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    THEME_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'celebration_theme_config.json')
-    
-    try:
-        if os.path.exists(THEME_CONFIG_FILE):
-            with open(THEME_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                theme = config.get('theme', 'black-november')
-                # Valida o tema
-                valid_themes = ['black-november', 'natal', 'padrao']
-                if theme in valid_themes:
-                    return theme
-    except Exception as e:
-        print(f"Erro ao ler configuração de tema: {e}")
-    
+    """Obtém o tema de celebração configurado (data/celebration_theme_config.json)"""
+    from utils.config_store import get_config
+    theme = get_config('celebration_theme').get('theme', 'black-november')
+    # Valida o tema
+    valid_themes = ['black-november', 'natal', 'padrao']
+    if theme in valid_themes:
+        return theme
     return 'black-november'  # Tema padrão
 
 
@@ -0,0 +1,41 @@
+-- Migration: create revenue rollup tables
+-- Receita por dia × pipeline × classe de stage × tipo de receita, atualizada
+-- incrementalmente a partir de deals.hs_lastmodifieddate (ver utils/revenue_rollup.py)
+
+-- Contribuição atual de cada deal (permite desfazer a contribuição anterior
+-- quando o deal muda de dia, stage ou valor)
+CREATE TABLE IF NOT EXISTS revenue_rollup_deals (
+  deal_id TEXT PRIMARY KEY,
+  day DATE NOT NULL,
+  pipeline TEXT NOT NULL,
+  stage_class TEXT NOT NULL,
+  revenue_type TEXT NOT NULL,
+  valor_ganho NUMERIC NOT NULL,
+  hs_lastmodifieddate TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_revenue_rollup_deals_day ON revenue_rollup_deals (day);
+
+-- Totais diários (day = data de fechamento no horário de Brasília)
+CREATE TABLE IF NOT EXISTS revenue_daily_rollup (
+  day DATE NOT NULL,
+  pipeline TEXT NOT NULL,
+  stage_class TEXT NOT NULL,
+  revenue_type TEXT NOT NULL,
+  total NUMERIC NOT NULL DEFAULT 0,
+  deal_count INTEGER NOT NULL DEFAULT 0,
+  -- Soma dos deals com valor_ganho acima de cada faixa
+  tier_1 NUMERIC NOT NULL DEFAULT 0,
+  tier_2 NUMERIC NOT NULL DEFAULT 0,
+  tier_3 NUMERIC NOT NULL DEFAULT 0,
+  tier_4 NUMERIC NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, pipeline, stage_class, revenue_type)
+);
+
+-- Watermark da última atualização incremental
+CREATE TABLE IF NOT EXISTS revenue_rollup_state (
+  name TEXT PRIMARY KEY,
+  watermark TIMESTAMP,
+  last_full_rebuild TIMESTAMPTZ,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
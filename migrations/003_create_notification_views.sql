@@ -0,0 +1,28 @@
+-- Migration: create notification view tracking tables
+-- Substitui deal_notifications.viewed_by (TEXT[] reescrito a cada visualização)
+-- por uma linha por painel × notificação e um high-water mark por painel
+-- (ver utils/deals.py)
+
+-- Notificações vistas por cada painel acima do seu high-water mark
+CREATE TABLE IF NOT EXISTS notification_views (
+  client_id TEXT NOT NULL,
+  notification_id TEXT NOT NULL REFERENCES deal_notifications (id) ON DELETE CASCADE,
+  viewed_at TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (client_id, notification_id)
+);
+
+-- Todas as notificações com created_at <= high_water_mark já foram vistas pelo
+-- painel; as linhas de notification_views abaixo dele são removidas
+CREATE TABLE IF NOT EXISTS notification_clients (
+  client_id TEXT PRIMARY KEY,
+  high_water_mark TIMESTAMPTZ NOT NULL,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Copia as visualizações já registradas em viewed_by (a coluna deixa de ser
+-- atualizada e pode ser removida depois)
+INSERT INTO notification_views (client_id, notification_id, viewed_at)
+SELECT DISTINCT viewer.client_id, n.id, n.created_at
+FROM deal_notifications n
+CROSS JOIN LATERAL unnest(n.viewed_by) AS viewer (client_id)
+ON CONFLICT DO NOTHING;
@@ -4,8 +4,9 @@ API Routes para badges e recordes
 from flask import Blueprint, jsonify, request
 from datetime import datetime
 from utils.mappings import get_analyst_name
-from utils.badges import get_user_badges, get_recordes
+from utils.badges import get_user_badges, get_recordes, get_badge_day_window
 from utils.db import get_db_connection_context
+from utils.single_flight import single_flight
 from psycopg2.extras import RealDictCursor
 
 badges_bp = Blueprint('badges', __name__, url_prefix='/api')
@@ -145,6 +146,7 @@ def get_mvp_semana():
             return jsonify({'error': str(e)}), 500
 
 @badges_bp.route('/badges/stats')
+@single_flight
 def get_badges_stats():
     """Retorna estatísticas gerais de badges"""
     with get_db_connection_context() as conn:
@@ -154,13 +156,15 @@ def get_badges_stats():
         try:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             stats = {}
+            today = get_badge_day_window()
+            today_params = {'today_start': today.start, 'today_end': today.end}
             
             # Total de badges desbloqueados hoje
             cursor.execute("""
                 SELECT COUNT(*) as total
                 FROM badges_desbloqueados
-                WHERE DATE(unlocked_at) = CURRENT_DATE
-            """)
+                WHERE unlocked_at >= %(today_start)s AND unlocked_at < %(today_end)s
+            """, today_params)
             stats['badges_hoje'] = cursor.fetchone()['total']
             
             # Total de badges na semana
@@ -177,10 +181,10 @@ def get_badges_stats():
                     badge_category,
                     COUNT(*) as total
                 FROM badges_desbloqueados
-                WHERE DATE(unlocked_at) = CURRENT_DATE
+                WHERE unlocked_at >= %(today_start)s AND unlocked_at < %(today_end)s
                 GROUP BY badge_category
                 ORDER BY total DESC
-            """)
+            """, today_params)
             stats['por_categoria_hoje'] = {row['badge_category']: row['total'] for row in cursor.fetchall()}
             
             # Top 3 usuários com mais badges hoje
@@ -189,11 +193,11 @@ def get_badges_stats():
                     user_name, user_type,
                     COUNT(*) as total_badges
                 FROM badges_desbloqueados
-                WHERE DATE(unlocked_at) = CURRENT_DATE
+                WHERE unlocked_at >= %(today_start)s AND unlocked_at < %(today_end)s
                 GROUP BY user_name, user_type
                 ORDER BY total_badges DESC
                 LIMIT 3
-            """)
+            """, today_params)
             stats['top_usuarios_hoje'] = [dict(row) for row in cursor.fetchall()]
             
             cursor.close()
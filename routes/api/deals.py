@@ -17,13 +17,16 @@ def get_pending_deals():
     Query parameters:
         - client_id: ID do painel/cliente (obrigatório)
         - since: Timestamp ISO 8601 para filtrar apenas deals criados após esse momento
+        - session_start: '1' no primeiro poll após o carregamento da página
+          (as notificações anteriores passam a contar como vistas pelo painel)
     """
     try:
         client_id = request.args.get('client_id')
         since_timestamp = request.args.get('since')
+        session_start = request.args.get('session_start') == '1'
         
         # Tenta buscar no banco primeiro
-        db_notifications = fetch_pending_notifications_db(client_id, since_timestamp)
+        db_notifications = fetch_pending_notifications_db(client_id, since_timestamp, session_start=session_start)
         if db_notifications is not None:
             pending = db_notifications
         else:
@@ -1,9 +1,14 @@
 """
 API Routes para debug
 """
-from flask import Blueprint, jsonify, render_template
+from flask import Blueprint, jsonify, render_template, request
 from utils.auth import require_auth
 from utils.db import get_pool_status
+from utils.cache import get_cache_entries, get_cache_backend, is_refresh_leader, INSTANCE_ID
+from utils.cache_manager import get_refresh_loop_status
+from utils.config_store import get_config_status
+from utils.badge_writer import get_badge_queue_status
+from utils.query_profiler import get_slow_queries, SLOW_QUERY_THRESHOLD, QUERY_PROFILER_ENABLED
 from routes.api.webhooks import webhook_logs, deal_notifications
 from utils.deals import fetch_pending_notifications_db
 
@@ -16,4 +21,30 @@ def debug_pool_status():
     status = get_pool_status()
     return jsonify(status)
 
+@debug_bp.route('/cache', methods=['GET'])
+@require_auth
+def debug_cache_status():
+    """Endpoint de debug com o estado de cada chave do cache e da thread de atualização"""
+    keys = {key: entry.to_dict() for key, entry in sorted(get_cache_entries().items())}
+    return jsonify({
+        'instance': INSTANCE_ID,
+        'backend': type(get_cache_backend()).__name__,
+        'leader': is_refresh_leader(),
+        'refresh_loop': get_refresh_loop_status(),
+        'configs': get_config_status(),
+        'badge_queue': get_badge_queue_status(),
+        'keys': keys
+    })
 
+@debug_bp.route('/slow-queries', methods=['GET'])
+@require_auth
+def debug_slow_queries():
+    """Endpoint de debug com as consultas SQL mais caras (por fingerprint) e seus EXPLAIN"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    sort = request.args.get('sort', 'total')
+    return jsonify({
+        'enabled': QUERY_PROFILER_ENABLED,
+        'threshold': SLOW_QUERY_THRESHOLD,
+        'sort': sort,
+        'queries': get_slow_queries(limit=limit, sort=sort)
+    })
@@ -2,38 +2,36 @@
 API Routes para Hall da Fama (rankings com badges)
 """
 from flask import Blueprint, jsonify, request
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import os
 import requests
 from utils.mappings import get_analyst_name
 from utils.datetime_utils import (
-    get_today_brazil_start_utc,
+    get_brazil_window,
     convert_utc_to_brazil,
     parse_hubspot_timestamp
 )
-from utils.badges import detect_badges, save_badge_to_database
-from utils.cache_manager import get_cache, get_cache_lock
+from utils.badges import detect_badges
+from utils.badge_writer import enqueue_badges
+from utils.cache import cached_json_response, set_cached
+from utils.single_flight import single_flight
 
 hall_da_fama_bp = Blueprint('hall_da_fama', __name__, url_prefix='/api/hall-da-fama')
 
 @hall_da_fama_bp.route('/evs-realtime')
+@single_flight
 def hall_da_fama_evs_realtime():
     """Retorna Top 5 EVs com badges em tempo real via HubSpot API"""
-    _data_cache = get_cache()
-    _cache_lock = get_cache_lock()
-    
     use_cache = request.args.get('use_cache', 'false').lower() == 'true'
-    if use_cache and _data_cache.get('hall_evs'):
-        response = jsonify(_data_cache['hall_evs'])
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['X-Cache'] = 'HIT'
+    response = cached_json_response('hall_evs') if use_cache else None
+    if response is not None:
+        response.headers['Cache-Control'] = 'no-cache'
         return response
     
     try:
-        today_start_utc = get_today_brazil_start_utc()
-        today_start_ms = int(today_start_utc.timestamp() * 1000)
-        tomorrow_start_utc = today_start_utc + timedelta(days=1)
-        tomorrow_start_ms = int(tomorrow_start_utc.timestamp() * 1000)
+        today = get_brazil_window('today')
+        today_start_ms = int(today.start.timestamp() * 1000)
+        tomorrow_start_ms = int(today.end.timestamp() * 1000)
         
         hubspot_token = os.getenv('HUBSPOT_PRIVATE_APP_TOKEN')
         url = 'https://api.hubapi.com/crm/v3/objects/deals/search'
@@ -115,29 +113,26 @@ def hall_da_fama_evs_realtime():
         
         # Formata resposta e salva badges
         ranking = []
+        badge_entries = []
         for idx, (owner_id, stats) in enumerate(top_evs, 1):
             timestamps = sorted(stats['timestamps'])
             badges = detect_badges(timestamps, stats['count'], stats['revenue'], 'EV')
             user_name = get_analyst_name(owner_id)
             
-            # Salva badges no banco de dados
-            for badge in badges:
-                try:
-                    save_badge_to_database(
-                        user_type='EV',
-                        user_id=owner_id,
-                        user_name=user_name,
-                        badge=badge,
-                        metric_value=stats['revenue'],
-                        context={
-                            'count': stats['count'],
-                            'revenue': stats['revenue'],
-                            'deals': stats['deals'],
-                            'timestamps': [t.isoformat() for t in timestamps]
-                        }
-                    )
-                except Exception as e:
-                    print(f"[AVISO] Erro ao salvar badge {badge['code']} para {user_name}: {e}")
+            # Badges enfileirados para gravação após o ranking
+            badge_entries.extend({
+                'user_type': 'EV',
+                'user_id': owner_id,
+                'user_name': user_name,
+                'badge': badge,
+                'metric_value': stats['revenue'],
+                'context': {
+                    'count': stats['count'],
+                    'revenue': stats['revenue'],
+                    'deals': stats['deals'],
+                    'timestamps': [t.isoformat() for t in timestamps]
+                }
+            } for badge in badges)
             
             ranking.append({
                 'position': idx,
@@ -150,6 +145,9 @@ def hall_da_fama_evs_realtime():
                 'lastDeal': timestamps[-1].strftime('%H:%M:%S') if timestamps else None
             })
         
+        # Badges são gravados em background (a resposta não espera o banco)
+        enqueue_badges(badge_entries)
+        
         result = {
             'status': 'success',
             'userType': 'EV',
@@ -160,11 +158,10 @@ def hall_da_fama_evs_realtime():
         
         # Atualiza cache se não estava usando
         if not use_cache:
-            with _cache_lock:
-                _data_cache['hall_evs'] = result
+            set_cached('hall_evs', result)
         
         response = jsonify(result)
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Cache-Control'] = 'no-cache'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         response.headers['X-Cache'] = 'MISS'
@@ -178,20 +175,17 @@ def hall_da_fama_evs_realtime():
         return jsonify({'error': str(e)}), 500
 
 @hall_da_fama_bp.route('/sdrs-realtime')
+@single_flight
 def hall_da_fama_sdrs_realtime():
     """Retorna Top 5 SDRs com badges em tempo real via HubSpot API"""
-    _data_cache = get_cache()
-    _cache_lock = get_cache_lock()
-    
     pipeline = request.args.get('pipeline', '6810518')
     
     use_cache = request.args.get('use_cache', 'false').lower() == 'true'
     cache_key = 'hall_sdrs_new' if pipeline == '6810518' else 'hall_sdrs_expansao'
     
-    if use_cache and _data_cache.get(cache_key):
-        response = jsonify(_data_cache[cache_key])
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['X-Cache'] = 'HIT'
+    response = cached_json_response(cache_key) if use_cache else None
+    if response is not None:
+        response.headers['Cache-Control'] = 'no-cache'
         return response
     
     try:
@@ -204,10 +198,9 @@ def hall_da_fama_sdrs_realtime():
         else:
             return jsonify({'error': 'Pipeline inválido. Use 6810518 (NEW) ou 4007305 (Expansão)'}), 400
         
-        today_start_utc = get_today_brazil_start_utc()
-        today_start_ms = int(today_start_utc.timestamp() * 1000)
-        tomorrow_start_utc = today_start_utc + timedelta(days=1)
-        tomorrow_start_ms = int(tomorrow_start_utc.timestamp() * 1000)
+        today = get_brazil_window('today')
+        today_start_ms = int(today.start.timestamp() * 1000)
+        tomorrow_start_ms = int(today.end.timestamp() * 1000)
         
         hubspot_token = os.getenv('HUBSPOT_PRIVATE_APP_TOKEN')
         url = 'https://api.hubapi.com/crm/v3/objects/deals/search'
@@ -263,30 +256,27 @@ def hall_da_fama_sdrs_realtime():
         
         # Formata resposta e salva badges
         ranking = []
+        badge_entries = []
         for idx, (sdr_id, stats) in enumerate(top_sdrs, 1):
             timestamps = sorted(stats['timestamps'])
             badges = detect_badges(timestamps, stats['count'], None, 'SDR')
             user_name = get_analyst_name(sdr_id)
             
-            # Salva badges no banco de dados
-            for badge in badges:
-                try:
-                    save_badge_to_database(
-                        user_type='SDR',
-                        user_id=sdr_id,
-                        user_name=user_name,
-                        badge=badge,
-                        metric_value=stats['count'],
-                        pipeline=pipeline_name,
-                        context={
-                            'count': stats['count'],
-                            'pipeline': pipeline_name,
-                            'deals': stats['deals'],
-                            'timestamps': [t.isoformat() for t in timestamps]
-                        }
-                    )
-                except Exception as e:
-                    print(f"[AVISO] Erro ao salvar badge {badge['code']} para {user_name}: {e}")
+            # Badges enfileirados para gravação após o ranking
+            badge_entries.extend({
+                'user_type': 'SDR',
+                'user_id': sdr_id,
+                'user_name': user_name,
+                'badge': badge,
+                'metric_value': stats['count'],
+                'pipeline': pipeline_name,
+                'context': {
+                    'count': stats['count'],
+                    'pipeline': pipeline_name,
+                    'deals': stats['deals'],
+                    'timestamps': [t.isoformat() for t in timestamps]
+                }
+            } for badge in badges)
             
             ranking.append({
                 'position': idx,
@@ -298,6 +288,9 @@ def hall_da_fama_sdrs_realtime():
                 'lastScheduled': timestamps[-1].strftime('%H:%M:%S') if timestamps else None
             })
         
+        # Badges são gravados em background (a resposta não espera o banco)
+        enqueue_badges(badge_entries)
+        
         result = {
             'status': 'success',
             'userType': 'SDR',
@@ -309,11 +302,10 @@ def hall_da_fama_sdrs_realtime():
         
         # Atualiza cache se não estava usando
         if not use_cache:
-            with _cache_lock:
-                _data_cache[cache_key] = result
+            set_cached(cache_key, result)
         
         response = jsonify(result)
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Cache-Control'] = 'no-cache'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         response.headers['X-Cache'] = 'MISS'
@@ -327,23 +319,19 @@ def hall_da_fama_sdrs_realtime():
         return jsonify({'error': str(e)}), 500
 
 @hall_da_fama_bp.route('/ldrs-realtime')
+@single_flight
 def hall_da_fama_ldrs_realtime():
     """Retorna Top 5 LDRs com badges em tempo real via HubSpot API"""
-    _data_cache = get_cache()
-    _cache_lock = get_cache_lock()
-    
     use_cache = request.args.get('use_cache', 'false').lower() == 'true'
-    if use_cache and _data_cache.get('hall_ldrs'):
-        response = jsonify(_data_cache['hall_ldrs'])
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['X-Cache'] = 'HIT'
+    response = cached_json_response('hall_ldrs') if use_cache else None
+    if response is not None:
+        response.headers['Cache-Control'] = 'no-cache'
         return response
     
     try:
-        today_start_utc = get_today_brazil_start_utc()
-        today_start_ms = int(today_start_utc.timestamp() * 1000)
-        tomorrow_start_utc = today_start_utc + timedelta(days=1)
-        tomorrow_start_ms = int(tomorrow_start_utc.timestamp() * 1000)
+        today = get_brazil_window('today')
+        today_start_ms = int(today.start.timestamp() * 1000)
+        tomorrow_start_ms = int(today.end.timestamp() * 1000)
         
         hubspot_token = os.getenv('HUBSPOT_PRIVATE_APP_TOKEN')
         url = 'https://api.hubapi.com/crm/v3/objects/deals/search'
@@ -425,29 +413,26 @@ def hall_da_fama_ldrs_realtime():
         
         # Formata resposta e salva badges
         ranking = []
+        badge_entries = []
         for idx, (ldr_id, stats) in enumerate(top_ldrs, 1):
             timestamps = sorted(stats['timestamps'])
             badges = detect_badges(timestamps, stats['count'], stats['revenue'], 'LDR')
             user_name = get_analyst_name(ldr_id)
             
-            # Salva badges no banco de dados
-            for badge in badges:
-                try:
-                    save_badge_to_database(
-                        user_type='LDR',
-                        user_id=ldr_id,
-                        user_name=user_name,
-                        badge=badge,
-                        metric_value=stats['revenue'],
-                        context={
-                            'count': stats['count'],
-                            'revenue': stats['revenue'],
-                            'deals': stats['deals'],
-                            'timestamps': [t.isoformat() for t in timestamps]
-                        }
-                    )
-                except Exception as e:
-                    print(f"[AVISO] Erro ao salvar badge {badge['code']} para {user_name}: {e}")
+            # Badges enfileirados para gravação após o ranking
+            badge_entries.extend({
+                'user_type': 'LDR',
+                'user_id': ldr_id,
+                'user_name': user_name,
+                'badge': badge,
+                'metric_value': stats['revenue'],
+                'context': {
+                    'count': stats['count'],
+                    'revenue': stats['revenue'],
+                    'deals': stats['deals'],
+                    'timestamps': [t.isoformat() for t in timestamps]
+                }
+            } for badge in badges)
             
             ranking.append({
                 'position': idx,
@@ -460,6 +445,9 @@ def hall_da_fama_ldrs_realtime():
                 'lastDeal': timestamps[-1].strftime('%H:%M:%S') if timestamps else None
             })
         
+        # Badges são gravados em background (a resposta não espera o banco)
+        enqueue_badges(badge_entries)
+        
         result = {
             'status': 'success',
             'userType': 'LDR',
@@ -470,11 +458,10 @@ def hall_da_fama_ldrs_realtime():
         
         # Atualiza cache se não estava usando
         if not use_cache:
-            with _cache_lock:
-                _data_cache['hall_ldrs'] = result
+            set_cached('hall_ldrs', result)
         
         response = jsonify(result)
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Cache-Control'] = 'no-cache'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '0'
         response.headers['X-Cache'] = 'MISS'
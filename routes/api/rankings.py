@@ -4,9 +4,11 @@ API Routes para rankings (Top EVs, SDRs, LDRs)
 from flask import Blueprint, jsonify, request
 from datetime import datetime
 from utils.auth import require_auth
-from utils.db import get_db_connection_context
+from utils.db import read_query
 from utils.mappings import get_analyst_name
-from psycopg2.extras import RealDictCursor
+from utils.cache import cached_json_response, set_cached
+from utils.stages import get_revenue_stage_ids
+from utils.datetime_utils import get_brazil_window
 
 rankings_bp = Blueprint('rankings', __name__, url_prefix='/api')
 
@@ -14,202 +16,224 @@ rankings_bp = Blueprint('rankings', __name__, url_prefix='/api')
 @require_auth
 def get_top_evs_today():
     """Retorna o ranking dos Top 5 EVs por receita do dia atual"""
-    with get_db_connection_context() as conn:
-        if not conn:
+    use_cache = request.args.get('use_cache', 'false').lower() == 'true'
+    response = cached_json_response('top_evs_today') if use_cache else None
+    if response is not None:
+        return response
+    
+    try:
+        query = """
+            WITH base AS (
+                SELECT
+                    d.hs_object_id,
+                    d.dealname,
+                    d.hubspot_owner_id,
+                    d.analista_comercial,
+                    d.closedate,
+                    d.valor_ganho,
+                    d.tipo_de_receita,
+                    d.tipo_de_negociacao
+                FROM deals d
+                WHERE d.closedate >= %(today_start)s
+                    AND d.closedate < %(today_end)s
+                    AND d.dealstage = ANY(%(stage_ids)s)
+                    AND COALESCE(d.tipo_de_receita, '') <> 'Pontual'
+                    AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
+            ),
+            deals_hoje AS (
+                SELECT 
+                    COALESCE(analista_comercial, hubspot_owner_id) as owner_id,
+                    valor_ganho
+                FROM base
+                WHERE valor_ganho IS NOT NULL
+                AND valor_ganho > 0
+            )
+            SELECT 
+                owner_id,
+                COALESCE(SUM(valor_ganho), 0) as total_revenue,
+                COUNT(*) as deal_count
+            FROM deals_hoje
+            WHERE owner_id IS NOT NULL
+                AND owner_id <> ''
+            GROUP BY owner_id
+            ORDER BY total_revenue DESC
+            LIMIT 5
+        """
+        
+        today = get_brazil_window('today', naive=True)
+        results = read_query(query, {
+            'stage_ids': get_revenue_stage_ids(),
+            'today_start': today.start,
+            'today_end': today.end
+        })
+        if results is None:
             return jsonify({'error': 'Erro ao conectar ao banco de dados'}), 500
         
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            query = """
-                WITH base AS (
-                    SELECT
-                        d.hs_object_id,
-                        d.dealname,
-                        d.hubspot_owner_id,
-                        d.analista_comercial,
-                        d.closedate,
-                        d.valor_ganho,
-                        d.tipo_de_receita,
-                        d.tipo_de_negociacao,
-                        p.stage_label
-                    FROM deals d
-                    LEFT JOIN deal_stages_pipelines p ON d.dealstage = CAST(p.stage_id AS TEXT)
-                    WHERE COALESCE(d.tipo_de_receita, '') <> 'Pontual'
-                        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
-                ),
-                deals_hoje AS (
-                    SELECT 
-                        COALESCE(analista_comercial, hubspot_owner_id) as owner_id,
-                        valor_ganho
-                    FROM base
-                    WHERE (
-                        LOWER(stage_label) LIKE '%ganho%'
-                        OR LOWER(stage_label) LIKE '%faturamento%'
-                        OR LOWER(stage_label) LIKE '%aguardando%'
-                    )
-                    AND DATE(closedate - INTERVAL '3 hour') = DATE(CURRENT_TIMESTAMP AT TIME ZONE 'America/Sao_Paulo')
-                    AND valor_ganho IS NOT NULL
-                    AND valor_ganho > 0
-                )
-                SELECT 
-                    owner_id,
-                    COALESCE(SUM(valor_ganho), 0) as total_revenue,
-                    COUNT(*) as deal_count
-                FROM deals_hoje
-                WHERE owner_id IS NOT NULL
-                    AND owner_id <> ''
-                GROUP BY owner_id
-                ORDER BY total_revenue DESC
-                LIMIT 5
-            """
-            
-            cursor.execute(query)
-            results = cursor.fetchall()
-            
-            print(f"\n[DEBUG] Ranking EVs Hoje:")
-            print(f"   Data atual no banco: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"   EVs encontrados: {len(results)}")
-            
-            ranking = []
-            for idx, row in enumerate(results):
-                owner_id = row['owner_id']
-                owner_name = get_analyst_name(owner_id)
-                
-                print(f"   {idx+1}o {owner_name}: R$ {row['total_revenue']:.2f} ({row['deal_count']} deals)")
-                
-                ranking.append({
-                    'position': idx + 1,
-                    'ownerId': owner_id,
-                    'ownerName': owner_name,
-                    'revenue': float(row['total_revenue']),
-                    'dealCount': row['deal_count']
-                })
-            
-            print(f"   [TOTAL] Total geral: R$ {sum([r['revenue'] for r in ranking]):.2f}\n")
-            
-            cursor.close()
-            
-            return jsonify({
-                'status': 'success',
-                'data': ranking,
-                'timestamp': datetime.now().isoformat()
+        print(f"\n[DEBUG] Ranking EVs Hoje:")
+        print(f"   Data atual no banco: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"   EVs encontrados: {len(results)}")
+        
+        ranking = []
+        for idx, row in enumerate(results):
+            owner_id = row['owner_id']
+            owner_name = get_analyst_name(owner_id)
+            
+            print(f"   {idx+1}o {owner_name}: R$ {row['total_revenue']:.2f} ({row['deal_count']} deals)")
+            
+            ranking.append({
+                'position': idx + 1,
+                'ownerId': owner_id,
+                'ownerName': owner_name,
+                'revenue': float(row['total_revenue']),
+                'dealCount': row['deal_count']
             })
-            
-        except Exception as e:
-            print(f"Erro ao buscar ranking de EVs: {e}")
-            return jsonify({'error': str(e)}), 500
+        
+        print(f"   [TOTAL] Total geral: R$ {sum([r['revenue'] for r in ranking]):.2f}\n")
+        
+        result = {
+            'status': 'success',
+            'data': ranking,
+            'timestamp': datetime.now().isoformat()
+        }
+        if not use_cache:
+            set_cached('top_evs_today', result)
+        
+        response = jsonify(result)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+        
+    except Exception as e:
+        print(f"Erro ao buscar ranking de EVs: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @rankings_bp.route('/top-sdrs-today', methods=['GET'])
 @require_auth
 def get_top_sdrs_today():
     """Retorna o ranking dos Top 5 SDRs por agendamentos feitos hoje"""
-    with get_db_connection_context() as conn:
-        if not conn:
+    pipeline_filter = request.args.get('pipeline')
+    cache_key = {
+        '6810518': 'top_sdrs_today_new',
+        '4007305': 'top_sdrs_today_expansao'
+    }.get(pipeline_filter)
+    
+    use_cache = request.args.get('use_cache', 'false').lower() == 'true'
+    response = cached_json_response(cache_key) if use_cache and cache_key else None
+    if response is not None:
+        return response
+    
+    try:
+        query = """
+            SELECT 
+                TRIM(pr_vendedor) as sdr_id,
+                COUNT(*) as scheduled_count,
+                MAX(data_de_agendamento) as last_scheduled_time
+            FROM deals
+            WHERE data_de_agendamento >= %(today_start)s
+                AND data_de_agendamento < %(today_end)s
+                AND pr_vendedor IS NOT NULL
+                AND TRIM(pr_vendedor) <> ''
+        """
+        
+        today = get_brazil_window('today', naive=True)
+        params = {'today_start': today.start, 'today_end': today.end}
+        if pipeline_filter:
+            query += " AND pipeline = %(pipeline)s"
+            params['pipeline'] = pipeline_filter
+        
+        query += """
+            GROUP BY TRIM(pr_vendedor)
+            ORDER BY 
+                scheduled_count DESC,
+                last_scheduled_time ASC
+            LIMIT 5
+        """
+        
+        results = read_query(query, params)
+        if results is None:
             return jsonify({'error': 'Erro ao conectar ao banco de dados'}), 500
         
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            pipeline_filter = request.args.get('pipeline')
-            
-            query = """
-                SELECT 
-                    TRIM(pr_vendedor) as sdr_id,
-                    COUNT(*) as scheduled_count,
-                    MAX(data_de_agendamento) as last_scheduled_time
-                FROM deals
-                WHERE DATE(data_de_agendamento) = CURRENT_DATE
-                    AND pr_vendedor IS NOT NULL
-                    AND TRIM(pr_vendedor) <> ''
-            """
-            
-            if pipeline_filter:
-                query += f" AND pipeline = '{pipeline_filter}'"
-            
-            query += """
-                GROUP BY TRIM(pr_vendedor)
-                ORDER BY 
-                    scheduled_count DESC,
-                    last_scheduled_time ASC
-                LIMIT 5
-            """
-            
-            cursor.execute(query)
-            results = cursor.fetchall()
-            
-            ranking = []
-            for idx, row in enumerate(results):
-                sdr_id = row['sdr_id']
-                sdr_name = get_analyst_name(sdr_id)
-                
-                ranking.append({
-                    'position': idx + 1,
-                    'sdrId': sdr_id,
-                    'sdrName': sdr_name,
-                    'scheduledCount': row['scheduled_count']
-                })
-            
-            cursor.close()
-            
-            return jsonify({
-                'status': 'success',
-                'data': ranking,
-                'timestamp': datetime.now().isoformat()
+        ranking = []
+        for idx, row in enumerate(results):
+            sdr_id = row['sdr_id']
+            sdr_name = get_analyst_name(sdr_id)
+            
+            ranking.append({
+                'position': idx + 1,
+                'sdrId': sdr_id,
+                'sdrName': sdr_name,
+                'scheduledCount': row['scheduled_count']
             })
-            
-        except Exception as e:
-            print(f"Erro ao buscar ranking de SDRs: {e}")
-            return jsonify({'error': str(e)}), 500
+        
+        result = {
+            'status': 'success',
+            'data': ranking,
+            'timestamp': datetime.now().isoformat()
+        }
+        if not use_cache and cache_key:
+            set_cached(cache_key, result)
+        
+        response = jsonify(result)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+        
+    except Exception as e:
+        print(f"Erro ao buscar ranking de SDRs: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @rankings_bp.route('/top-ldrs-today', methods=['GET'])
 @require_auth
 def get_top_ldrs_today():
     """Retorna o ranking dos Top 5 LDRs por deals ganhos hoje"""
-    with get_db_connection_context() as conn:
-        if not conn:
+    use_cache = request.args.get('use_cache', 'false').lower() == 'true'
+    response = cached_json_response('top_ldrs_today') if use_cache else None
+    if response is not None:
+        return response
+    
+    try:
+        query = """
+            SELECT 
+                ldr_name,
+                COUNT(*) as won_deals_count,
+                COALESCE(SUM(amount), 0) as total_revenue
+            FROM deal_notifications
+            WHERE created_at >= %(today_start)s
+                AND created_at < %(today_end)s
+                AND ldr_name IS NOT NULL
+                AND ldr_name <> ''
+            GROUP BY ldr_name
+            ORDER BY won_deals_count DESC
+            LIMIT 5
+        """
+        
+        today = get_brazil_window('today')
+        results = read_query(query, {'today_start': today.start, 'today_end': today.end})
+        if results is None:
             return jsonify({'error': 'Erro ao conectar ao banco de dados'}), 500
         
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            query = """
-                SELECT 
-                    ldr_name,
-                    COUNT(*) as won_deals_count,
-                    COALESCE(SUM(amount), 0) as total_revenue
-                FROM deal_notifications
-                WHERE DATE(created_at) = CURRENT_DATE
-                    AND ldr_name IS NOT NULL
-                    AND ldr_name <> ''
-                GROUP BY ldr_name
-                ORDER BY won_deals_count DESC
-                LIMIT 5
-            """
-            
-            cursor.execute(query)
-            results = cursor.fetchall()
-            
-            ranking = []
-            for idx, row in enumerate(results):
-                ldr_name = row['ldr_name']
-                
-                ranking.append({
-                    'position': idx + 1,
-                    'ldrName': ldr_name,
-                    'wonDealsCount': row['won_deals_count'],
-                    'totalRevenue': float(row['total_revenue'])
-                })
-            
-            cursor.close()
-            
-            return jsonify({
-                'status': 'success',
-                'data': ranking,
-                'timestamp': datetime.now().isoformat()
+        ranking = []
+        for idx, row in enumerate(results):
+            ldr_name = row['ldr_name']
+            
+            ranking.append({
+                'position': idx + 1,
+                'ldrName': ldr_name,
+                'wonDealsCount': row['won_deals_count'],
+                'totalRevenue': float(row['total_revenue'])
             })
-            
-        except Exception as e:
-            print(f"Erro ao buscar ranking de LDRs: {e}")
-            return jsonify({'error': str(e)}), 500
+        
+        result = {
+            'status': 'success',
+            'data': ranking,
+            'timestamp': datetime.now().isoformat()
+        }
+        if not use_cache:
+            set_cached('top_ldrs_today', result)
+        
+        response = jsonify(result)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+        
+    except Exception as e:
+        print(f"Erro ao buscar ranking de LDRs: {e}")
+        return jsonify({'error': str(e)}), 500
 
@@ -10,8 +10,13 @@ from utils.revenue import (
     get_revenue_until_yesterday,
     get_today_revenue,
     get_renewal_pipeline_revenue,
+    get_revenue_series,
+    parse_revenue_month,
     load_manual_revenue_config
 )
+from utils.datetime_utils import get_today_brazil
+from utils.config_store import get_config, save_config
+from utils.cache import cached_json_response, set_cached
 
 revenue_bp = Blueprint('revenue', __name__, url_prefix='/api/revenue')
 
@@ -22,12 +27,21 @@ def api_revenue():
     # Verifica se é para pegar dados de dezembro (Natal), novembro (Black November) ou mês atual
     month = request.args.get('month', 'november').lower()
     
-    # TODO: Implementar cache quando mover para módulo separado
+    if month == 'december' or month == 'dezembro':
+        cache_key = 'revenue_december'
+    elif month == 'current' or month == 'atual' or month == 'current-month':
+        cache_key = 'revenue_current'
+    else:
+        cache_key = 'revenue'
+    
+    use_cache = request.args.get('use_cache', 'false').lower() == 'true'
+    response = cached_json_response(cache_key) if use_cache else None
+    if response is not None:
+        return response
+    
     if month == 'december' or month == 'dezembro':
         data = get_december_revenue()
     elif month == 'current' or month == 'atual' or month == 'current-month':
-        # Carrega configuração antes de buscar dados
-        config = load_manual_revenue_config()
         # SEMPRE exclui o pipeline de renovação da query base para evitar duplicação
         # O valor do pipeline de renovação será adicionado separadamente se habilitado
         data = get_current_month_revenue(exclude_renewal_pipeline=True)
@@ -44,28 +58,35 @@ def api_revenue():
         else:
             data['has_manual_adjustment'] = False
         
-        # Adiciona receita do pipeline de Renovação se habilitado
-        # (só adiciona se não foi excluído na query)
+        # Adiciona receita do pipeline de Renovação (mês atual) se habilitado
         if config.get('includeRenewalPipeline', False):
-            renewal_revenue = get_renewal_pipeline_revenue()
+            renewal_revenue = get_renewal_pipeline_revenue('month')
             data['total'] = data['total'] + renewal_revenue
             data['has_renewal_pipeline'] = True
             data['renewal_pipeline_revenue'] = renewal_revenue
         else:
             data['has_renewal_pipeline'] = False
         
-        return jsonify(data)
+        if not use_cache:
+            set_cached(cache_key, data)
+        
+        response = jsonify(data)
+        response.headers['X-Cache'] = 'MISS'
+        return response
     else:
         return jsonify({'error': 'Erro ao buscar dados'}), 500
 
 @revenue_bp.route('/today')
 def api_revenue_today():
     """API que retorna faturamento do dia atual"""
-    # Carrega configuração antes de buscar dados para saber se deve excluir renovação
-    config = load_manual_revenue_config()
-    # Se includeRenewalPipeline está desativado, exclui o pipeline de renovação da query
-    exclude_renewal = not config.get('includeRenewalPipeline', False)
-    data = get_today_revenue(exclude_renewal_pipeline=exclude_renewal)
+    use_cache = request.args.get('use_cache', 'false').lower() == 'true'
+    response = cached_json_response('revenue_today') if use_cache else None
+    if response is not None:
+        return response
+    
+    # SEMPRE exclui o pipeline de renovação da query base para evitar duplicação
+    # O valor do pipeline de renovação será adicionado separadamente se habilitado
+    data = get_today_revenue(exclude_renewal_pipeline=True)
     
     if data:
         config = load_manual_revenue_config()
@@ -78,25 +99,21 @@ def api_revenue_today():
             data['has_manual_adjustment'] = False
         
         # Adiciona receita do pipeline de Renovação se habilitado
-        # (só adiciona se não foi excluído na query)
+        # (a query base sempre exclui o pipeline, então não há duplicação)
         if config.get('includeRenewalPipeline', False):
-            # Busca apenas deals de hoje do pipeline de renovação
-            from datetime import datetime, timezone, timedelta
-            BRAZIL_TZ_OFFSET = timedelta(hours=-3)
-            now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-            today_start_brazil = now_brazil.replace(hour=0, minute=0, second=0, microsecond=0)
-            today_end_brazil = now_brazil.replace(hour=23, minute=59, second=59, microsecond=999999)
-            today_start_utc = today_start_brazil - BRAZIL_TZ_OFFSET
-            today_end_utc = today_end_brazil - BRAZIL_TZ_OFFSET
-            
-            renewal_revenue_today = get_renewal_pipeline_revenue(start_date_utc=today_start_utc, end_date_utc=today_end_utc)
+            renewal_revenue_today = get_renewal_pipeline_revenue('today')
             data['total_today'] = data['total_today'] + renewal_revenue_today
             data['has_renewal_pipeline'] = True
             data['renewal_pipeline_revenue_today'] = renewal_revenue_today
         else:
             data['has_renewal_pipeline'] = False
         
-        return jsonify(data)
+        if not use_cache:
+            set_cached('revenue_today', data)
+        
+        response = jsonify(data)
+        response.headers['X-Cache'] = 'MISS'
+        return response
     else:
         return jsonify({'error': 'Erro ao buscar dados do dia'}), 500
 
@@ -104,28 +121,17 @@ def api_revenue_today():
 @require_auth
 def api_revenue_until_yesterday():
     """API que retorna faturamento até ontem (excluindo o dia atual)"""
-    # Carrega configuração antes de buscar dados para saber se deve excluir renovação
-    config = load_manual_revenue_config()
-    # Se includeRenewalPipeline está desativado, exclui o pipeline de renovação da query
-    exclude_renewal = not config.get('includeRenewalPipeline', False)
-    data = get_revenue_until_yesterday(exclude_renewal_pipeline=exclude_renewal)
+    # SEMPRE exclui o pipeline de renovação da query base para evitar duplicação
+    # O valor do pipeline de renovação será adicionado separadamente se habilitado
+    data = get_revenue_until_yesterday(exclude_renewal_pipeline=True)
     
     if data:
         config = load_manual_revenue_config()
         
         # Adiciona receita do pipeline de Renovação se habilitado
-        # (só adiciona se não foi excluído na query)
+        # (a query base sempre exclui o pipeline, então não há duplicação)
         if config.get('includeRenewalPipeline', False):
-            # Busca apenas deals até ontem do pipeline de renovação
-            from datetime import datetime, timezone, timedelta
-            BRAZIL_TZ_OFFSET = timedelta(hours=-3)
-            now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-            month_start_brazil = now_brazil.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            yesterday_end_brazil = now_brazil.replace(hour=23, minute=59, second=59, microsecond=999999) - timedelta(days=1)
-            month_start_utc = month_start_brazil - BRAZIL_TZ_OFFSET
-            yesterday_end_utc = yesterday_end_brazil - BRAZIL_TZ_OFFSET
-            
-            renewal_revenue_until_yesterday = get_renewal_pipeline_revenue(start_date_utc=month_start_utc, end_date_utc=yesterday_end_utc)
+            renewal_revenue_until_yesterday = get_renewal_pipeline_revenue('until_yesterday')
             data['total'] = data['total'] + renewal_revenue_until_yesterday
             data['has_renewal_pipeline'] = True
             data['renewal_pipeline_revenue'] = renewal_revenue_until_yesterday
@@ -136,37 +142,58 @@ def api_revenue_until_yesterday():
     else:
         return jsonify({'error': 'Erro ao buscar dados até ontem'}), 500
 
+@revenue_bp.route('/series')
+@require_auth
+def api_revenue_series():
+    """
+    API que retorna a receita acumulada por dia do mês (gráficos burn-up)
+    
+    Query params:
+        month: 'current' (padrão), 'november', 'december' ou 'AAAA-MM'
+        byPipeline: 'true' para incluir a série de cada pipeline
+    """
+    month_start = parse_revenue_month(request.args.get('month'))
+    if month_start is None:
+        return jsonify({'error': 'Mês inválido. Use current, november, december ou AAAA-MM'}), 400
+    by_pipeline = request.args.get('byPipeline', 'false').lower() == 'true'
+    
+    # Apenas o mês atual fica registrado no cache (atualizado a cada deal ganho)
+    cache_key = None
+    if month_start == get_today_brazil().replace(day=1):
+        cache_key = 'revenue_series_pipelines' if by_pipeline else 'revenue_series'
+    
+    use_cache = request.args.get('use_cache', 'false').lower() == 'true'
+    response = cached_json_response(cache_key) if use_cache and cache_key else None
+    if response is not None:
+        return response
+    
+    # Mesma regra de /api/revenue?month=current: Renovação só entra se habilitada
+    config = load_manual_revenue_config()
+    data = get_revenue_series(
+        month_start,
+        by_pipeline=by_pipeline,
+        include_renewal_pipeline=config.get('includeRenewalPipeline', False)
+    )
+    
+    if data:
+        if not use_cache and cache_key:
+            set_cached(cache_key, data)
+        
+        response = jsonify(data)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    else:
+        return jsonify({'error': 'Erro ao buscar série de receita'}), 500
+
 @revenue_bp.route('/manual-revenue/config', methods=['GET'])
 def get_manual_revenue_config():
     """Retorna a configuração do modo manual de faturamento"""
-    import os
-    import json
-    
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    MANUAL_REVENUE_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'manual_revenue_config.json')
-    
-    try:
-        if os.path.exists(MANUAL_REVENUE_CONFIG_FILE):
-            with open(MANUAL_REVENUE_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            return jsonify(config)
-        else:
-            default_config = {"enabled": False, "additionalValue": 0, "includeRenewalPipeline": False}
-            return jsonify(default_config)
-    except Exception as e:
-        print(f"Erro ao ler configuração de faturamento manual: {e}")
-        return jsonify({'error': 'Erro ao ler configuração'}), 500
+    return jsonify(get_config('manual_revenue'))
 
 @revenue_bp.route('/manual-revenue/config', methods=['POST'])
 @require_auth
 def save_manual_revenue_config():
     """Salva a configuração do modo manual de faturamento"""
-    import os
-    import json
-    
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    MANUAL_REVENUE_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'manual_revenue_config.json')
-    
     try:
         data = request.json
         if data is None:
@@ -185,17 +212,8 @@ def save_manual_revenue_config():
             "includeRenewalPipeline": include_renewal_pipeline
         }
         
-        data_dir = os.path.dirname(MANUAL_REVENUE_CONFIG_FILE)
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir, mode=0o777, exist_ok=True)
-        
-        with open(MANUAL_REVENUE_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        
-        try:
-            os.chmod(MANUAL_REVENUE_CONFIG_FILE, 0o666)
-        except Exception as chmod_error:
-            print(f"Aviso: Não foi possível alterar permissões do arquivo: {chmod_error}")
+        # Recarrega a configuração em memória e recalcula as chaves de receita
+        save_config('manual_revenue', config)
         
         print(f"Configuração de faturamento manual salva: enabled={enabled}, additionalValue={additional_value}, includeRenewalPipeline={include_renewal_pipeline}")
         return jsonify({'status': 'success', 'config': config})
@@ -212,34 +230,12 @@ def save_manual_revenue_config():
 @revenue_bp.route('/manual-goal/config', methods=['GET'])
 def get_manual_goal_config():
     """Retorna a configuração da meta manual"""
-    import os
-    import json
-    
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    MANUAL_GOAL_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'manual_goal_config.json')
-    
-    try:
-        if os.path.exists(MANUAL_GOAL_CONFIG_FILE):
-            with open(MANUAL_GOAL_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            return jsonify(config)
-        else:
-            default_config = {"enabled": False, "goalValue": 1500000}
-            return jsonify(default_config)
-    except Exception as e:
-        print(f"Erro ao ler configuração de meta manual: {e}")
-        return jsonify({'error': 'Erro ao ler configuração'}), 500
+    return jsonify(get_config('manual_goal'))
 
 @revenue_bp.route('/manual-goal/config', methods=['POST'])
 @require_auth
 def save_manual_goal_config():
     """Salva a configuração da meta manual"""
-    import os
-    import json
-    
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    MANUAL_GOAL_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'manual_goal_config.json')
-    
     try:
         data = request.json
         if data is None:
@@ -256,17 +252,7 @@ def save_manual_goal_config():
             "goalValue": goal_value
         }
         
-        data_dir = os.path.dirname(MANUAL_GOAL_CONFIG_FILE)
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir, mode=0o777, exist_ok=True)
-        
-        with open(MANUAL_GOAL_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        
-        try:
-            os.chmod(MANUAL_GOAL_CONFIG_FILE, 0o666)
-        except Exception as chmod_error:
-            print(f"Aviso: Não foi possível alterar permissões do arquivo: {chmod_error}")
+        save_config('manual_goal', config)
         
         print(f"Configuração de meta manual salva: enabled={enabled}, goalValue={goal_value}")
         return jsonify({'status': 'success', 'config': config})
@@ -283,34 +269,12 @@ def save_manual_goal_config():
 @revenue_bp.route('/celebration-theme/config', methods=['GET'])
 def get_celebration_theme_config():
     """Retorna a configuração do tema de celebração"""
-    import os
-    import json
-    
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    THEME_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'celebration_theme_config.json')
-    
-    try:
-        if os.path.exists(THEME_CONFIG_FILE):
-            with open(THEME_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            return jsonify(config)
-        else:
-            default_config = {"theme": "black-november"}
-            return jsonify(default_config)
-    except Exception as e:
-        print(f"Erro ao ler configuração de tema de celebração: {e}")
-        return jsonify({'error': 'Erro ao ler configuração'}), 500
+    return jsonify(get_config('celebration_theme'))
 
 @revenue_bp.route('/celebration-theme/config', methods=['POST'])
 @require_auth
 def save_celebration_theme_config():
     """Salva a configuração do tema de celebração"""
-    import os
-    import json
-    
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    THEME_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'celebration_theme_config.json')
-    
     try:
         data = request.json
         if data is None:
@@ -327,17 +291,7 @@ def save_celebration_theme_config():
             "theme": theme
         }
         
-        data_dir = os.path.dirname(THEME_CONFIG_FILE)
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir, mode=0o777, exist_ok=True)
-        
-        with open(THEME_CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=4, ensure_ascii=False)
-        
-        try:
-            os.chmod(THEME_CONFIG_FILE, 0o666)
-        except Exception as chmod_error:
-            print(f"Aviso: Não foi possível alterar permissões do arquivo: {chmod_error}")
+        save_config('celebration_theme', config)
         
         print(f"Configuração de tema de celebração salva: theme={theme}")
         return jsonify({'status': 'success', 'config': config})
@@ -350,4 +304,3 @@ def save_celebration_theme_config():
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Erro ao salvar configuração: {str(e)}'}), 500
-
@@ -2,25 +2,13 @@
 API Routes para gerenciamento de temas
 """
 from flask import Blueprint, jsonify
-import os
-import json
+from utils.config_store import get_config
 
 themes_bp = Blueprint('themes', __name__, url_prefix='/api/themes')
 
 def load_themes_config():
-    """Carrega configuração de temas do arquivo JSON"""
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    THEMES_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'themes_config.json')
-    
-    try:
-        if os.path.exists(THEMES_CONFIG_FILE):
-            with open(THEMES_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            return {'themes': {}, 'default_theme': 'natal'}
-    except Exception as e:
-        print(f"Erro ao carregar configuração de temas: {e}")
-        return {'themes': {}, 'default_theme': 'natal'}
+    """Retorna a configuração de temas (ver utils.config_store)"""
+    return get_config('themes')
 
 @themes_bp.route('/config')
 def get_themes_config():
@@ -7,7 +7,8 @@ import os
 import json
 from utils.mappings import get_analyst_name, normalize_product_name
 from utils.whatsapp import send_whatsapp_notification
-from utils.deals import insert_notification_db
+from utils.deals import insert_notification_db, insert_notifications_bulk
+from utils.cache_manager import notify_cache_event
 
 webhooks_bp = Blueprint('webhooks', __name__, url_prefix='/api/webhook')
 
@@ -17,6 +18,72 @@ webhook_logs = []
 # Lista de notificações em memória (fallback se banco falhar)
 deal_notifications = []
 
+def _is_valid_webhook_token():
+    """Confere o X-HubSpot-Token quando HUBSPOT_WEBHOOK_SECRET está definido"""
+    webhook_secret = os.getenv('HUBSPOT_WEBHOOK_SECRET')
+    if not webhook_secret:
+        return True
+    token = request.headers.get('X-HubSpot-Token')
+    if token != webhook_secret:
+        print(f"Token inválido recebido: {token}")
+        return False
+    return True
+
+def build_notification(data):
+    """
+    Monta a notificação de deal ganho a partir do payload do webhook do HubSpot.
+    
+    Returns:
+        dict da notificação, ou None se o payload não tiver o ID do deal
+    """
+    # Extrai campos do payload
+    deal_id = data.get('dealId') or data.get('deal_id') or data.get('hs_object_id')
+    deal_name = data.get('dealName') or data.get('deal_name') or data.get('dealname', 'Deal sem nome')
+    amount = data.get('amount') or data.get('valor_ganho') or data.get('valor_ganho', 0)
+    
+    # Converte IDs para nomes
+    owner_id = data.get('ownerName') or data.get('owner_name') or data.get('analista_comercial', '')
+    owner_name = get_analyst_name(owner_id)
+    
+    sdr_id = data.get('sdrName') or data.get('sdr_name') or data.get('pr_vendedor', '')
+    sdr_name = get_analyst_name(sdr_id)
+    
+    ldr_id = data.get('ldrName') or data.get('ldr_name') or data.get('criado_por_', '')
+    ldr_name = get_analyst_name(ldr_id)
+    
+    company_name = data.get('companyName') or data.get('company_name') or data.get('associated_company_name', '')
+    product_name_raw = data.get('produto_principal') or data.get('productName') or ''
+    product_name = normalize_product_name(product_name_raw) if product_name_raw else ''
+    
+    closed_date = data.get('closedDate') or data.get('closed_date') or data.get('closedate', '')
+    pipeline = data.get('pipeline', '')
+    deal_stage = data.get('dealStage') or data.get('deal_stage') or data.get('dealstage', '')
+    
+    # Valida campos obrigatórios
+    if not deal_id:
+        return None
+    
+    try:
+        amount = float(amount) if amount else 0.0
+    except (ValueError, TypeError):
+        amount = 0.0
+    
+    return {
+        'id': str(deal_id),
+        'dealName': deal_name,
+        'amount': amount,
+        'ownerName': owner_name,
+        'sdrName': sdr_name,
+        'ldrName': ldr_name,
+        'companyName': company_name,
+        'productName': product_name,
+        'closedDate': closed_date,
+        'pipeline': pipeline,
+        'dealStage': deal_stage,
+        'timestamp': datetime.now().isoformat(),
+        'viewed_by': []
+    }
+
 @webhooks_bp.route('/deal-won', methods=['POST'])
 def webhook_deal_won():
     """
@@ -25,12 +92,8 @@ def webhook_deal_won():
     """
     try:
         # Verifica autenticação (opcional mas recomendado)
-        webhook_secret = os.getenv('HUBSPOT_WEBHOOK_SECRET')
-        if webhook_secret:
-            token = request.headers.get('X-HubSpot-Token')
-            if token != webhook_secret:
-                print(f"Token inválido recebido: {token}")
-                return jsonify({'error': 'Token inválido'}), 401
+        if not _is_valid_webhook_token():
+            return jsonify({'error': 'Token inválido'}), 401
         
         # Obtém dados do payload
         data = request.json
@@ -52,54 +115,13 @@ def webhook_deal_won():
         if len(webhook_logs) > 50:
             webhook_logs.pop(0)
         
-        # Extrai campos do payload
-        deal_id = data.get('dealId') or data.get('deal_id') or data.get('hs_object_id')
-        deal_name = data.get('dealName') or data.get('deal_name') or data.get('dealname', 'Deal sem nome')
-        amount = data.get('amount') or data.get('valor_ganho') or data.get('valor_ganho', 0)
-        
-        # Converte IDs para nomes
-        owner_id = data.get('ownerName') or data.get('owner_name') or data.get('analista_comercial', '')
-        owner_name = get_analyst_name(owner_id)
-        
-        sdr_id = data.get('sdrName') or data.get('sdr_name') or data.get('pr_vendedor', '')
-        sdr_name = get_analyst_name(sdr_id)
-        
-        ldr_id = data.get('ldrName') or data.get('ldr_name') or data.get('criado_por_', '')
-        ldr_name = get_analyst_name(ldr_id)
-        
-        company_name = data.get('companyName') or data.get('company_name') or data.get('associated_company_name', '')
-        product_name_raw = data.get('produto_principal') or data.get('productName') or ''
-        product_name = normalize_product_name(product_name_raw) if product_name_raw else ''
-        
-        closed_date = data.get('closedDate') or data.get('closed_date') or data.get('closedate', '')
-        pipeline = data.get('pipeline', '')
-        deal_stage = data.get('dealStage') or data.get('deal_stage') or data.get('dealstage', '')
-        
-        # Valida campos obrigatórios
-        if not deal_id:
-            return jsonify({'error': 'dealId é obrigatório'}), 400
-        
-        try:
-            amount = float(amount) if amount else 0.0
-        except (ValueError, TypeError):
-            amount = 0.0
-        
         # Cria notificação
-        notification = {
-            'id': str(deal_id),
-            'dealName': deal_name,
-            'amount': amount,
-            'ownerName': owner_name,
-            'sdrName': sdr_name,
-            'ldrName': ldr_name,
-            'companyName': company_name,
-            'productName': product_name,
-            'closedDate': closed_date,
-            'pipeline': pipeline,
-            'dealStage': deal_stage,
-            'timestamp': datetime.now().isoformat(),
-            'viewed_by': []
-        }
+        notification = build_notification(data)
+        if notification is None:
+            return jsonify({'error': 'dealId é obrigatório'}), 400
+        deal_id = notification['id']
+        deal_name = notification['dealName']
+        amount = notification['amount']
         
         # Tenta persistir no banco; se falhar, usa memória como fallback
         insert_result = insert_notification_db(notification)
@@ -114,15 +136,7 @@ def webhook_deal_won():
             }), 200
         
         if not insert_result:
-            # Adiciona à lista de notificações em memória se falhou inserir no banco
-            deal_notifications.append(notification)
-            # Limita a lista a 100 notificações (evita crescimento infinito)
-            if len(deal_notifications) > 100:
-                deal_notifications.pop(0)
-        
-        # Verifica se já existe na memória (evita duplicação mesmo sem banco)
-        if insert_result != 'inserted':
-            # Verifica se já está na lista de memória
+            # Verifica se já existe na memória (evita duplicação mesmo sem banco)
             already_in_memory = any(n.get('id') == deal_id for n in deal_notifications)
             if already_in_memory:
                 print(f"⚠️ Deal {deal_id} já está na lista de memória. Ignorando duplicado.")
@@ -131,9 +145,18 @@ def webhook_deal_won():
                     'message': 'Deal já processado anteriormente (duplicado ignorado)',
                     'dealId': deal_id
                 }), 200
+            
+            # Adiciona à lista de notificações em memória se falhou inserir no banco
+            deal_notifications.append(notification)
+            # Limita a lista a 100 notificações (evita crescimento infinito)
+            if len(deal_notifications) > 100:
+                deal_notifications.pop(0)
         
         print(f"Notificação adicionada: Deal {deal_id} - {deal_name} - R$ {amount:,.2f}")
         
+        # Recalcula receita, rankings e hall da fama para acompanhar a celebração
+        notify_cache_event('deal_won')
+        
         # 📱 Envia notificação WhatsApp para o grupo RevOps (apenas se for uma nova notificação)
         send_whatsapp_notification(notification)
         
@@ -152,6 +175,60 @@ def webhook_deal_won():
             'message': f'Erro ao processar webhook: {str(e)}'
         }), 500
 
+@webhooks_bp.route('/deal-won/replay', methods=['POST'])
+def webhook_deal_won_replay():
+    """
+    Reprocessa webhooks de deals ganhos perdidos (ex.: instância fora do ar).
+    
+    Recebe uma lista de payloads no formato do /deal-won (ou {"deals": [...]})
+    e insere todas as notificações em um único INSERT; deals já registrados são
+    ignorados. Não envia WhatsApp: os deals reprocessados já são antigos.
+    """
+    try:
+        if not _is_valid_webhook_token():
+            return jsonify({'error': 'Token inválido'}), 401
+        
+        data = request.get_json(silent=True)
+        payloads = data.get('deals') if isinstance(data, dict) else data
+        if not isinstance(payloads, list) or not payloads:
+            return jsonify({'error': 'Envie uma lista de payloads de deals'}), 400
+        
+        notifications = []
+        invalid = 0
+        for payload in payloads:
+            notification = build_notification(payload) if isinstance(payload, dict) else None
+            if notification is None:
+                invalid += 1
+            else:
+                notifications.append(notification)
+        
+        result = insert_notifications_bulk(notifications)
+        if result is None:
+            return jsonify({
+                'status': 'error',
+                'message': 'Erro ao conectar ao banco de dados'
+            }), 500
+        
+        if result['inserted']:
+            notify_cache_event('deal_won')
+        print(f"[OK] Replay de webhooks: {len(result['inserted'])} inseridos, {len(result['duplicates'])} duplicados, {invalid} invalidos")
+        
+        return jsonify({
+            'status': 'success',
+            'inserted': result['inserted'],
+            'duplicates': result['duplicates'],
+            'invalid': invalid
+        }), 200
+        
+    except Exception as e:
+        print(f"Erro ao reprocessar webhooks: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            'status': 'error',
+            'message': f'Erro ao reprocessar webhooks: {str(e)}'
+        }), 500
+
 @webhooks_bp.route('/logs', methods=['GET'])
 def get_webhook_logs():
     """Retorna logs de webhooks recebidos"""
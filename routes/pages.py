@@ -3,24 +3,13 @@ Rotas de páginas (templates HTML)
 """
 from flask import Blueprint, render_template, abort
 from utils.auth import require_auth
-import os
-import json
+from utils.config_store import get_config
 
 pages_bp = Blueprint('pages', __name__)
 
 def load_themes_config():
-    """Carrega configuração de temas"""
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    THEMES_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'themes_config.json')
-    
-    try:
-        if os.path.exists(THEMES_CONFIG_FILE):
-            with open(THEMES_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {'themes': {}, 'default_theme': 'natal'}
-    except Exception as e:
-        print(f"Erro ao carregar temas: {e}")
-        return {'themes': {}, 'default_theme': 'natal'}
+    """Retorna a configuração de temas (ver utils.config_store)"""
+    return get_config('themes')
 
 @pages_bp.route('/')
 @require_auth
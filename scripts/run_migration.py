@@ -29,5 +29,11 @@ def run_migration(sql_path: str):
 
 
 if __name__ == '__main__':
-    sql_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations', '001_create_deal_notifications.sql')
+    import sys
+
+    # Uso: python scripts/run_migration.py [migrations/NNN_nome.sql]
+    if len(sys.argv) > 1:
+        sql_file = sys.argv[1]
+    else:
+        sql_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations', '001_create_deal_notifications.sql')
     run_migration(sql_file)
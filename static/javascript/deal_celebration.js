@@ -772,8 +772,16 @@ function markDealAsViewed(dealId) {
 async function checkForNewDeals() {
     try {
         // Adiciona o timestamp de referência na query para filtrar no backend
-        const url = `/api/deals/pending?client_id=${encodeURIComponent(CLIENT_ID)}&since=${encodeURIComponent(SYSTEM_START_TIMESTAMP)}`;
+        let url = `/api/deals/pending?client_id=${encodeURIComponent(CLIENT_ID)}&since=${encodeURIComponent(SYSTEM_START_TIMESTAMP)}`;
+        // No primeiro poll após carregar a página o backend marca as notificações
+        // anteriores como vistas por este painel (relógio do servidor)
+        if (!pendingSessionStarted) {
+            url += '&session_start=1';
+        }
         const response = await fetch(url);
+        if (response.ok) {
+            pendingSessionStarted = true;
+        }
         const data = await response.json();
         
         if (data.notifications && data.notifications.length > 0) {
@@ -808,6 +816,11 @@ async function checkForNewDeals() {
  */
 let SYSTEM_START_TIMESTAMP = null;
 
+/**
+ * Indica se o backend já registrou o início desta sessão do painel
+ */
+let pendingSessionStarted = false;
+
 /**
  * Inicializa o timestamp de referência para filtrar notificações
  * SEMPRE usa o timestamp do momento do carregamento da página
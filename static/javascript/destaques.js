@@ -77,45 +77,44 @@ async function loadAllData() {
         const isRandomMode = urlParams.has('aleatorio');
         const useCacheParam = isRandomMode ? '&use_cache=true' : '';
         
-        const timestamp = new Date().getTime();
-        
+        // Sem cache busting: o navegador revalida com If-None-Match e recebe 304 se nada mudou
         // Carrega dados sequencialmente para evitar rate limit
         // SEMANA
-        const evNewSemana = await fetch(`/api/destaques/evs?periodo=semana&pipeline=6810518&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const evNewSemana = await fetch(`/api/destaques/evs?periodo=semana&pipeline=6810518${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const evExpansaoSemana = await fetch(`/api/destaques/evs?periodo=semana&pipeline=4007305&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const evExpansaoSemana = await fetch(`/api/destaques/evs?periodo=semana&pipeline=4007305${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const sdrNewSemana = await fetch(`/api/destaques/sdrs?periodo=semana&pipeline=6810518&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const sdrNewSemana = await fetch(`/api/destaques/sdrs?periodo=semana&pipeline=6810518${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const sdrExpansaoSemana = await fetch(`/api/destaques/sdrs?periodo=semana&pipeline=4007305&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const sdrExpansaoSemana = await fetch(`/api/destaques/sdrs?periodo=semana&pipeline=4007305${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const ldrNewSemana = await fetch(`/api/destaques/ldrs?periodo=semana&pipeline=6810518&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const ldrNewSemana = await fetch(`/api/destaques/ldrs?periodo=semana&pipeline=6810518${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const ldrExpansaoSemana = await fetch(`/api/destaques/ldrs?periodo=semana&pipeline=4007305&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const ldrExpansaoSemana = await fetch(`/api/destaques/ldrs?periodo=semana&pipeline=4007305${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
         // MÊS
-        const evNewMes = await fetch(`/api/destaques/evs?periodo=mes&pipeline=6810518&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const evNewMes = await fetch(`/api/destaques/evs?periodo=mes&pipeline=6810518${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const evExpansaoMes = await fetch(`/api/destaques/evs?periodo=mes&pipeline=4007305&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const evExpansaoMes = await fetch(`/api/destaques/evs?periodo=mes&pipeline=4007305${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const sdrNewMes = await fetch(`/api/destaques/sdrs?periodo=mes&pipeline=6810518&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const sdrNewMes = await fetch(`/api/destaques/sdrs?periodo=mes&pipeline=6810518${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const sdrExpansaoMes = await fetch(`/api/destaques/sdrs?periodo=mes&pipeline=4007305&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const sdrExpansaoMes = await fetch(`/api/destaques/sdrs?periodo=mes&pipeline=4007305${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const ldrNewMes = await fetch(`/api/destaques/ldrs?periodo=mes&pipeline=6810518&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const ldrNewMes = await fetch(`/api/destaques/ldrs?periodo=mes&pipeline=6810518${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         await new Promise(resolve => setTimeout(resolve, 200));
         
-        const ldrExpansaoMes = await fetch(`/api/destaques/ldrs?periodo=mes&pipeline=4007305&_=${timestamp}${useCacheParam}`).then(r => r.json());
+        const ldrExpansaoMes = await fetch(`/api/destaques/ldrs?periodo=mes&pipeline=4007305${useCacheParam}`, { cache: 'no-cache' }).then(r => r.json());
         
         // Armazena dados em variável global para atualizar troféu quando slide mudar
         slideDataMap[0] = evNewSemana;
@@ -54,7 +54,7 @@ async function fetchWithTimeout(url, timeout = 30000) {
     const timeoutId = setTimeout(() => controller.abort(), timeout);
     
     try {
-        const response = await fetch(url, { signal: controller.signal });
+        const response = await fetch(url, { signal: controller.signal, cache: 'no-cache' });
         clearTimeout(timeoutId);
         return response;
     } catch (error) {
@@ -74,18 +74,16 @@ async function loadAllData() {
     const isRandomMode = urlParams.has('aleatorio');
     
     try {
-        // Cache busting: adiciona timestamp para evitar cache do navegador
-        const timestamp = new Date().getTime();
-        
+        // Sem cache busting: o navegador revalida com If-None-Match e recebe 304 se nada mudou
         // Usa cache se estiver no modo aleatório
         const useCacheParam = isRandomMode ? '&use_cache=true' : '';
         
         // Carrega dados de todos os perfis em paralelo com timeout de 30s cada
         const [evsData, sdrsNewData, sdrsExpansaoData, ldrsData] = await Promise.all([
-            fetchWithTimeout(`/api/hall-da-fama/evs-realtime?_=${timestamp}${useCacheParam}`, 30000).then(r => r.json()),
-            fetchWithTimeout(`/api/hall-da-fama/sdrs-realtime?pipeline=6810518&_=${timestamp}${useCacheParam}`, 30000).then(r => r.json()),
-            fetchWithTimeout(`/api/hall-da-fama/sdrs-realtime?pipeline=4007305&_=${timestamp}${useCacheParam}`, 30000).then(r => r.json()),
-            fetchWithTimeout(`/api/hall-da-fama/ldrs-realtime?_=${timestamp}${useCacheParam}`, 30000).then(r => r.json())
+            fetchWithTimeout(`/api/hall-da-fama/evs-realtime${useCacheParam.replace('&', '?')}`, 30000).then(r => r.json()),
+            fetchWithTimeout(`/api/hall-da-fama/sdrs-realtime?pipeline=6810518${useCacheParam}`, 30000).then(r => r.json()),
+            fetchWithTimeout(`/api/hall-da-fama/sdrs-realtime?pipeline=4007305${useCacheParam}`, 30000).then(r => r.json()),
+            fetchWithTimeout(`/api/hall-da-fama/ldrs-realtime${useCacheParam.replace('&', '?')}`, 30000).then(r => r.json())
         ]);
         
         // Atualiza cache
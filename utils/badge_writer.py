@@ -0,0 +1,175 @@
+"""
+Gravação em background dos badges desbloqueados (write-behind)
+
+As rotas do Hall da Fama apenas enfileiram os badges detectados
+(enqueue_badges) e respondem sem esperar o banco. A fila é limitada e agrupa
+desbloqueios repetidos de (user_type, user_id, badge_code, dia), mantendo só
+o de maior metric_value; uma thread grava a fila em lotes com
+utils.badges.save_badges_bulk. Lotes que falham voltam para a fila e o que
+estiver pendente é gravado no encerramento do processo.
+"""
+import time
+import atexit
+import threading
+from datetime import datetime
+from utils.badges import save_badges_bulk, get_badge_day
+
+# Máximo de badges distintos aguardando gravação (novos badges são descartados
+# quando a fila está cheia; o próximo ranking os detecta de novo)
+BADGE_QUEUE_MAX_SIZE = 5000
+
+# Intervalo entre gravações e tamanho máximo de cada lote
+BADGE_FLUSH_INTERVAL = 2
+BADGE_FLUSH_BATCH_SIZE = 500
+
+# Espera após uma falha de gravação (dobra a cada falha seguida)
+BADGE_RETRY_BACKOFF = 5
+BADGE_MAX_RETRY_BACKOFF = 120
+
+_queue_condition = threading.Condition()
+_pending = {}
+_writer_thread = None
+_writer_stats = {
+    'enqueued': 0,
+    'coalesced': 0,
+    'dropped': 0,
+    'written': 0,
+    'batches': 0,
+    'failures': 0,
+    'last_flush_at': None,
+    'last_failure_at': None
+}
+
+def _badge_key(entry):
+    """Chave de agrupamento: um badge por usuário por dia (utils.badges.get_badge_day)"""
+    return (entry['user_type'], str(entry['user_id']), entry['badge']['code'], get_badge_day())
+
+def _merge(key, entry):
+    """Coloca um badge na fila mantendo o de maior metric_value (chamar com o lock)"""
+    current = _pending.get(key)
+    if current is None:
+        if len(_pending) >= BADGE_QUEUE_MAX_SIZE:
+            _writer_stats['dropped'] += 1
+            return False
+        _pending[key] = entry
+        return True
+
+    _writer_stats['coalesced'] += 1
+    if (entry.get('metric_value') or 0) >= (current.get('metric_value') or 0):
+        _pending[key] = entry
+    return True
+
+def enqueue_badges(entries):
+    """
+    Enfileira badges para gravação em background (não acessa o banco).
+
+    Args:
+        entries: Lista de dicts no formato de utils.badges.save_badges_bulk
+    """
+    if not entries:
+        return
+
+    dropped = 0
+    with _queue_condition:
+        for entry in entries:
+            _writer_stats['enqueued'] += 1
+            if not _merge(_badge_key(entry), entry):
+                dropped += 1
+        _queue_condition.notify()
+
+    if dropped:
+        print(f"[AVISO] Fila de badges cheia: {dropped} badges descartados")
+    _ensure_writer_thread()
+
+def _take_batch():
+    with _queue_condition:
+        keys = list(_pending)[:BADGE_FLUSH_BATCH_SIZE]
+        return [(key, _pending.pop(key)) for key in keys]
+
+def _requeue(batch):
+    """Devolve um lote que falhou (sem sobrescrever badges mais novos da fila)"""
+    with _queue_condition:
+        for key, entry in batch:
+            current = _pending.get(key)
+            if current is None or (entry.get('metric_value') or 0) > (current.get('metric_value') or 0):
+                if current is None and len(_pending) >= BADGE_QUEUE_MAX_SIZE:
+                    _writer_stats['dropped'] += 1
+                    continue
+                _pending[key] = entry
+
+def flush_badge_queue():
+    """
+    Grava todos os badges pendentes.
+
+    Returns:
+        True se a fila foi esvaziada, False se um lote falhou (e voltou para a fila)
+    """
+    while True:
+        batch = _take_batch()
+        if not batch:
+            return True
+
+        start_time = time.time()
+        badge_ids = save_badges_bulk([entry for _, entry in batch])
+        with _queue_condition:
+            if badge_ids is None:
+                _writer_stats['failures'] += 1
+                _writer_stats['last_failure_at'] = time.time()
+            else:
+                _writer_stats['written'] += len(badge_ids)
+                _writer_stats['batches'] += 1
+                _writer_stats['last_flush_at'] = time.time()
+
+        if badge_ids is None:
+            _requeue(batch)
+            print(f"[AVISO] Falha ao gravar lote de {len(batch)} badges (mantidos na fila)")
+            return False
+        print(f"[OK] Lote de {len(batch)} badges gravado em {time.time() - start_time:.2f}s")
+
+def _writer_loop():
+    backoff = BADGE_RETRY_BACKOFF
+    while True:
+        with _queue_condition:
+            while not _pending:
+                _queue_condition.wait()
+        # Espera a janela para agrupar os badges de vários rankings no mesmo lote
+        time.sleep(BADGE_FLUSH_INTERVAL)
+
+        try:
+            flushed = flush_badge_queue()
+        except Exception as e:
+            print(f"[ERRO] Erro ao gravar fila de badges: {e}")
+            flushed = False
+
+        if flushed:
+            backoff = BADGE_RETRY_BACKOFF
+        else:
+            time.sleep(backoff)
+            backoff = min(backoff * 2, BADGE_MAX_RETRY_BACKOFF)
+
+def _flush_on_exit():
+    with _queue_condition:
+        pending = len(_pending)
+    if pending and flush_badge_queue():
+        print(f"[OK] {pending} badges pendentes gravados no encerramento")
+
+def _ensure_writer_thread():
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    with _queue_condition:
+        if _writer_thread is not None:
+            return
+        _writer_thread = threading.Thread(target=_writer_loop, daemon=True, name='badge-writer')
+        _writer_thread.start()
+    atexit.register(_flush_on_exit)
+
+def get_badge_queue_status():
+    """Tamanho da fila e contadores da gravação de badges (para debug)"""
+    with _queue_condition:
+        status = dict(_writer_stats, pending=len(_pending), running=_writer_thread is not None)
+
+    for field in ('last_flush_at', 'last_failure_at'):
+        if status[field] is not None:
+            status[field] = datetime.fromtimestamp(status[field]).isoformat()
+    return status
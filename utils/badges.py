@@ -1,9 +1,11 @@
 """
 Utilitários para badges e gamificação
 """
-from datetime import datetime
-from utils.db import get_db_connection_context
-from psycopg2.extras import RealDictCursor
+import threading
+from datetime import datetime, timezone, timedelta
+from utils.db import get_db_connection_context, read_query
+from utils.datetime_utils import TimeWindow
+from psycopg2.extras import RealDictCursor, execute_values
 import json
 
 def detect_badges(timestamps, count, revenue=None, user_type='EV'):
@@ -70,45 +72,199 @@ def detect_badges(timestamps, count, revenue=None, user_type='EV'):
     
     return badges
 
+# INSERT com ON CONFLICT para evitar duplicatas (um badge por usuário por dia)
+SAVE_BADGES_QUERY = """
+    INSERT INTO badges_desbloqueados 
+        (user_type, user_id, user_name, badge_code, badge_name, badge_category, 
+         deal_id, deal_name, metric_value, pipeline, source, context)
+    VALUES %s
+    ON CONFLICT (user_type, user_id, badge_code, DATE(unlocked_at)) 
+    DO UPDATE SET 
+        metric_value = GREATEST(badges_desbloqueados.metric_value, EXCLUDED.metric_value),
+        context = EXCLUDED.context
+    RETURNING id, user_type, user_id, badge_code
+"""
+
+SAVE_BADGES_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'hubspot_api', %s)"
+
+def get_badge_day():
+    """
+    Dia de um badge: DATE(unlocked_at), com unlocked_at gravado em UTC.
+
+    É o dia do índice único idx_badges_unique_per_day (e do ON CONFLICT), e
+    vale para tudo que agrupa badges por dia: "hoje" das consultas, o índice
+    de badges já gravados e a fila de gravação (utils.badge_writer).
+    """
+    return datetime.now(timezone.utc).date()
+
+def get_badge_day_window(day=None):
+    """Intervalo [start, end) de um dia de badge, para comparar com unlocked_at"""
+    day = day or get_badge_day()
+    start = datetime(day.year, day.month, day.day)
+    return TimeWindow(start, start + timedelta(days=1))
+
+# Índice dos badges já gravados no dia (ver get_badge_day):
+# (user_type, user_id, badge_code) → (maior metric_value, id do badge)
+_unlocked_index = {'day': None, 'badges': {}}
+_unlocked_index_lock = threading.Lock()
+
+def _index_key(entry):
+    return (entry['user_type'], str(entry['user_id']), entry['badge']['code'])
+
+def _load_unlocked_index(day):
+    """Badges já desbloqueados no dia, lidos do banco (None se o banco falhar)"""
+    rows = read_query("""
+        SELECT id, user_type, user_id, badge_code, metric_value
+        FROM badges_desbloqueados
+        WHERE unlocked_at >= %s AND unlocked_at < %s
+    """, tuple(get_badge_day_window(day)))
+    if rows is None:
+        return None
+    return {
+        (row['user_type'], str(row['user_id']), row['badge_code']): (float(row['metric_value'] or 0), row['id'])
+        for row in rows
+    }
+
+def _get_unlocked_index():
+    """Índice do dia atual (carregado do banco na primeira gravação de cada dia)"""
+    day = get_badge_day()
+    with _unlocked_index_lock:
+        if _unlocked_index['day'] == day:
+            return day, _unlocked_index['badges']
+
+    badges = _load_unlocked_index(day)
+    if badges is None:
+        return day, None
+
+    with _unlocked_index_lock:
+        if _unlocked_index['day'] != day:
+            _unlocked_index['day'] = day
+            _unlocked_index['badges'] = badges
+            print(f"[OK] Indice de badges do dia carregado ({len(badges)} badges)")
+        return day, _unlocked_index['badges']
+
+def _filter_unlocked(entries):
+    """
+    Separa os badges já gravados hoje com metric_value igual ou maior.
+
+    Sem o índice (banco indisponível na carga), mantém todos os badges.
+
+    Returns:
+        Tupla (dia, badges a gravar, {chave: id} dos badges ignorados)
+    """
+    day, index = _get_unlocked_index()
+    if index is None:
+        return day, entries, {}
+
+    kept, skipped = [], {}
+    with _unlocked_index_lock:
+        for entry in entries:
+            key = _index_key(entry)
+            unlocked = index.get(key)
+            if unlocked is None or float(entry.get('metric_value') or 0) > unlocked[0]:
+                kept.append(entry)
+            else:
+                skipped[key] = unlocked[1]
+    return day, kept, skipped
+
+def _update_unlocked_index(day, saved):
+    """Atualiza o índice com os badges gravados ({chave: (metric_value, id)})"""
+    with _unlocked_index_lock:
+        if _unlocked_index['day'] != day:
+            return
+        index = _unlocked_index['badges']
+        for key, (metric_value, badge_id) in saved.items():
+            current = index.get(key)
+            index[key] = (max(metric_value, current[0]) if current else metric_value, badge_id)
+
 def save_badge_to_database(user_type, user_id, user_name, badge, deal_id=None, deal_name=None, metric_value=None, pipeline=None, context=None):
-    """Salva badge desbloqueado no banco de dados"""
+    """
+    Salva badge desbloqueado no banco de dados.
+    
+    Se o badge já foi gravado hoje com metric_value igual ou maior, nada é
+    gravado e o ID do badge existente é retornado.
+    
+    Returns:
+        ID do badge, ou None em caso de erro
+    """
+    entry = {
+        'user_type': user_type,
+        'user_id': user_id,
+        'user_name': user_name,
+        'badge': badge,
+        'deal_id': deal_id,
+        'deal_name': deal_name,
+        'metric_value': metric_value,
+        'pipeline': pipeline,
+        'context': context
+    }
+    _, kept, skipped = _filter_unlocked([entry])
+    if not kept:
+        return skipped[_index_key(entry)]
+
+    badge_ids = save_badges_bulk(kept)
+    return badge_ids[0] if badge_ids else None
+
+def save_badges_bulk(entries):
+    """
+    Salva vários badges desbloqueados em um único INSERT (uma conexão e um commit).
+    
+    Args:
+        entries: Lista de dicts com os argumentos de save_badge_to_database
+                 (user_type, user_id, user_name, badge e, opcionalmente, deal_id,
+                 deal_name, metric_value, pipeline, context)
+    
+    Badges já gravados hoje sem melhora no metric_value são ignorados sem
+    acessar o banco (ver _filter_unlocked).
+    
+    Returns:
+        Lista com os IDs dos badges salvos, ou None em caso de erro
+    """
+    day, entries, _ = _filter_unlocked(entries)
+    
+    # Um único INSERT ... ON CONFLICT DO UPDATE não pode atualizar a mesma linha
+    # duas vezes: mantém uma entrada por usuário e badge (a de maior metric_value)
+    rows = {}
+    for entry in entries:
+        key = _index_key(entry)
+        current = rows.get(key)
+        if current is None or (entry.get('metric_value') or 0) > (current.get('metric_value') or 0):
+            rows[key] = entry
+    if not rows:
+        return []
+    
+    values = []
+    for entry in rows.values():
+        badge = entry['badge']
+        context = entry.get('context')
+        values.append((
+            entry['user_type'], entry['user_id'], entry['user_name'],
+            badge['code'], badge['name'], badge['category'],
+            entry.get('deal_id'), entry.get('deal_name'), entry.get('metric_value'),
+            entry.get('pipeline'), json.dumps(context) if context else None
+        ))
+    
     with get_db_connection_context() as conn:
         if not conn:
             return None
         
         try:
             cursor = conn.cursor()
-            
-            context_json = json.dumps(context) if context else None
-            
-            # INSERT com ON CONFLICT para evitar duplicatas
-            query = """
-                INSERT INTO badges_desbloqueados 
-                    (user_type, user_id, user_name, badge_code, badge_name, badge_category, 
-                     deal_id, deal_name, metric_value, pipeline, source, context)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'hubspot_api', %s)
-                ON CONFLICT (user_type, user_id, badge_code, DATE(unlocked_at)) 
-                DO UPDATE SET 
-                    metric_value = GREATEST(badges_desbloqueados.metric_value, EXCLUDED.metric_value),
-                    context = EXCLUDED.context
-                RETURNING id
-            """
-            
-            cursor.execute(query, (
-                user_type, user_id, user_name, badge['code'], badge['name'], badge['category'],
-                deal_id, deal_name, metric_value, pipeline, context_json
-            ))
-            
-            badge_id = cursor.fetchone()[0]
+            result = execute_values(cursor, SAVE_BADGES_QUERY, values, template=SAVE_BADGES_TEMPLATE, page_size=len(values), fetch=True)
+            badge_ids = [row[0] for row in result]
             conn.commit()
+            cursor.close()
             
-            print(f"[OK] Badge salvo: {badge['name']} para {user_name} (ID: {badge_id})")
+            _update_unlocked_index(day, {
+                (user_type, str(user_id), badge_code): (float(rows[(user_type, str(user_id), badge_code)].get('metric_value') or 0), badge_id)
+                for badge_id, user_type, user_id, badge_code in result
+            })
             
-            cursor.close()
-            return badge_id
+            print(f"[OK] {len(badge_ids)} badges salvos")
+            return badge_ids
             
         except Exception as e:
-            print(f"[ERRO] Erro ao salvar badge: {e}")
+            print(f"[ERRO] Erro ao salvar badges: {e}")
             if conn:
                 conn.rollback()
             return None
@@ -132,7 +288,9 @@ def get_user_badges(user_type, user_id, date_filter=None):
             params = [user_type, user_id]
             
             if date_filter == 'today':
-                query += " AND DATE(unlocked_at) = CURRENT_DATE"
+                today = get_badge_day_window()
+                query += " AND unlocked_at >= %s AND unlocked_at < %s"
+                params.extend(today)
             elif date_filter == 'week':
                 query += " AND unlocked_at >= CURRENT_DATE - INTERVAL '7 days'"
             elif date_filter == 'month':
@@ -1,52 +1,695 @@
 """
 Sistema de cache centralizado
+
+Registro único de chaves de cache usado por todos os blueprints. Cada chave
+declara seu TTL, a função que recalcula o valor e os parâmetros dessa função.
+As leituras usam stale-while-revalidate: um valor expirado continua sendo
+servido enquanto o recálculo roda em background, então nenhum painel espera
+pelo Postgres ou pelo HubSpot quando já existe um valor em memória.
+
+Com um backend compartilhado (ver utils.cache_backends) apenas a instância que
+detém o lease de atualização recalcula as chaves; as demais copiam os valores
+gravados no backend.
 """
+import os
+import gzip
+import json
+import socket
+import hashlib
 import threading
-from datetime import datetime
-
-# Cache em memória para todos os dados do dashboard
-# Atualizado a cada 10 minutos em background thread
-_data_cache = {
-    'revenue': None,
-    'revenue_today': None,
-    'pipeline_today': None,
-    'hall_evs': None,
-    'hall_sdrs_new': None,
-    'hall_sdrs_expansao': None,
-    'hall_ldrs': None,
-    'destaques_evs_semana_new': None,
-    'destaques_evs_semana_expansao': None,
-    'destaques_evs_mes_new': None,
-    'destaques_evs_mes_expansao': None,
-    'destaques_sdrs_semana_new': None,
-    'destaques_sdrs_semana_expansao': None,
-    'destaques_sdrs_mes_new': None,
-    'destaques_sdrs_mes_expansao': None,
-    'destaques_ldrs_semana_new': None,
-    'destaques_ldrs_semana_expansao': None,
-    'destaques_ldrs_mes_new': None,
-    'destaques_ldrs_mes_expansao': None,
-    'top_evs_today': None,
-    'top_sdrs_today_new': None,
-    'top_sdrs_today_expansao': None,
-    'top_ldrs_today': None,
-    'last_update': None,
-    'is_updating': False
-}
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime
+from decimal import Decimal
+from flask import request, jsonify, Response
+from werkzeug.http import http_date
+from utils.cache_backends import create_cache_backend
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_UPDATE_INTERVAL = 600  # TTL padrão: 10 minutos em segundos
+
+# Número máximo de chaves recalculadas em paralelo
+CACHE_REFRESH_WORKERS = int(os.getenv('CACHE_REFRESH_WORKERS', '6'))
+
+# Campos de primeiro nível que mudam a cada recálculo mesmo com os mesmos dados
+# (ex.: 'timestamp' do momento do cálculo); ficam fora do ETag, para que dados
+# iguais mantenham o mesmo ETag e a mesma versão
+VOLATILE_FIELDS = ('timestamp',)
+
+class SerializedValue:
+    """Valor do cache já serializado: JSON UTF-8, versões comprimidas e ETag"""
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.gzip = gzip.compress(body, compresslevel=6, mtime=0)
+        self.br = brotli.compress(body) if brotli else None
+        self.etag = etag
+
+def _json_default(obj):
+    """Serializa tipos não nativos do JSON da mesma forma que o jsonify do Flask"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (date, datetime)):
+        return http_date(obj)
+    return str(obj)
+
+def _dump_json(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, default=_json_default).encode('utf-8')
+
+def content_etag(value, body=None):
+    """
+    ETag do conteúdo de um valor JSON, sem os campos de VOLATILE_FIELDS.
+
+    Args:
+        body: value já serializado (reaproveitado quando não há campo volátil)
+    """
+    if isinstance(value, dict) and any(field in value for field in VOLATILE_FIELDS):
+        body = _dump_json({name: item for name, item in value.items() if name not in VOLATILE_FIELDS})
+    elif body is None:
+        body = _dump_json(value)
+    return hashlib.sha256(body).hexdigest()[:32]
+
+def serialize_cache_value(value):
+    """
+    Serializa um valor do cache uma única vez (no momento da gravação).
+
+    Returns:
+        SerializedValue, ou None se o valor não puder ser serializado
+    """
+    try:
+        body = _dump_json(value)
+        etag = content_etag(value, body)
+    except Exception as e:
+        print(f"[AVISO] Erro ao serializar valor do cache: {e}")
+        return None
+    return SerializedValue(body, etag)
+
+class CacheEntry:
+    """Chave registrada no cache: configuração (TTL, função, parâmetros) e estado atual"""
+
+    def __init__(self, key, ttl=CACHE_UPDATE_INTERVAL, refresh=None, params=None, timeout=30, stage=None):
+        self.key = key
+        self.ttl = ttl
+        self.refresh = refresh
+        self.params = params or {}
+        self.timeout = timeout
+        # Etapa que recalcula esta chave junto com outras (ver register_cache_stage)
+        self.stage = stage
+        self.stage_keys = None
+
+        self.value = None
+        self.serialized = None  # SerializedValue do valor atual
+        self.updated_at = None  # time.time() da última gravação
+        # Versão dos dados: só muda quando o conteúdo muda (não a cada atualização)
+        self.version = 0
+        self.modified_at = None
+        self.refreshing = False
+        # Valor restaurado do snapshot: servido, mas recalculado na primeira oportunidade
+        self.restored = False
+
+        self.last_started = None
+        self.last_duration = None
+        self.last_success = None
+        self.last_error = None
+        self.errors = 0
+        self.timeouts = 0
+
+        # Leituras via get_cached (hit servido expirado também conta em stale_hits)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def set_value(self, value, serialized, updated_at, restored=False):
+        """Grava um novo valor (chamar com o lock do cache)"""
+        previous_etag = self.serialized.etag if self.serialized else None
+        new_etag = serialized.etag if serialized else None
+        if self.value is None or new_etag is None or new_etag != previous_etag:
+            self.version += 1
+            self.modified_at = updated_at
+
+        self.value = value
+        self.serialized = serialized
+        self.updated_at = updated_at
+        self.restored = restored
+
+    def age(self):
+        """Idade do valor atual em segundos (None se nunca foi preenchido)"""
+        if self.updated_at is None:
+            return None
+        return time.time() - self.updated_at
+
+    def is_stale(self):
+        """True se o valor não existe ou já passou do TTL"""
+        if self.restored:
+            return True
+        age = self.age()
+        return age is None or age >= self.ttl
+
+    def to_dict(self):
+        """Estado da chave em formato serializável (debug/monitoramento)"""
+        age = self.age()
+        return {
+            'ttl': self.ttl,
+            'stage': self.stage,
+            'age': round(age, 1) if age is not None else None,
+            'stale': self.is_stale(),
+            'restored': self.restored,
+            'version': self.version,
+            'refreshing': self.refreshing,
+            'last_started': self.last_started,
+            'last_duration': self.last_duration,
+            'last_success': self.last_success,
+            'last_error': self.last_error,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses
+        }
+
+# Lease de atualização: deve durar mais que a atualização completa mais lenta
+REFRESH_LEASE_NAME = 'cache-refresh'
+CACHE_LEASE_TTL = int(os.getenv('CACHE_LEASE_TTL', '300'))
 
+# Snapshot usado para servir valores logo após um cold start. No Cloud Run o
+# /tmp é de cada container: use um caminho gs://bucket/objeto (compartilhado
+# por todas as instâncias e revisões) ou um volume montado
+CACHE_SNAPSHOT_VERSION = 1
+CACHE_SNAPSHOT_PATH = os.getenv('CACHE_SNAPSHOT_PATH', '/tmp/dashboard_cache_snapshot.json')
+GCS_PREFIX = 'gs://'
+
+# Identificador desta instância no lease (revisão do Cloud Run + host + processo)
+INSTANCE_ID = f"{os.getenv('K_REVISION', 'local')}:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_registry = {}
 _cache_lock = threading.Lock()
-CACHE_UPDATE_INTERVAL = 600  # 10 minutos em segundos
+_refresh_executor = ThreadPoolExecutor(max_workers=CACHE_REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+
+_backend = create_cache_backend()
+# Sem backend compartilhado toda instância atualiza o próprio cache
+_is_leader = not _backend.shared
+
+def register_cache_key(key, ttl=CACHE_UPDATE_INTERVAL, refresh=None, params=None, timeout=30, stage=None):
+    """
+    Registra (ou reconfigura) uma chave no cache.
+
+    Args:
+        key: Nome da chave
+        ttl: Tempo em segundos até o valor ser considerado expirado
+        refresh: Função chamada como refresh(**params) que retorna o novo valor
+        params: Parâmetros passados para a função de atualização
+        timeout: Tempo máximo em segundos aguardado por uma atualização
+        stage: Nome da etapa que recalcula esta chave (em vez de refresh próprio)
+    """
+    with _cache_lock:
+        entry = _registry.get(key)
+        if entry is None:
+            entry = CacheEntry(key, ttl, refresh, params, timeout, stage)
+            _registry[key] = entry
+        else:
+            entry.ttl = ttl
+            entry.refresh = refresh
+            entry.params = params or {}
+            entry.timeout = timeout
+            entry.stage = stage
+    return entry
+
+def register_cache_stage(name, keys, refresh, ttl=CACHE_UPDATE_INTERVAL, params=None, timeout=120):
+    """
+    Registra uma etapa que recalcula várias chaves de uma só vez.
+
+    A função refresh(**params) deve retornar um dict {chave: valor}; cada valor é
+    gravado na sua chave. Ler uma dessas chaves expirada agenda a etapa inteira.
+    """
+    entry = register_cache_key(name, ttl, refresh, params, timeout)
+    entry.stage_keys = list(keys)
+    for key in keys:
+        register_cache_key(key, ttl, stage=name)
+    return entry
 
-def get_cache():
-    """Retorna o dicionário de cache"""
-    return _data_cache
+def get_cache_entry(key):
+    """Retorna a CacheEntry de uma chave (ou None se não registrada)"""
+    return _registry.get(key)
+
+def get_cache_entries():
+    """Retorna todas as chaves registradas"""
+    with _cache_lock:
+        return dict(_registry)
 
 def get_cache_lock():
     """Retorna o lock do cache"""
     return _cache_lock
 
 def get_cache_interval():
-    """Retorna o intervalo de atualização do cache"""
+    """Retorna o TTL padrão do cache"""
     return CACHE_UPDATE_INTERVAL
 
+def get_cache_backend():
+    """Retorna o backend de armazenamento em uso"""
+    return _backend
+
+def is_refresh_leader():
+    """True se esta instância é responsável por recalcular o cache"""
+    return _is_leader
+
+def update_refresh_leadership():
+    """
+    Adquire ou renova o lease de atualização no backend compartilhado.
+
+    Se o backend estiver indisponível, a instância passa a atualizar o próprio
+    cache (comportamento de instância única) até o backend voltar.
+
+    Returns:
+        True se esta instância deve recalcular o cache
+    """
+    global _is_leader
+    if not _backend.shared:
+        return True
+
+    try:
+        leader = _backend.acquire_lease(REFRESH_LEASE_NAME, INSTANCE_ID, CACHE_LEASE_TTL)
+    except Exception as e:
+        print(f"[AVISO] Erro ao renovar lease do cache: {e}")
+        leader = True
+
+    if leader != _is_leader:
+        if leader:
+            print(f"[CACHE] Instancia {INSTANCE_ID} assumiu a atualizacao do cache")
+        else:
+            print(f"[CACHE] Instancia {INSTANCE_ID} lendo cache de outra instancia")
+    _is_leader = leader
+    return leader
+
+def release_refresh_lease():
+    """Libera o lease de atualização (chamado no encerramento da instância)"""
+    if not _backend.shared or not _is_leader:
+        return
+    try:
+        _backend.release_lease(REFRESH_LEASE_NAME, INSTANCE_ID)
+    except Exception as e:
+        print(f"[AVISO] Erro ao liberar lease do cache: {e}")
+
+def sync_from_backend():
+    """
+    Copia para a memória os valores do backend mais novos que os locais.
+
+    Returns:
+        Número de chaves atualizadas
+    """
+    if not _backend.shared:
+        return 0
+
+    synced = 0
+    for key, entry in get_cache_entries().items():
+        if entry.stage_keys is not None:
+            continue
+        try:
+            stored = _backend.load(key)
+        except Exception as e:
+            print(f"[AVISO] Erro ao ler cache {key} do backend: {e}")
+            continue
+        if stored is None:
+            continue
+
+        value, updated_at = stored
+        if entry.updated_at is not None and updated_at <= entry.updated_at:
+            continue
+
+        serialized = serialize_cache_value(value)
+        with _cache_lock:
+            if entry.updated_at is None or updated_at > entry.updated_at:
+                entry.set_value(value, serialized, updated_at)
+                synced += 1
+    return synced
+
+def get_cached(key):
+    """
+    Retorna o valor em cache de uma chave (ou None se vazio).
+
+    Se o valor estiver expirado, agenda um recálculo em background e devolve o
+    valor antigo imediatamente (stale-while-revalidate). Instâncias que não
+    detêm o lease apenas aguardam a próxima sincronização com o backend.
+    """
+    entry = _registry.get(key)
+    if entry is None:
+        return None
+
+    value = entry.value
+    stale = entry.is_stale()
+    with _cache_lock:
+        if value is None:
+            entry.misses += 1
+        else:
+            entry.hits += 1
+            if stale:
+                entry.stale_hits += 1
+
+    if value is None:
+        return None
+
+    if stale and _is_leader:
+        schedule_refresh(entry.stage or key)
+
+    return value
+
+def _choose_encoding(serialized):
+    """Escolhe a codificação da resposta conforme o Accept-Encoding do cliente"""
+    accepted = request.accept_encodings
+    if serialized.br is not None and accepted['br']:
+        return 'br', serialized.br
+    if accepted['gzip']:
+        return 'gzip', serialized.gzip
+    return None, serialized.body
+
+def cached_json_response(key):
+    """
+    Monta a resposta JSON de uma chave a partir dos bytes pré-serializados.
+
+    Responde 304 se o If-None-Match (ou If-Modified-Since) do cliente ainda
+    corresponder ao valor atual e escolhe entre brotli, gzip ou sem compressão
+    pelo Accept-Encoding. Assim como get_cached, agenda o recálculo se o valor
+    estiver expirado.
+
+    Returns:
+        Response com X-Cache: HIT (ou STALE se o valor já expirou) e Age,
+        ou None se a chave estiver vazia
+    """
+    value = get_cached(key)
+    if value is None:
+        return None
+
+    entry = _registry[key]
+    age = entry.age()
+    serialized = entry.serialized
+    if serialized is None:
+        response = jsonify(value)
+    elif _is_not_modified(serialized.etag, entry.modified_at):
+        response = Response(status=304)
+    else:
+        encoding, body = _choose_encoding(serialized)
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    if serialized is not None:
+        # ETag fraco: identifica o conteúdo (sem VOLATILE_FIELDS), não os bytes,
+        # e é o mesmo sem compressão, em gzip e em brotli
+        response.set_etag(serialized.etag, weak=True)
+        response.headers['Vary'] = 'Accept-Encoding'
+    if entry.modified_at is not None:
+        response.last_modified = entry.modified_at
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Data-Version'] = str(entry.version)
+    response.headers['X-Cache'] = 'STALE' if entry.is_stale() else 'HIT'
+    if age is not None:
+        response.headers['Age'] = str(max(0, int(age)))
+    return response
+
+def _is_not_modified(etag, modified_at):
+    """True se a versão que o cliente já tem ainda é a atual"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and modified_at is not None:
+        return int(modified_at) <= request.if_modified_since.timestamp()
+    return False
+
+def add_conditional_headers(response):
+    """
+    after_request: ETag e 304 para as respostas JSON das APIs de dados.
+
+    Respostas que já têm ETag (vindas do cache pré-serializado) passam direto;
+    as demais recebem o ETag fraco do conteúdo (content_etag, o mesmo do cache), e o
+    cliente que já tem esse conteúdo recebe 304 sem corpo.
+    """
+    if (
+        request.method != 'GET'
+        or not request.path.startswith('/api/')
+        or response.status_code != 200
+        or response.mimetype != 'application/json'
+        or response.direct_passthrough
+        or 'ETag' in response.headers
+    ):
+        return response
+
+    data = response.get_json(silent=True)
+    if data is None:
+        response.add_etag()
+    else:
+        response.set_etag(content_etag(data), weak=True)
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+def set_cached(key, value, publish=True):
+    """
+    Grava um valor no cache (registra a chave com TTL padrão se necessário).
+
+    A serialização (JSON, gzip, brotli e ETag) é feita aqui, uma vez por
+    gravação, e reaproveitada por todas as respostas (ver cached_json_response).
+
+    Args:
+        publish: Se True, também grava no backend compartilhado
+    """
+    # O valor agregado de uma etapa nunca é enviado como resposta
+    existing = _registry.get(key)
+    serialized = None if existing is not None and existing.stage_keys is not None else serialize_cache_value(value)
+
+    with _cache_lock:
+        entry = _registry.get(key)
+        if entry is None:
+            entry = CacheEntry(key)
+            _registry[key] = entry
+        updated_at = time.time()
+        entry.set_value(value, serialized, updated_at)
+
+    if publish:
+        try:
+            _backend.store(key, value, updated_at)
+        except Exception as e:
+            print(f"[AVISO] Erro ao gravar cache {key} no backend: {e}")
+
+def _run_refresh(entry):
+    """Recalcula uma chave (executado no pool de workers)"""
+    start_time = time.time()
+    previous_update = entry.updated_at
+    try:
+        value = entry.refresh(**entry.params)
+        if value is None:
+            raise RuntimeError('função de atualização não retornou dados')
+
+        if entry.stage_keys is not None:
+            for key in entry.stage_keys:
+                if key in value:
+                    set_cached(key, value[key])
+            # O valor agregado da etapa não é publicado: as chaves já foram
+            set_cached(entry.key, value, publish=False)
+        elif entry.updated_at == previous_update:
+            # Rotas chamadas por fetch_endpoint já gravam a própria chave (com
+            # use_cache=false); só grava aqui se a função não o fez, para não
+            # serializar e publicar o mesmo valor duas vezes
+            set_cached(entry.key, value)
+        entry.last_duration = round(time.time() - start_time, 3)
+        entry.last_success = datetime.now().isoformat()
+        entry.last_error = None
+        return value
+    except Exception as e:
+        entry.last_duration = round(time.time() - start_time, 3)
+        entry.last_error = str(e)
+        entry.errors += 1
+        print(f"[AVISO] Erro ao atualizar cache {entry.key}: {e}")
+        raise
+    finally:
+        with _cache_lock:
+            entry.refreshing = False
+
+def schedule_refresh(key):
+    """
+    Agenda o recálculo de uma chave no pool de workers.
+
+    Returns:
+        Future da atualização, ou None se a chave não tem função de atualização
+        ou já está sendo recalculada.
+    """
+    with _cache_lock:
+        entry = _registry.get(key)
+        if entry is None or entry.refresh is None or entry.refreshing:
+            return None
+        entry.refreshing = True
+        entry.last_started = datetime.now().isoformat()
+
+    return _refresh_executor.submit(_run_refresh, entry)
+
+def refresh_keys(keys=None, only_stale=False):
+    """
+    Recalcula várias chaves em paralelo e aguarda cada uma até o seu timeout.
+
+    Uma chave lenta ou com erro não atrasa nem derruba as demais; se estourar o
+    timeout, o worker continua rodando e grava o resultado quando terminar.
+
+    Args:
+        keys: Lista de chaves (padrão: todas as registradas com função de atualização)
+        only_stale: Se True, recalcula apenas chaves vazias ou expiradas
+
+    Returns:
+        Tupla (chaves recalculadas, chaves que falharam ou estouraram o timeout)
+    """
+    if keys is None:
+        keys = [key for key, entry in get_cache_entries().items() if entry.refresh]
+
+    futures = {}
+    for key in keys:
+        entry = _registry.get(key)
+        if entry is None or (only_stale and not entry.is_stale()):
+            continue
+        future = schedule_refresh(key)
+        if future is None:
+            continue
+        futures[future] = (key, time.time() + entry.timeout)
+
+    # Aguarda cada chave até o seu próprio deadline
+    pending = set(futures)
+    while pending:
+        next_deadline = min(futures[f][1] for f in pending)
+        _, pending = wait(pending, timeout=max(0, next_deadline - time.time()), return_when=FIRST_COMPLETED)
+
+        now = time.time()
+        expired = {f for f in pending if futures[f][1] <= now}
+        for future in expired:
+            entry = _registry[futures[future][0]]
+            entry.timeouts += 1
+            entry.last_error = 'timeout'
+            print(f"[AVISO] Timeout ao atualizar cache {entry.key}")
+        pending -= expired
+
+    refreshed = [key for key, _ in futures.values()]
+    failed = [futures[f][0] for f in futures if not f.done() or f.exception() is not None]
+    return refreshed, failed
+
+def _split_gcs_path(path):
+    """'gs://bucket/objeto' -> (bucket, objeto)"""
+    bucket_name, _, blob_name = path[len(GCS_PREFIX):].partition('/')
+    return bucket_name, blob_name
+
+def _gcs_blob(path):
+    from google.cloud import storage
+    bucket_name, blob_name = _split_gcs_path(path)
+    return storage.Client().bucket(bucket_name).blob(blob_name)
+
+def _write_snapshot(path, data):
+    """Grava o snapshot no Cloud Storage (gs://) ou em disco"""
+    if path.startswith(GCS_PREFIX):
+        # O upload de um objeto no GCS é atômico
+        _gcs_blob(path).upload_from_string(data, content_type='application/json')
+        return
+
+    # Arquivo temporário + rename: um encerramento no meio da gravação nunca
+    # deixa um snapshot corrompido
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _read_snapshot(path):
+    """Lê o snapshot do Cloud Storage (gs://) ou do disco (None se não existir)"""
+    if path.startswith(GCS_PREFIX):
+        from google.api_core.exceptions import NotFound
+        try:
+            return _gcs_blob(path).download_as_bytes()
+        except NotFound:
+            return None
+
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+def save_cache_snapshot(path=None):
+    """
+    Grava um snapshot versionado dos valores do cache (CACHE_SNAPSHOT_PATH).
+
+    Com um backend compartilhado e o snapshot no Cloud Storage, apenas a
+    instância líder grava (as demais têm os mesmos valores).
+
+    Returns:
+        Número de chaves gravadas
+    """
+    path = path or CACHE_SNAPSHOT_PATH
+    if path.startswith(GCS_PREFIX) and not _is_leader:
+        return 0
+
+    entries = {}
+    with _cache_lock:
+        for key, entry in _registry.items():
+            # Valores agregados de etapas são redundantes com as chaves da etapa
+            if entry.value is None or entry.stage_keys is not None:
+                continue
+            entries[key] = {'value': entry.value, 'updated_at': entry.updated_at}
+
+    if not entries:
+        return 0
+
+    snapshot = {
+        'version': CACHE_SNAPSHOT_VERSION,
+        'saved_at': time.time(),
+        'entries': entries
+    }
+
+    try:
+        _write_snapshot(path, json.dumps(snapshot, ensure_ascii=False, default=str).encode('utf-8'))
+    except Exception as e:
+        print(f"[AVISO] Erro ao salvar snapshot do cache: {e}")
+        return 0
+
+    return len(entries)
+
+def load_cache_snapshot(path=None):
+    """
+    Carrega o snapshot (CACHE_SNAPSHOT_PATH) para as chaves ainda vazias.
+
+    Os valores restaurados são servidos imediatamente, mas ficam marcados como
+    expirados para que a primeira atualização os substitua.
+
+    Returns:
+        Número de chaves restauradas
+    """
+    path = path or CACHE_SNAPSHOT_PATH
+    try:
+        data = _read_snapshot(path)
+        if data is None:
+            return 0
+        snapshot = json.loads(data)
+    except Exception as e:
+        print(f"[AVISO] Erro ao ler snapshot do cache: {e}")
+        return 0
+
+    if snapshot.get('version') != CACHE_SNAPSHOT_VERSION:
+        print(f"[AVISO] Snapshot do cache ignorado (versao {snapshot.get('version')}, esperada {CACHE_SNAPSHOT_VERSION})")
+        return 0
+
+    entries = [
+        (key, stored, serialize_cache_value(stored['value']))
+        for key, stored in snapshot.get('entries', {}).items()
+    ]
+
+    restored = 0
+    with _cache_lock:
+        for key, stored, serialized in entries:
+            entry = _registry.get(key)
+            if entry is None:
+                entry = CacheEntry(key)
+                _registry[key] = entry
+            if entry.value is not None:
+                continue
+            entry.set_value(stored['value'], serialized, stored['updated_at'], restored=True)
+            restored += 1
 
+    return restored
@@ -0,0 +1,199 @@
+"""
+Backends de armazenamento do cache centralizado
+
+O backend padrão guarda tudo em memória no próprio processo. Os backends
+compartilhados (SQLite local ou servidor com protocolo Redis) permitem que
+várias instâncias leiam os mesmos valores; um lease de líder garante que só
+uma delas recalcula o cache enquanto as demais apenas leem o resultado.
+
+Configuração por variáveis de ambiente:
+    CACHE_BACKEND: 'memory' (padrão), 'sqlite' ou 'redis'
+    CACHE_SQLITE_PATH: arquivo do backend SQLite
+    CACHE_REDIS_URL: URL do servidor Redis (ex.: redis://localhost:6379/0)
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+class MemoryCacheBackend:
+    """Backend em memória do processo (padrão); nada é compartilhado entre instâncias"""
+
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """Retorna (valor, updated_at) de uma chave ou None"""
+        with self._lock:
+            return self._values.get(key)
+
+    def store(self, key, value, updated_at):
+        with self._lock:
+            self._values[key] = (value, updated_at)
+
+    def acquire_lease(self, name, owner, ttl):
+        """Adquire ou renova o lease `name` para `owner` por `ttl` segundos"""
+        now = time.time()
+        with self._lock:
+            current = self._leases.get(name)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            current = self._leases.get(name)
+            if current and current[0] == owner:
+                del self._leases[name]
+
+class SQLiteCacheBackend:
+    """Backend compartilhado em arquivo SQLite (instâncias no mesmo host/volume)"""
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_values (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_leases (
+                    name TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        # Uma conexão por operação: conexões sqlite3 não podem ser usadas entre threads
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None)
+
+    def load(self, key):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value, updated_at FROM cache_values WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def store(self, key, value, updated_at):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO cache_values (key, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                WHERE excluded.updated_at >= cache_values.updated_at
+            """, (key, json.dumps(value, ensure_ascii=False, default=str), updated_at))
+        finally:
+            conn.close()
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM cache_leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("""
+                INSERT INTO cache_leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            """, (name, owner, now + ttl))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+    def release_lease(self, name, owner):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM cache_leases WHERE name = ? AND owner = ?", (name, owner))
+        finally:
+            conn.close()
+
+class RedisCacheBackend:
+    """Backend compartilhado em servidor com protocolo Redis (Memorystore ou redis local)"""
+
+    shared = True
+
+    KEY_PREFIX = 'dashboard-cache:'
+
+    # Renova o lease apenas se ainda pertence ao mesmo dono
+    RENEW_LEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('pexpire', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    RELEASE_LEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=5, decode_responses=True)
+        self._client.ping()
+
+    def load(self, key):
+        raw = self._client.get(self.KEY_PREFIX + key)
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        return payload['value'], payload['updated_at']
+
+    def store(self, key, value, updated_at):
+        payload = json.dumps({'value': value, 'updated_at': updated_at}, ensure_ascii=False, default=str)
+        self._client.set(self.KEY_PREFIX + key, payload)
+
+    def acquire_lease(self, name, owner, ttl):
+        lease_key = self.KEY_PREFIX + 'lease:' + name
+        ttl_ms = int(ttl * 1000)
+        if self._client.set(lease_key, owner, nx=True, px=ttl_ms):
+            return True
+        return bool(self._client.eval(self.RENEW_LEASE_SCRIPT, 1, lease_key, owner, ttl_ms))
+
+    def release_lease(self, name, owner):
+        self._client.eval(self.RELEASE_LEASE_SCRIPT, 1, self.KEY_PREFIX + 'lease:' + name, owner)
+
+def create_cache_backend():
+    """Cria o backend configurado em CACHE_BACKEND (volta para memória, com [ERRO], em caso de erro)"""
+    backend_name = os.getenv('CACHE_BACKEND', 'memory').lower()
+
+    try:
+        if backend_name == 'sqlite':
+            path = os.getenv('CACHE_SQLITE_PATH', '/tmp/dashboard_cache.sqlite3')
+            backend = SQLiteCacheBackend(path)
+            print(f"[CACHE] Backend SQLite compartilhado: {path}")
+            return backend
+        if backend_name == 'redis':
+            url = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+            backend = RedisCacheBackend(url)
+            print("[CACHE] Backend Redis compartilhado conectado")
+            return backend
+        if backend_name != 'memory':
+            raise ValueError("backend desconhecido (use 'memory', 'sqlite' ou 'redis')")
+    except Exception as e:
+        # Um backend compartilhado foi pedido explicitamente: sem ele cada
+        # instância recalcula o cache sozinha, o que não deve passar despercebido
+        print(f"[ERRO] Erro ao inicializar backend de cache '{backend_name}': {e}")
+        print("[ERRO] Cache compartilhado indisponivel: esta instancia usa cache apenas em memoria")
+
+    return MemoryCacheBackend()
@@ -1,173 +1,304 @@
 """
 Gerenciador de cache centralizado
+
+Registra as chaves do dashboard no cache (utils.cache) e mantém a thread que
+recalcula em background as chaves expiradas. Com backend compartilhado, só a
+instância que detém o lease recalcula; as outras sincronizam a cada ciclo.
 """
+import os
+import sys
+import atexit
+import signal
 import threading
 import time
+from functools import partial
 from datetime import datetime
+from utils.cache import (
+    register_cache_key,
+    register_cache_stage,
+    refresh_keys,
+    update_refresh_leadership,
+    release_refresh_lease,
+    sync_from_backend,
+    save_cache_snapshot,
+    load_cache_snapshot
+)
+from utils.destaques import DESTAQUES_CACHE_KEYS, compute_all_destaques
+from utils.revenue_rollup import update_revenue_rollup
+from utils.stages import register_stage_index
 
-# Cache em memória para todos os dados do dashboard
-_data_cache = {
-    'revenue': None,
-    'revenue_today': None,
-    'pipeline_today': None,
-    'hall_evs': None,
-    'hall_sdrs_new': None,
-    'hall_sdrs_expansao': None,
-    'hall_ldrs': None,
-    'destaques_evs_semana_new': None,
-    'destaques_evs_semana_expansao': None,
-    'destaques_evs_mes_new': None,
-    'destaques_evs_mes_expansao': None,
-    'destaques_sdrs_semana_new': None,
-    'destaques_sdrs_semana_expansao': None,
-    'destaques_sdrs_mes_new': None,
-    'destaques_sdrs_mes_expansao': None,
-    'destaques_ldrs_semana_new': None,
-    'destaques_ldrs_semana_expansao': None,
-    'destaques_ldrs_mes_new': None,
-    'destaques_ldrs_mes_expansao': None,
-    'top_evs_today': None,
-    'top_sdrs_today_new': None,
-    'top_sdrs_today_expansao': None,
-    'top_ldrs_today': None,
-    'last_update': None,
-    'is_updating': False
-}
+# Intervalo em segundos entre verificações de chaves expiradas
+CACHE_TICK_INTERVAL = int(os.getenv('CACHE_TICK_INTERVAL', '30'))
 
-_cache_lock = threading.Lock()
-CACHE_UPDATE_INTERVAL = 600  # 10 minutos em segundos
+# Intervalo em segundos entre gravações do snapshot em disco
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv('CACHE_SNAPSHOT_INTERVAL', '300'))
 
-def get_cache():
-    """Retorna o dicionário de cache"""
-    return _data_cache
+# Janela em segundos para agrupar eventos antes do recálculo (rajadas de deals
+# geram um único recálculo; também dá tempo da sincronização HubSpot → banco)
+CACHE_EVENT_DEBOUNCE = float(os.getenv('CACHE_EVENT_DEBOUNCE', '15'))
 
-def get_cache_lock():
-    """Retorna o lock do cache"""
-    return _cache_lock
+# Chaves do dashboard: (chave, rota interna, parâmetros, TTL em segundos, timeout em segundos)
+CACHE_KEYS = [
+    ('revenue', '/api/revenue', {}, 600, 60),
+    ('revenue_current', '/api/revenue', {'month': 'current'}, 600, 60),
+    ('revenue_december', '/api/revenue', {'month': 'december'}, 600, 60),
+    ('revenue_today', '/api/revenue/today', {}, 300, 60),
+    ('revenue_series', '/api/revenue/series', {}, 600, 60),
+    ('revenue_series_pipelines', '/api/revenue/series', {'byPipeline': 'true'}, 600, 60),
+    ('pipeline_today', '/api/pipeline/today', {}, 300, 30),
+    ('hall_evs', '/api/hall-da-fama/evs-realtime', {}, 300, 60),
+    ('hall_sdrs_new', '/api/hall-da-fama/sdrs-realtime', {'pipeline': '6810518'}, 300, 60),
+    ('hall_sdrs_expansao', '/api/hall-da-fama/sdrs-realtime', {'pipeline': '4007305'}, 300, 60),
+    ('hall_ldrs', '/api/hall-da-fama/ldrs-realtime', {}, 300, 60),
+    ('top_evs_today', '/api/top-evs-today', {}, 300, 30),
+    ('top_sdrs_today_new', '/api/top-sdrs-today', {'pipeline': '6810518'}, 300, 30),
+    ('top_sdrs_today_expansao', '/api/top-sdrs-today', {'pipeline': '4007305'}, 300, 30),
+    ('top_ldrs_today', '/api/top-ldrs-today', {}, 300, 30),
+]
 
-def get_cache_interval():
-    """Retorna o intervalo de atualização do cache"""
-    return CACHE_UPDATE_INTERVAL
+# Chaves afetadas por cada tipo de evento
+CACHE_EVENT_KEYS = {
+    'deal_won': [
+        'revenue_rollup',
+        'revenue',
+        'revenue_current',
+        'revenue_december',
+        'revenue_today',
+        'revenue_series',
+        'revenue_series_pipelines',
+        'pipeline_today',
+        'hall_evs',
+        'hall_ldrs',
+        'top_evs_today',
+        'top_ldrs_today',
+        'destaques'
+    ],
+    # Gravação ou recarga de data/manual_revenue_config.json (utils.config_store)
+    'config_manual_revenue': [
+        'revenue',
+        'revenue_current',
+        'revenue_december',
+        'revenue_today',
+        'revenue_series',
+        'revenue_series_pipelines'
+    ],
+}
 
-def refresh_data_cache(app):
-    """Atualiza todos os dados do cache fazendo requisições HTTP internas"""
-    global _data_cache
-    
-    with _cache_lock:
-        if _data_cache['is_updating']:
-            print("[CACHE] Cache ja esta sendo atualizado, pulando...")
-            return
-        
-        _data_cache['is_updating'] = True
+# Estado da thread de atualização (exposto em /api/debug/cache)
+_loop_status = {
+    'started': False,
+    'ticks': 0,
+    'last_tick_started': None,
+    'last_tick_finished': None,
+    'last_tick_duration': None,
+    'max_tick_duration': None
+}
+
+_pending_event_keys = set()
+_event_timer = None
+_event_lock = threading.Lock()
+
+def fetch_endpoint(app, path, **params):
+    """Busca o JSON de uma rota interna da aplicação (usado como função de atualização)"""
+    with app.test_client() as client:
+        resp = client.get(path, query_string=params)
+        if resp.status_code != 200:
+            raise RuntimeError(f"{path} retornou status {resp.status_code}")
+        return resp.get_json()
+
+def register_dashboard_cache_keys(app):
+    """Registra as chaves do dashboard com suas rotas, TTLs e timeouts"""
+    for key, path, params, ttl, timeout in CACHE_KEYS:
+        register_cache_key(key, ttl=ttl, refresh=partial(fetch_endpoint, app, path), params=params, timeout=timeout)
     
+    # Destaques: uma etapa calcula as doze combinações período × pipeline × perfil
+    register_cache_stage('destaques', DESTAQUES_CACHE_KEYS, compute_all_destaques, ttl=600, timeout=180)
+
+    # Rollup diário de receita: atualizado apenas aqui (e no evento deal_won);
+    # as rotas de receita só o leem
+    register_cache_key('revenue_rollup', ttl=60, refresh=update_revenue_rollup, timeout=300)
+
+    # Classificação dos stages usada nos filtros das consultas de deals
+    register_stage_index()
+
+def refresh_data_cache(only_stale=False):
+    """Atualiza as chaves do cache em paralelo e registra o tempo total"""
+    start_time = time.time()
+    refreshed, failed = refresh_keys(only_stale=only_stale)
+    if not refreshed:
+        return
+
+    elapsed = time.time() - start_time
+    if failed:
+        print(f"[AVISO] Cache atualizado em {elapsed:.2f}s com falhas em: {', '.join(failed)}")
+    else:
+        print(f"[OK] Cache atualizado com sucesso em {elapsed:.2f}s ({len(refreshed)} chaves)")
+
+def cache_tick(only_stale=True):
+    """
+    Um ciclo do cache: copia os valores mais novos do backend compartilhado
+    (gravados por outras instâncias) e, se esta instância for líder, recalcula
+    as chaves expiradas.
+    """
+    synced = sync_from_backend()
+    if synced:
+        print(f"[CACHE] {synced} chaves sincronizadas do backend compartilhado")
+
+    if update_refresh_leadership():
+        refresh_data_cache(only_stale=only_stale)
+
+def _run_tick(only_stale=True):
+    """Executa um ciclo registrando início, fim e duração"""
+    start_time = time.time()
+    _loop_status['last_tick_started'] = start_time
+    try:
+        cache_tick(only_stale=only_stale)
+    finally:
+        duration = round(time.time() - start_time, 3)
+        _loop_status['ticks'] += 1
+        _loop_status['last_tick_finished'] = time.time()
+        _loop_status['last_tick_duration'] = duration
+        _loop_status['max_tick_duration'] = max(duration, _loop_status['max_tick_duration'] or 0)
+
+def get_refresh_loop_status():
+    """
+    Estado da thread de atualização.
+
+    lag é quanto o próximo ciclo está atrasado em relação ao esperado (fim do
+    último ciclo + CACHE_TICK_INTERVAL): cresce com ciclos lentos ou se a
+    thread parou.
+    """
+    status = dict(_loop_status)
+    status['tick_interval'] = CACHE_TICK_INTERVAL
+
+    last_finished = status['last_tick_finished']
+    if last_finished is None:
+        status['lag'] = None
+    else:
+        status['lag'] = round(max(0, time.time() - last_finished - CACHE_TICK_INTERVAL), 1)
+
+    for field in ('last_tick_started', 'last_tick_finished'):
+        if status[field] is not None:
+            status[field] = datetime.fromtimestamp(status[field]).isoformat()
+    return status
+
+def _flush_cache_events():
+    """Recalcula as chaves acumuladas pelos eventos da janela"""
+    global _event_timer
+    with _event_lock:
+        keys = sorted(_pending_event_keys)
+        _pending_event_keys.clear()
+        _event_timer = None
+
+    if not keys:
+        return
+
     try:
-        print("[CACHE] Iniciando atualizacao do cache centralizado...")
         start_time = time.time()
-        
-        with app.test_client() as client:
-            # Endpoints principais
-            try:
-                resp = client.get('/api/revenue')
-                if resp.status_code == 200:
-                    _data_cache['revenue'] = resp.get_json()
-            except Exception as e:
-                print(f"[AVISO] Erro ao buscar revenue: {e}")
-            
-            try:
-                resp = client.get('/api/revenue/today')
-                if resp.status_code == 200:
-                    _data_cache['revenue_today'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar revenue_today: {e}")
-            
-            try:
-                resp = client.get('/api/pipeline/today')
-                if resp.status_code == 200:
-                    _data_cache['pipeline_today'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar pipeline_today: {e}")
-            
-            # Hall da Fama
-            try:
-                resp = client.get('/api/hall-da-fama/evs-realtime')
-                if resp.status_code == 200:
-                    _data_cache['hall_evs'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar hall_evs: {e}")
-            
-            try:
-                resp = client.get('/api/hall-da-fama/sdrs-realtime?pipeline=6810518')
-                if resp.status_code == 200:
-                    _data_cache['hall_sdrs_new'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar hall_sdrs_new: {e}")
-            
-            try:
-                resp = client.get('/api/hall-da-fama/sdrs-realtime?pipeline=4007305')
-                if resp.status_code == 200:
-                    _data_cache['hall_sdrs_expansao'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar hall_sdrs_expansao: {e}")
-            
-            try:
-                resp = client.get('/api/hall-da-fama/ldrs-realtime')
-                if resp.status_code == 200:
-                    _data_cache['hall_ldrs'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar hall_ldrs: {e}")
-            
-            # Top rankings
-            try:
-                resp = client.get('/api/top-evs-today')
-                if resp.status_code == 200:
-                    _data_cache['top_evs_today'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar top_evs_today: {e}")
-            
-            try:
-                resp = client.get('/api/top-sdrs-today?pipeline=6810518')
-                if resp.status_code == 200:
-                    _data_cache['top_sdrs_today_new'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar top_sdrs_today_new: {e}")
-            
-            try:
-                resp = client.get('/api/top-sdrs-today?pipeline=4007305')
-                if resp.status_code == 200:
-                    _data_cache['top_sdrs_today_expansao'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar top_sdrs_today_expansao: {e}")
-            
-            try:
-                resp = client.get('/api/top-ldrs-today')
-                if resp.status_code == 200:
-                    _data_cache['top_ldrs_today'] = resp.get_json()
-            except Exception as e:
-                print(f"⚠️ Erro ao buscar top_ldrs_today: {e}")
-        
-        _data_cache['last_update'] = datetime.now().isoformat()
+        # As rotas de receita só leem o rollup: atualiza-o antes delas
+        refreshed, failed = [], []
+        if 'revenue_rollup' in keys:
+            keys.remove('revenue_rollup')
+            refreshed, failed = refresh_keys(['revenue_rollup'])
+        more_refreshed, more_failed = refresh_keys(keys)
+        refreshed, failed = refreshed + more_refreshed, failed + more_failed
         elapsed = time.time() - start_time
-        print(f"[OK] Cache atualizado com sucesso em {elapsed:.2f}s")
-        
+        if failed:
+            print(f"[AVISO] Recalculo por evento em {elapsed:.2f}s com falhas em: {', '.join(failed)}")
+        else:
+            print(f"[OK] Recalculo por evento concluido em {elapsed:.2f}s ({len(refreshed)} chaves)")
     except Exception as e:
-        print(f"[ERRO] Erro ao atualizar cache: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        with _cache_lock:
-            _data_cache['is_updating'] = False
+        print(f"[ERRO] Erro ao recalcular cache por evento: {e}")
+
+def notify_cache_event(event, immediate=False):
+    """
+    Agenda o recálculo das chaves afetadas por um evento (ex.: 'deal_won').
+
+    Eventos recebidos dentro da janela CACHE_EVENT_DEBOUNCE são agrupados em
+    um único recálculo. O recálculo é feito por esta instância mesmo sem o lease:
+    o resultado é publicado no backend e chega às demais no próximo ciclo.
+
+    Args:
+        immediate: Se True, recalcula sem aguardar a janela (ex.: mudança de
+                   configuração feita por um usuário)
+    """
+    global _event_timer
+    keys = CACHE_EVENT_KEYS.get(event)
+    if not keys:
+        print(f"[AVISO] Evento de cache desconhecido: {event}")
+        return
+
+    with _event_lock:
+        _pending_event_keys.update(keys)
+        if immediate and _event_timer is not None:
+            _event_timer.cancel()
+            _event_timer = None
+        if _event_timer is None:
+            _event_timer = threading.Timer(0 if immediate else CACHE_EVENT_DEBOUNCE, _flush_cache_events)
+            _event_timer.daemon = True
+            _event_timer.start()
+
+def shutdown_cache():
+    """Grava o snapshot e libera o lease (executado no encerramento do processo)"""
+    saved = save_cache_snapshot()
+    if saved:
+        print(f"[CACHE] Snapshot salvo no encerramento ({saved} chaves)")
+    release_refresh_lease()
+
+def _install_sigterm_handler():
+    """
+    Converte SIGTERM (enviado pelo Cloud Run ao encerrar a instância) em saída
+    normal do processo, para que os handlers do atexit sejam executados.
+    """
+    previous_handler = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+        sys.exit(0)
+
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        # signal.signal só pode ser chamado na thread principal
+        print("[AVISO] Handler de SIGTERM nao instalado (fora da thread principal)")
 
 def start_cache_refresh_thread(app):
-    """Inicia thread em background para atualizar cache periodicamente"""
+    """Registra as chaves e inicia thread em background que recalcula as chaves expiradas"""
+    register_dashboard_cache_keys(app)
+
+    # Serve o último snapshot até a primeira atualização terminar
+    restored = load_cache_snapshot()
+    if restored:
+        print(f"[CACHE] {restored} chaves restauradas do snapshot (marcadas como expiradas)")
+
+    atexit.register(shutdown_cache)
+    _install_sigterm_handler()
+
     def refresh_loop():
+        _loop_status['started'] = True
         time.sleep(5)
-        refresh_data_cache(app)
-        
+        try:
+            _run_tick(only_stale=False)
+            save_cache_snapshot()
+        except Exception as e:
+            print(f"[ERRO] Erro ao atualizar cache: {e}")
+            import traceback
+            traceback.print_exc()
+        last_snapshot = time.time()
+
         while True:
-            time.sleep(CACHE_UPDATE_INTERVAL)
-            refresh_data_cache(app)
-    
+            time.sleep(CACHE_TICK_INTERVAL)
+            try:
+                _run_tick()
+                if time.time() - last_snapshot >= CACHE_SNAPSHOT_INTERVAL:
+                    save_cache_snapshot()
+                    last_snapshot = time.time()
+            except Exception as e:
+                print(f"[ERRO] Erro ao atualizar cache: {e}")
+                import traceback
+                traceback.print_exc()
+
     thread = threading.Thread(target=refresh_loop, daemon=True)
     thread.start()
-    print(f"[OK] Thread de atualizacao de cache iniciada (intervalo: {CACHE_UPDATE_INTERVAL}s)")
-
+    print(f"[OK] Thread de atualizacao de cache iniciada (verificacao a cada {CACHE_TICK_INTERVAL}s)")
@@ -0,0 +1,151 @@
+"""
+Configurações do dashboard em arquivos JSON (pasta data/)
+
+Cada configuração é lida e interpretada uma única vez e mantida em memória; a
+leitura só compara o mtime do arquivo com o da última carga (sem lock) e o
+arquivo é recarregado apenas quando ele muda. Gravações (save_config) e
+recargas incrementam a versão da configuração e agendam o recálculo das
+chaves de cache que dependem dela.
+"""
+import os
+import json
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+# Arquivo, valor padrão e evento de cache (utils.cache_manager.CACHE_EVENT_KEYS)
+# disparado quando a configuração muda
+CONFIGS = {
+    'manual_revenue': {
+        'file': 'manual_revenue_config.json',
+        'default': {'enabled': False, 'additionalValue': 0, 'includeRenewalPipeline': False},
+        'event': 'config_manual_revenue'
+    },
+    'manual_goal': {
+        'file': 'manual_goal_config.json',
+        'default': {'enabled': False, 'goalValue': 1500000},
+        'event': None
+    },
+    'celebration_theme': {
+        'file': 'celebration_theme_config.json',
+        'default': {'theme': 'black-november'},
+        'event': None
+    },
+    'themes': {
+        'file': 'themes_config.json',
+        'default': {'themes': {}, 'default_theme': 'natal'},
+        'event': None
+    }
+}
+
+class _LoadedConfig:
+    """Configuração carregada (substituída inteira a cada recarga)"""
+
+    def __init__(self, data, mtime, version):
+        self.data = data
+        self.mtime = mtime
+        self.version = version
+
+_loaded = {}
+_reload_lock = threading.Lock()
+
+def get_config_path(name):
+    """Caminho do arquivo de uma configuração"""
+    return os.path.join(DATA_DIR, CONFIGS[name]['file'])
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _notify_change(name):
+    """Agenda o recálculo das chaves de cache que dependem da configuração"""
+    event = CONFIGS[name]['event']
+    if not event:
+        return
+    # Import local: utils.cache_manager importa os módulos que usam as configurações
+    from utils.cache_manager import notify_cache_event
+    notify_cache_event(event, immediate=True)
+
+def _reload(name, mtime, force=False):
+    """Lê o arquivo e substitui a configuração em memória"""
+    with _reload_lock:
+        current = _loaded.get(name)
+        if not force and current is not None and current.mtime == mtime:
+            return current
+
+        path = get_config_path(name)
+        data = CONFIGS[name]['default']
+        if mtime is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"[AVISO] Erro ao carregar configuracao {name}: {e}")
+                # Mantém a versão anterior até o arquivo mudar de novo
+                if current is not None:
+                    _loaded[name] = _LoadedConfig(current.data, mtime, current.version)
+                    return _loaded[name]
+
+        version = current.version + 1 if current is not None else 1
+        loaded = _LoadedConfig(data, mtime, version)
+        _loaded[name] = loaded
+
+    if current is not None:
+        print(f"[OK] Configuracao {name} recarregada (versao {version})")
+        _notify_change(name)
+    return loaded
+
+def _get_loaded(name):
+    mtime = _file_mtime(get_config_path(name))
+    loaded = _loaded.get(name)
+    if loaded is None or loaded.mtime != mtime:
+        loaded = _reload(name, mtime)
+    return loaded
+
+def get_config(name):
+    """
+    Retorna uma configuração (recarrega o arquivo se ele mudou).
+
+    O dict retornado é compartilhado entre as requisições e não deve ser
+    modificado; use save_config para alterar a configuração.
+    """
+    return _get_loaded(name).data
+
+def get_config_version(name):
+    """Versão atual de uma configuração (incrementada a cada mudança)"""
+    return _get_loaded(name).version
+
+def save_config(name, data):
+    """
+    Grava uma configuração e recarrega a versão em memória.
+
+    A gravação é atômica (arquivo temporário + os.replace), para que leituras
+    simultâneas nunca vejam um JSON incompleto.
+
+    Raises:
+        PermissionError, OSError: se o arquivo não puder ser gravado
+    """
+    path = get_config_path(name)
+    os.makedirs(os.path.dirname(path), mode=0o777, exist_ok=True)
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+    try:
+        os.chmod(path, 0o666)
+    except Exception as chmod_error:
+        print(f"Aviso: Não foi possível alterar permissões do arquivo: {chmod_error}")
+
+    return _reload(name, _file_mtime(path), force=True).version
+
+def get_config_status():
+    """Versão e mtime das configurações carregadas (para debug)"""
+    return {
+        name: {'version': loaded.version, 'mtime': loaded.mtime}
+        for name, loaded in list(_loaded.items())
+    }
@@ -1,16 +1,34 @@
 """
 Utilitários para manipulação de datas e timezones
+
+Os períodos do dashboard (hoje, ontem, semana, mês) são dias do horário de
+Brasília (GMT-3, sem horário de verão desde 2019). As consultas SQL recebem os
+limites já convertidos para UTC, como intervalos [start, end), e comparam
+direto com as colunas indexadas (ex.: closedate >= %(start)s AND
+closedate < %(end)s) em vez de aplicar DATE(coluna - INTERVAL '3 hour') em
+cada linha.
 """
-from datetime import datetime, timezone, timedelta
+from collections import namedtuple
+from datetime import datetime, date, timezone, timedelta
 
 BRAZIL_TZ_OFFSET = timedelta(hours=-3)
 
+# Intervalo [start, end) em UTC
+TimeWindow = namedtuple('TimeWindow', ['start', 'end'])
+
+BRAZIL_PERIODS = ('today', 'yesterday', 'week', 'month')
+
+def get_today_brazil():
+    """Retorna a data de hoje no Brasil"""
+    return (datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET).date()
+
+def get_brazil_day_start_utc(day):
+    """Retorna o início de um dia no Brasil (00:00 GMT-3) em UTC"""
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc) - BRAZIL_TZ_OFFSET
+
 def get_today_brazil_start_utc():
     """Retorna o início do dia no Brasil (00:00 GMT-3) convertido para UTC"""
-    now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-    today_brazil_start = now_brazil.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_brazil_start_utc = today_brazil_start - BRAZIL_TZ_OFFSET
-    return today_brazil_start_utc
+    return get_brazil_day_start_utc(get_today_brazil())
 
 def convert_utc_to_brazil(dt_utc):
     """Converte datetime UTC para horário do Brasil (GMT-3)"""
@@ -23,25 +41,74 @@ def parse_hubspot_timestamp(timestamp):
     except:
         return datetime.fromtimestamp(int(timestamp) / 1000, tz=timezone.utc)
 
+def _week_start(day):
+    """Domingo da semana de um dia"""
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+def get_next_month_start(day):
+    """Primeiro dia do mês seguinte"""
+    if day.month == 12:
+        return date(day.year + 1, 1, 1)
+    return date(day.year, day.month + 1, 1)
+
 def get_week_start_brazil_utc():
     """Retorna o início da semana (domingo 00:00 GMT-3) convertido para UTC"""
-    now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-    days_since_sunday = (now_brazil.weekday() + 1) % 7
-    
-    if days_since_sunday == 0:
-        week_start_brazil = now_brazil.replace(hour=0, minute=0, second=0, microsecond=0)
-    else:
-        week_start_brazil = now_brazil - timedelta(days=days_since_sunday)
-        week_start_brazil = week_start_brazil.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    week_start_utc = week_start_brazil - BRAZIL_TZ_OFFSET
-    return week_start_utc
+    return get_brazil_day_start_utc(_week_start(get_today_brazil()))
 
 def get_month_start_brazil_utc():
     """Retorna o início do mês atual no Brasil (00:00 GMT-3) convertido para UTC"""
-    now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-    month_start_brazil = now_brazil.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_start_utc = month_start_brazil - BRAZIL_TZ_OFFSET
-    return month_start_utc
+    return get_brazil_day_start_utc(get_today_brazil().replace(day=1))
+
+def get_brazil_date_range_window(start_day, end_day, naive=False):
+    """
+    Intervalo em UTC que cobre os dias do Brasil de start_day (inclusive) até
+    end_day (exclusive).
+
+    Args:
+        naive: Remove o tzinfo dos limites. Use para colunas TIMESTAMP sem fuso
+               gravadas em UTC (deals.closedate, deals.data_de_agendamento,
+               badges_desbloqueados.unlocked_at); colunas TIMESTAMPTZ recebem os
+               limites com fuso
+    """
+    start = get_brazil_day_start_utc(start_day)
+    end = get_brazil_day_start_utc(end_day)
+    if naive:
+        start, end = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    return TimeWindow(start, end)
+
+def get_brazil_window(period, naive=False, today=None):
+    """
+    Intervalo [start, end) em UTC de um período do horário de Brasília.
+
+    Args:
+        period: 'today', 'yesterday', 'week' (a partir de domingo) ou 'month'
+        naive: Ver get_brazil_date_range_window
+        today: Data de referência no Brasil (padrão: hoje)
+
+    Returns:
+        TimeWindow(start, end)
+    """
+    today = today or get_today_brazil()
+    if period == 'today':
+        start_day, end_day = today, today + timedelta(days=1)
+    elif period == 'yesterday':
+        start_day, end_day = today - timedelta(days=1), today
+    elif period == 'week':
+        start_day = _week_start(today)
+        end_day = start_day + timedelta(days=7)
+    elif period == 'month':
+        start_day = today.replace(day=1)
+        end_day = get_next_month_start(start_day)
+    else:
+        raise ValueError(f"Periodo invalido: {period}")
+    return get_brazil_date_range_window(start_day, end_day, naive=naive)
 
+def get_brazil_windows(naive=False, today=None):
+    """
+    Intervalos de todos os períodos, calculados com a mesma data de referência.
 
+    Returns:
+        dict {período: TimeWindow} para today, yesterday, week e month
+    """
+    today = today or get_today_brazil()
+    return {period: get_brazil_window(period, naive=naive, today=today) for period in BRAZIL_PERIODS}
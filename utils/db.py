@@ -2,10 +2,17 @@
 Utilitários para gerenciamento de banco de dados
 """
 import os
+import sys
+import time
+import threading
 import psycopg2
+from datetime import datetime
 from psycopg2 import pool
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
+from psycopg2.extras import RealDictCursor
 from contextlib import contextmanager
 from dotenv import load_dotenv
+from utils.query_profiler import ProfilingConnection, QUERY_PROFILER_ENABLED
 
 load_dotenv()
 
@@ -14,76 +21,281 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Pool de conexões compartilhado
 _db_pool = None
 
-def init_db_pool():
-    """Inicializa o pool de conexões PostgreSQL com SSL"""
-    global _db_pool
-    if _db_pool is None:
+DB_POOL_MINCONN = int(os.getenv('DB_POOL_MINCONN', '2'))
+DB_POOL_MAXCONN = int(os.getenv('DB_POOL_MAXCONN', '50'))
+
+# Conexões mais antigas que isso (segundos) são fechadas e substituídas
+DB_CONN_MAX_AGE = float(os.getenv('DB_CONN_MAX_AGE', '1800'))
+
+# Conexões ociosas há mais que isso (segundos) são testadas com SELECT 1 antes
+# de serem entregues (o Cloud SQL derruba conexões ociosas e em failovers)
+DB_CONN_PING_IDLE = float(os.getenv('DB_CONN_PING_IDLE', '30'))
+
+# Tentativas de obter uma conexão válida antes de desistir
+DB_CHECKOUT_ATTEMPTS = 3
+
+# Espera em segundos antes de tentar criar o pool de novo após uma falha
+# (dobra a cada falha seguida, até DB_INIT_MAX_BACKOFF)
+DB_INIT_BACKOFF = 5
+DB_INIT_MAX_BACKOFF = 300
+
+# Tentativas do aquecimento em background (warm_up_db_pool)
+DB_WARMUP_ATTEMPTS = 10
+
+_init_lock = threading.Lock()
+_init_failures = 0
+_next_init_attempt = 0
+
+# Métricas do pool (ver get_pool_status)
+_stats_lock = threading.Lock()
+_pool_stats = {
+    'checkouts': 0,
+    'failures': 0,
+    'exhausted': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0,
+    'hold_total': 0.0,
+    'hold_max': 0.0,
+    'in_use_max': 0,
+    'stale_discarded': 0,
+    'recycled': 0,
+    'read_retries': 0,
+    'last_failure': None,
+    'last_failure_at': None
+}
+_caller_stats = {}
+
+# Conexões emprestadas: id(conn) -> (chamador, início do empréstimo)
+_checked_out = {}
+
+# Abertura e último uso de cada conexão do pool: id(conn) -> timestamp
+_conn_opened_at = {}
+_conn_last_used = {}
+
+# Uso do banco pela requisição atual da thread (ver start_request_db_stats)
+_request_stats = threading.local()
+
+def _create_db_pool():
+    """Cria o pool de conexões PostgreSQL com SSL (abre minconn conexões)"""
+    # Configuração SSL para criptografia em trânsito
+    ssl_params = {
+        'sslmode': 'require'  # Padrão: SSL sem verificação de certificado
+    }
+    
+    # Tenta encontrar certificado CA (prioridade: Secret Manager > arquivo local)
+    ssl_cert_path = None
+    
+    # 1. Verifica se tem certificado no Secret Manager (Cloud Run)
+    ssl_cert_content = os.getenv('CLOUD_SQL_CA_CERT')
+    if ssl_cert_content:
+        # Escrever certificado em arquivo temporário
+        ssl_cert_path = '/tmp/server-ca.pem'
+        try:
+            with open(ssl_cert_path, 'w') as f:
+                f.write(ssl_cert_content)
+            print("[SSL] Certificado CA obtido do Secret Manager")
+        except Exception as cert_error:
+            print(f"[AVISO] Erro ao escrever certificado do Secret Manager: {cert_error}")
+            ssl_cert_path = None
+    
+    # 2. Se não tiver no Secret Manager, verifica arquivo local (desenvolvimento)
+    if not ssl_cert_path:
+        local_cert_path = os.path.join(BASE_DIR, 'certs', 'server-ca.pem')
+        if os.path.exists(local_cert_path):
+            ssl_cert_path = local_cert_path
+            print("[SSL] Certificado CA encontrado localmente")
+    
+    # 3. Se encontrou certificado, usar verificação
+    if ssl_cert_path:
         try:
-            # Configuração SSL para criptografia em trânsito
             ssl_params = {
-                'sslmode': 'require'  # Padrão: SSL sem verificação de certificado
+                'sslmode': 'verify-ca',  # Verifica certificado do servidor
+                'sslrootcert': ssl_cert_path
             }
-            
-            # Tenta encontrar certificado CA (prioridade: Secret Manager > arquivo local)
-            ssl_cert_path = None
-            
-            # 1. Verifica se tem certificado no Secret Manager (Cloud Run)
-            ssl_cert_content = os.getenv('CLOUD_SQL_CA_CERT')
-            if ssl_cert_content:
-                # Escrever certificado em arquivo temporário
-                ssl_cert_path = '/tmp/server-ca.pem'
-                try:
-                    with open(ssl_cert_path, 'w') as f:
-                        f.write(ssl_cert_content)
-                    print("[SSL] Certificado CA obtido do Secret Manager")
-                except Exception as cert_error:
-                    print(f"[AVISO] Erro ao escrever certificado do Secret Manager: {cert_error}")
-                    ssl_cert_path = None
-            
-            # 2. Se não tiver no Secret Manager, verifica arquivo local (desenvolvimento)
-            if not ssl_cert_path:
-                local_cert_path = os.path.join(BASE_DIR, 'certs', 'server-ca.pem')
-                if os.path.exists(local_cert_path):
-                    ssl_cert_path = local_cert_path
-                    print("[SSL] Certificado CA encontrado localmente")
-            
-            # 3. Se encontrou certificado, usar verificação
-            if ssl_cert_path:
-                try:
-                    ssl_params = {
-                        'sslmode': 'verify-ca',  # Verifica certificado do servidor
-                        'sslrootcert': ssl_cert_path
-                    }
-                    print("[SSL] SSL configurado com verificação de certificado CA")
-                except Exception as cert_error:
-                    print(f"[AVISO] Erro ao configurar certificado CA: {cert_error}")
-                    print("[AVISO] Continuando com sslmode=require (sem verificação)")
-            else:
-                print("[SSL] SSL configurado sem verificação de certificado (sslmode=require)")
-            
-            _db_pool = pool.ThreadedConnectionPool(
-                minconn=2,  # Mínimo de 2 conexões sempre disponíveis
-                maxconn=50,  # Máximo de 50 conexões simultâneas
-                host=os.getenv('PG_HOST'),
-                port=os.getenv('PG_PORT'),
-                database=os.getenv('PG_DATABASE_HUBSPOT'),
-                user=os.getenv('PG_USER'),
-                password=os.getenv('PG_PASSWORD'),
-                **ssl_params  # Adiciona parâmetros SSL
-            )
-            print("[OK] Pool de conexoes PostgreSQL inicializado com SSL (min: 2, max: 50)")
+            print("[SSL] SSL configurado com verificação de certificado CA")
+        except Exception as cert_error:
+            print(f"[AVISO] Erro ao configurar certificado CA: {cert_error}")
+            print("[AVISO] Continuando com sslmode=require (sem verificação)")
+    else:
+        print("[SSL] SSL configurado sem verificação de certificado (sslmode=require)")
+    
+    # Cursores medem cada consulta (ver utils.query_profiler)
+    profiler_params = {'connection_factory': ProfilingConnection} if QUERY_PROFILER_ENABLED else {}
+    
+    return pool.ThreadedConnectionPool(
+        minconn=DB_POOL_MINCONN,  # Conexões ociosas mantidas abertas
+        maxconn=DB_POOL_MAXCONN,  # Máximo de conexões simultâneas
+        host=os.getenv('PG_HOST'),
+        port=os.getenv('PG_PORT'),
+        database=os.getenv('PG_DATABASE_HUBSPOT'),
+        user=os.getenv('PG_USER'),
+        password=os.getenv('PG_PASSWORD'),
+        **ssl_params,  # Adiciona parâmetros SSL
+        **profiler_params
+    )
+
+def is_db_disabled():
+    """True se o banco foi desligado por DB_DISABLED (scripts, testes, ferramentas)"""
+    return os.getenv('DB_DISABLED', '').lower() in ('1', 'true', 'yes')
+
+def init_db_pool():
+    """
+    Inicializa o pool de conexões PostgreSQL com SSL (na primeira chamada).
+    
+    Chamado sob demanda por get_db_connection; importar este módulo não abre
+    conexões. Com DB_DISABLED=1 retorna None sem tentar conectar. Depois de
+    uma falha, novas tentativas aguardam um intervalo crescente (até
+    DB_INIT_MAX_BACKOFF segundos) em vez de repetir a conexão a cada requisição.
+    """
+    global _db_pool, _init_failures, _next_init_attempt
+    if _db_pool is not None:
+        return _db_pool
+    if is_db_disabled():
+        return None
+    
+    with _init_lock:
+        if _db_pool is not None or time.time() < _next_init_attempt:
+            return _db_pool
+        try:
+            _db_pool = _create_db_pool()
+            _init_failures = 0
+            print(f"[OK] Pool de conexoes PostgreSQL inicializado com SSL (min: {DB_POOL_MINCONN}, max: {DB_POOL_MAXCONN})")
         except Exception as e:
-            print(f"[ERRO] Erro ao inicializar pool de conexoes: {e}")
+            _init_failures += 1
+            backoff = min(DB_INIT_BACKOFF * 2 ** (_init_failures - 1), DB_INIT_MAX_BACKOFF)
+            _next_init_attempt = time.time() + backoff
+            print(f"[ERRO] Erro ao inicializar pool de conexoes: {e} (nova tentativa em {backoff:.0f}s)")
             _db_pool = None
     return _db_pool
 
-# Inicializa o pool quando o módulo é carregado
-init_db_pool()
+def warm_up_db_pool():
+    """
+    Inicializa o pool em background, sem bloquear a subida da aplicação.
+    
+    O pool abre minconn conexões ao ser criado, então as primeiras requisições
+    já encontram conexões prontas. Em caso de falha, tenta de novo respeitando
+    o backoff de init_db_pool, até DB_WARMUP_ATTEMPTS vezes.
+    """
+    if is_db_disabled():
+        print("[AVISO] Banco desligado (DB_DISABLED), pool nao sera inicializado")
+        return None
+    
+    def warm_up():
+        for attempt in range(DB_WARMUP_ATTEMPTS):
+            if init_db_pool() is not None:
+                return
+            time.sleep(max(0, _next_init_attempt - time.time()))
+        print(f"[AVISO] Pool de conexoes nao inicializado apos {DB_WARMUP_ATTEMPTS} tentativas")
+    
+    thread = threading.Thread(target=warm_up, daemon=True, name='db-pool-warmup')
+    thread.start()
+    return thread
+
+
+def _get_caller():
+    """Função (módulo.função) que pediu a conexão, fora deste módulo e do contextlib"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != __file__ and not filename.endswith('contextlib.py'):
+            return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'desconhecido'
+
+def _record_failure(error, wait):
+    exhausted = isinstance(error, pool.PoolError) and 'exhausted' in str(error)
+    with _stats_lock:
+        _pool_stats['failures'] += 1
+        if exhausted:
+            _pool_stats['exhausted'] += 1
+        _pool_stats['wait_total'] += wait
+        _pool_stats['last_failure'] = str(error)
+        _pool_stats['last_failure_at'] = time.time()
+    request_stats = getattr(_request_stats, 'value', None)
+    if request_stats is not None:
+        request_stats['failures'] += 1
+        request_stats['wait'] += wait
+
+def _record_checkout(conn, caller, wait):
+    with _stats_lock:
+        _checked_out[id(conn)] = (caller, time.time())
+        _pool_stats['checkouts'] += 1
+        _pool_stats['wait_total'] += wait
+        _pool_stats['wait_max'] = max(_pool_stats['wait_max'], wait)
+        _pool_stats['in_use_max'] = max(_pool_stats['in_use_max'], len(_checked_out))
+    request_stats = getattr(_request_stats, 'value', None)
+    if request_stats is not None:
+        request_stats['checkouts'] += 1
+        request_stats['wait'] += wait
+
+def _record_checkin(conn):
+    with _stats_lock:
+        checkout = _checked_out.pop(id(conn), None)
+        if checkout is None:
+            return
+        caller, started = checkout
+        hold = time.time() - started
+        _pool_stats['hold_total'] += hold
+        _pool_stats['hold_max'] = max(_pool_stats['hold_max'], hold)
+
+        stats = _caller_stats.get(caller)
+        if stats is None:
+            stats = _caller_stats[caller] = {'checkouts': 0, 'hold_total': 0.0, 'hold_max': 0.0}
+        stats['checkouts'] += 1
+        stats['hold_total'] += hold
+        stats['hold_max'] = max(stats['hold_max'], hold)
+    request_stats = getattr(_request_stats, 'value', None)
+    if request_stats is not None:
+        request_stats['hold'] += hold
+
+def _forget_connection(conn):
+    _conn_opened_at.pop(id(conn), None)
+    _conn_last_used.pop(id(conn), None)
+
+def _discard_connection(conn):
+    """Fecha uma conexão e a retira do pool"""
+    _forget_connection(conn)
+    try:
+        _db_pool.putconn(conn, close=True)
+    except Exception as e:
+        print(f"[AVISO] Erro ao descartar conexao: {e}")
+
+def _check_connection(conn):
+    """
+    Verifica se uma conexão do pool pode ser entregue.
+
+    Returns:
+        None se a conexão está boa, ou o motivo para descartá-la
+        ('stale' = quebrada, 'recycled' = passou de DB_CONN_MAX_AGE)
+    """
+    if conn.closed or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN:
+        return 'stale'
+
+    now = time.time()
+    opened_at = _conn_opened_at.setdefault(id(conn), now)
+    if now - opened_at > DB_CONN_MAX_AGE:
+        return 'recycled'
+
+    last_used = _conn_last_used.get(id(conn))
+    if last_used is not None and now - last_used > DB_CONN_PING_IDLE:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+        except Exception:
+            return 'stale'
+    return None
 
 def get_db_connection():
     """
     Obtém uma conexão do pool de conexões PostgreSQL.
     
+    Conexões quebradas (ex.: derrubadas pelo Cloud SQL enquanto ociosas) ou
+    mais antigas que DB_CONN_MAX_AGE são descartadas e substituídas antes de
+    serem entregues.
+    
     IMPORTANTE: A conexão deve ser devolvida ao pool usando putconn() após o uso.
     Para uso seguro, prefira usar get_db_connection_context() que gerencia automaticamente.
     
@@ -97,12 +309,29 @@ def get_db_connection():
     if _db_pool is None:
         return None
     
-    try:
-        conn = _db_pool.getconn()
-        return conn
-    except Exception as e:
-        print(f"[ERRO] Erro ao obter conexao do pool: {e}")
-        return None
+    start_time = time.time()
+    for attempt in range(DB_CHECKOUT_ATTEMPTS):
+        try:
+            conn = _db_pool.getconn()
+        except Exception as e:
+            _record_failure(e, time.time() - start_time)
+            print(f"[ERRO] Erro ao obter conexao do pool: {e}")
+            return None
+        
+        reason = _check_connection(conn)
+        if reason is None:
+            _record_checkout(conn, _get_caller(), time.time() - start_time)
+            return conn
+        
+        with _stats_lock:
+            _pool_stats['stale_discarded' if reason == 'stale' else 'recycled'] += 1
+        if reason == 'stale':
+            print(f"[AVISO] Conexao quebrada descartada do pool (tentativa {attempt + 1})")
+        _discard_connection(conn)
+    
+    _record_failure(RuntimeError('nenhuma conexao valida no pool'), time.time() - start_time)
+    print("[ERRO] Nenhuma conexao valida obtida do pool")
+    return None
 
 def put_db_connection(conn):
     """
@@ -113,10 +342,15 @@ def put_db_connection(conn):
     """
     global _db_pool
     if _db_pool and conn:
+        _record_checkin(conn)
+        _conn_last_used[id(conn)] = time.time()
         try:
             _db_pool.putconn(conn)
         except Exception as e:
             print(f"[AVISO] Erro ao devolver conexao ao pool: {e}")
+        # O pool fecha as conexões excedentes (além de minconn) e as quebradas
+        if conn.closed:
+            _forget_connection(conn)
 
 @contextmanager
 def get_db_connection_context():
@@ -129,6 +363,9 @@ def get_db_connection_context():
                 cursor = conn.cursor()
                 cursor.execute("SELECT ...")
                 result = cursor.fetchall()
+    
+    Para consultas somente de leitura, run_read_only também repete a consulta
+    uma vez se a conexão cair no meio dela.
     """
     conn = get_db_connection()
     try:
@@ -137,22 +374,126 @@ def get_db_connection_context():
         if conn:
             put_db_connection(conn)
 
+def is_connection_error(error, conn):
+    """True se o erro indica que a conexão caiu (e não um erro da consulta)"""
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)) and bool(conn.closed)
+
+def run_read_only(operation):
+    """
+    Executa operation(conn) com uma conexão do pool, repetindo uma vez com
+    outra conexão se a primeira cair durante a execução.
+    
+    Use apenas para leituras: a operação pode ser executada duas vezes.
+    
+    Returns:
+        Resultado de operation, ou None se não houver conexão disponível
+    
+    Raises:
+        A exceção de operation, se não for queda de conexão ou se a segunda
+        tentativa também falhar
+    """
+    for attempt in range(2):
+        with get_db_connection_context() as conn:
+            if not conn:
+                return None
+            try:
+                return operation(conn)
+            except Exception as e:
+                if attempt == 0 and is_connection_error(e, conn):
+                    with _stats_lock:
+                        _pool_stats['read_retries'] += 1
+                    print(f"[AVISO] Conexao caiu durante leitura, repetindo: {e}")
+                    continue
+                raise
+
+def read_query(query, params=None, fetch='all'):
+    """
+    Executa uma consulta somente de leitura via run_read_only.
+    
+    Args:
+        fetch: 'all' (lista de linhas) ou 'one' (uma linha)
+    
+    Returns:
+        Linhas como dicts (RealDictCursor), ou None se não houver conexão
+    """
+    def operation(conn):
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        result = cursor.fetchone() if fetch == 'one' else cursor.fetchall()
+        cursor.close()
+        return result
+    return run_read_only(operation)
+
+def start_request_db_stats():
+    """Começa a contabilizar o uso do pool pela requisição da thread atual"""
+    _request_stats.value = {'checkouts': 0, 'failures': 0, 'wait': 0.0, 'hold': 0.0}
+
+def get_request_db_stats():
+    """Uso do pool pela requisição atual (None se não iniciado)"""
+    return getattr(_request_stats, 'value', None)
+
 def get_pool_status():
     """
     Retorna informações sobre o status do pool de conexões.
     Útil para debug e monitoramento.
+    
+    Inclui conexões em uso e ociosas, tempo para obter uma conexão (wait),
+    tempo com a conexão emprestada (hold) por função chamadora e falhas
+    (exhausted = todas as DB_POOL_MAXCONN conexões em uso).
     """
     global _db_pool
     if _db_pool is None:
-        return {'status': 'not_initialized'}
+        return {
+            'status': 'disabled' if is_db_disabled() else 'not_initialized',
+            'init_failures': _init_failures,
+            'next_init_attempt': datetime.fromtimestamp(_next_init_attempt).isoformat() if _next_init_attempt else None
+        }
     
     try:
+        now = time.time()
+        with _stats_lock:
+            stats = dict(_pool_stats)
+            checked_out = list(_checked_out.values())
+            callers = {caller: dict(values) for caller, values in _caller_stats.items()}
+        # Ociosas: conexões abertas acompanhadas pelo módulo (_conn_opened_at,
+        # a partir do primeiro empréstimo) que não estão emprestadas
+        idle = max(0, len(_conn_opened_at) - len(checked_out))
+        
+        checkouts = stats['checkouts']
+        attempts = checkouts + stats['failures']
+        for values in callers.values():
+            values['hold_avg'] = round(values['hold_total'] / values['checkouts'], 4)
+            values['hold_total'] = round(values['hold_total'], 3)
+            values['hold_max'] = round(values['hold_max'], 4)
+        
+        # Conexões emprestadas agora, da mais antiga para a mais recente
+        in_use = [
+            {'caller': caller, 'held_for': round(now - started, 3)}
+            for caller, started in sorted(checked_out, key=lambda item: item[1])
+        ]
+        
         return {
-            'status': 'active',
-            'minconn': 2,
-            'maxconn': 50,
-            'note': 'Use get_db_connection_context() para garantir devolução automática'
+            'status': 'closed' if _db_pool.closed else 'active',
+            'minconn': _db_pool.minconn,
+            'maxconn': _db_pool.maxconn,
+            'in_use': len(in_use),
+            'idle': idle,
+            'in_use_max': stats['in_use_max'],
+            'stale_discarded': stats['stale_discarded'],
+            'recycled': stats['recycled'],
+            'read_retries': stats['read_retries'],
+            'max_age': DB_CONN_MAX_AGE,
+            'ping_idle': DB_CONN_PING_IDLE,
+            'checkouts': checkouts,
+            'failures': stats['failures'],
+            'exhausted': stats['exhausted'],
+            'last_failure': stats['last_failure'],
+            'last_failure_at': stats['last_failure_at'] and datetime.fromtimestamp(stats['last_failure_at']).isoformat(),
+            'wait_avg': round(stats['wait_total'] / attempts, 4) if attempts else None,
+            'wait_max': round(stats['wait_max'], 4),
+            'hold_max': round(stats['hold_max'], 4),
+            'connections': in_use,
+            'callers': dict(sorted(callers.items(), key=lambda item: item[1]['hold_total'], reverse=True))
         }
     except Exception as e:
         return {'status': 'error', 'error': str(e)}
-
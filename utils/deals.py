@@ -4,59 +4,117 @@ Funções auxiliares para gerenciamento de deals e notificações
 import json
 from utils.db import get_db_connection_context
 from utils.mappings import normalize_product_name
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+# Inserção atômica: notificações já existentes (reentregas do HubSpot) são
+# ignoradas pelo ON CONFLICT e não aparecem no RETURNING
+INSERT_NOTIFICATIONS_QUERY = """
+    INSERT INTO deal_notifications (
+        id, deal_name, amount, owner_name, sdr_name, ldr_name,
+        company_name, pipeline, deal_stage, payload
+    ) VALUES %s
+    ON CONFLICT (id) DO NOTHING
+    RETURNING id
+"""
+
+def _notification_row(notification):
+    return (
+        notification.get('id'),
+        notification.get('dealName'),
+        notification.get('amount'),
+        notification.get('ownerName'),
+        notification.get('sdrName'),
+        notification.get('ldrName'),
+        notification.get('companyName'),
+        notification.get('pipeline'),
+        notification.get('dealStage'),
+        json.dumps(notification)
+    )
 
 def insert_notification_db(notification):
     """
-    Tenta inserir a notificação no banco.
+    Tenta inserir a notificação no banco (um único INSERT ... ON CONFLICT DO NOTHING).
     Retorna:
         - 'inserted': Se inseriu uma nova notificação
         - 'exists': Se a notificação já existia (duplicado)
         - False: Se houve erro/conexão
     """
+    result = insert_notifications_bulk([notification])
+    if result is None:
+        return False
+    if result['inserted']:
+        return 'inserted'
+    print(f"⚠️ Deal {notification.get('id')} já existe no banco, ignorando duplicado")
+    return 'exists'
+
+def insert_notifications_bulk(notifications):
+    """
+    Insere várias notificações em um único INSERT (ex.: reprocessar webhooks perdidos).
+    
+    Returns:
+        dict com as listas de IDs 'inserted' (novas) e 'duplicates' (já existiam,
+        ou repetidas na lista), ou None se houve erro/conexão
+    """
+    rows = {}
+    duplicates = []
+    for notification in notifications:
+        notification_id = notification.get('id')
+        if notification_id in rows:
+            duplicates.append(notification_id)
+        else:
+            rows[notification_id] = _notification_row(notification)
+    if not rows:
+        return {'inserted': [], 'duplicates': duplicates}
+
     with get_db_connection_context() as conn:
         if not conn:
-            return False
+            return None
 
         try:
             cursor = conn.cursor()
-            # Primeiro verifica se já existe
-            check_query = "SELECT id FROM deal_notifications WHERE id = %s"
-            cursor.execute(check_query, (notification.get('id'),))
-            exists = cursor.fetchone()
-            
-            if exists:
-                print(f"⚠️ Deal {notification.get('id')} já existe no banco, ignorando duplicado")
-                cursor.close()
-                return 'exists'
-            
-            # Se não existe, insere
-            query = """
-            INSERT INTO deal_notifications (
-                id, deal_name, amount, owner_name, sdr_name, ldr_name,
-                company_name, pipeline, deal_stage, payload
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(query, (
-                notification.get('id'),
-                notification.get('dealName'),
-                notification.get('amount'),
-                notification.get('ownerName'),
-                notification.get('sdrName'),
-                notification.get('ldrName'),
-                notification.get('companyName'),
-                notification.get('pipeline'),
-                notification.get('dealStage'),
-                json.dumps(notification)
-            ))
+            result = execute_values(cursor, INSERT_NOTIFICATIONS_QUERY, list(rows.values()), page_size=len(rows), fetch=True)
             conn.commit()
             cursor.close()
-            return 'inserted'
         except Exception as e:
             print(f"Erro ao inserir notificação no banco: {e}")
-            return False
+            conn.rollback()
+            return None
+
+    inserted = {row[0] for row in result}
+    return {
+        'inserted': [notification_id for notification_id in rows if notification_id in inserted],
+        'duplicates': duplicates + [notification_id for notification_id in rows if notification_id not in inserted]
+    }
 
-def fetch_pending_notifications_db(client_id=None, since_timestamp=None, limit=100):
+# Inicia o high-water mark do painel com o relógio do servidor: no primeiro
+# poll do painel (ou de cada carregamento da página, com session_start) as
+# notificações já existentes contam como vistas, como o painel faz com o since
+SEED_HIGH_WATER_MARK_QUERY = """
+    INSERT INTO notification_clients (client_id, high_water_mark, updated_at)
+    VALUES (%s, now(), now())
+    ON CONFLICT (client_id) DO NOTHING
+"""
+
+RESET_HIGH_WATER_MARK_QUERY = """
+    INSERT INTO notification_clients (client_id, high_water_mark, updated_at)
+    VALUES (%s, now(), now())
+    ON CONFLICT (client_id) DO UPDATE SET
+        high_water_mark = GREATEST(notification_clients.high_water_mark, EXCLUDED.high_water_mark),
+        updated_at = now()
+    RETURNING high_water_mark
+"""
+
+def _prune_notification_views(cursor, client_id, mark):
+    """Remove as visualizações do cliente que ficaram abaixo do high-water mark"""
+    cursor.execute("""
+        DELETE FROM notification_views v
+        USING deal_notifications n
+        WHERE v.client_id = %s
+            AND n.id = v.notification_id
+            AND n.created_at <= %s
+    """, (client_id, mark))
+
+def fetch_pending_notifications_db(client_id=None, since_timestamp=None, limit=100, session_start=False):
     """
     Busca notificações pendentes no banco.
     
@@ -64,6 +122,8 @@ def fetch_pending_notifications_db(client_id=None, since_timestamp=None, limit=1
         client_id: ID do cliente para filtrar notificações não vistas por ele
         since_timestamp: Timestamp ISO 8601 para filtrar apenas notificações criadas APÓS esse momento
         limit: Número máximo de notificações a retornar
+        session_start: Primeiro poll após o carregamento da página; avança o
+                       high-water mark do cliente até agora (relógio do servidor)
     
     Returns:
         Lista de notificações no formato esperado pelo frontend ou None em caso de erro/conexão.
@@ -74,23 +134,41 @@ def fetch_pending_notifications_db(client_id=None, since_timestamp=None, limit=1
 
         try:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+            if client_id:
+                if session_start:
+                    cursor.execute(RESET_HIGH_WATER_MARK_QUERY, (client_id,))
+                    _prune_notification_views(cursor, client_id, cursor.fetchone()['high_water_mark'])
+                else:
+                    cursor.execute(SEED_HIGH_WATER_MARK_QUERY, (client_id,))
+                conn.commit()
             
             # Monta a query dinamicamente baseado nos filtros
-            query_base = "SELECT id, payload, created_at FROM deal_notifications WHERE 1=1"
+            query_base = "SELECT n.id, n.payload, n.created_at FROM deal_notifications n WHERE 1=1"
             params = []
             
-            # Filtro por client_id (notificações não vistas por esse cliente)
+            # Filtro por client_id (notificações não vistas por esse cliente): só
+            # as criadas após o high-water mark do cliente, sem visualização registrada
             if client_id:
-                query_base += " AND NOT (viewed_by @> ARRAY[%s]::text[])"
-                params.append(client_id)
+                query_base += """
+                    AND n.created_at > COALESCE(
+                        (SELECT high_water_mark FROM notification_clients WHERE client_id = %s),
+                        '-infinity'
+                    )
+                    AND NOT EXISTS (
+                        SELECT 1 FROM notification_views v
+                        WHERE v.client_id = %s AND v.notification_id = n.id
+                    )
+                """
+                params.extend([client_id, client_id])
             
             # Filtro por timestamp (notificações criadas APÓS esse momento)
             if since_timestamp:
-                query_base += " AND created_at > %s::timestamptz"
+                query_base += " AND n.created_at > %s::timestamptz"
                 params.append(since_timestamp)
             
             # Ordena por mais recentes primeiro e aplica limite
-            query_base += " ORDER BY created_at DESC LIMIT %s"
+            query_base += " ORDER BY n.created_at DESC LIMIT %s"
             params.append(limit)
             
             cursor.execute(query_base, tuple(params))
@@ -123,10 +201,44 @@ def fetch_pending_notifications_db(client_id=None, since_timestamp=None, limit=1
             return notifications
         except Exception as e:
             print(f"Erro ao buscar notificações no banco: {e}")
+            conn.rollback()
             return None
 
+# Avança o high-water mark do cliente até a notificação mais recente antes da
+# primeira ainda não vista (todas até ele foram vistas). A busca começa no mark
+# atual (iniciado pelo relógio do servidor no primeiro poll), nunca do início
+# da tabela; sem mark registrado não há o que avançar
+ADVANCE_HIGH_WATER_MARK_QUERY = """
+    WITH current_mark AS (
+        SELECT high_water_mark AS mark
+        FROM notification_clients
+        WHERE client_id = %(client_id)s
+    ),
+    first_unviewed AS (
+        SELECT n.created_at
+        FROM deal_notifications n, current_mark
+        WHERE n.created_at > current_mark.mark
+            AND NOT EXISTS (
+                SELECT 1 FROM notification_views v
+                WHERE v.client_id = %(client_id)s AND v.notification_id = n.id
+            )
+        ORDER BY n.created_at
+        LIMIT 1
+    )
+    SELECT MAX(n.created_at) AS mark
+    FROM deal_notifications n, current_mark
+    WHERE n.created_at > current_mark.mark
+        AND n.created_at < COALESCE((SELECT created_at FROM first_unviewed), 'infinity')
+"""
+
 def mark_notification_viewed_db(deal_id, client_id):
-    """Marca a notificação como vista para o client_id no banco. Retorna True se atualizou, False se não encontrou/erro."""
+    """
+    Marca a notificação como vista para o client_id no banco. Retorna True se atualizou, False se não encontrou/erro.
+    
+    Registra a visualização em notification_views e avança o high-water mark do
+    cliente (notification_clients), removendo as visualizações que ficaram
+    abaixo dele; assim a busca de pendentes só olha as notificações recentes.
+    """
     if not client_id:
         return False
 
@@ -136,19 +248,31 @@ def mark_notification_viewed_db(deal_id, client_id):
 
         try:
             cursor = conn.cursor()
-            # Adiciona ao array apenas se ainda não existir
-            query = """
-            UPDATE deal_notifications
-            SET viewed_by = array_append(viewed_by, %s)
-            WHERE id = %s AND NOT (viewed_by @> ARRAY[%s]::text[])
-            """
-            cursor.execute(query, (client_id, deal_id, client_id))
+            # Registra apenas se a notificação existir e ainda não tiver sido vista
+            cursor.execute("""
+                INSERT INTO notification_views (client_id, notification_id)
+                SELECT %s, id FROM deal_notifications WHERE id = %s
+                ON CONFLICT DO NOTHING
+            """, (client_id, deal_id))
             updated = cursor.rowcount
+
+            if updated > 0:
+                cursor.execute(ADVANCE_HIGH_WATER_MARK_QUERY, {'client_id': client_id})
+                mark = cursor.fetchone()[0]
+                if mark is not None:
+                    cursor.execute("""
+                        INSERT INTO notification_clients (client_id, high_water_mark, updated_at)
+                        VALUES (%s, %s, now())
+                        ON CONFLICT (client_id) DO UPDATE SET
+                            high_water_mark = GREATEST(notification_clients.high_water_mark, EXCLUDED.high_water_mark),
+                            updated_at = now()
+                    """, (client_id, mark))
+                    _prune_notification_views(cursor, client_id, mark)
+
             conn.commit()
             cursor.close()
             return updated > 0
         except Exception as e:
             print(f"Erro ao marcar notificação como vista no banco: {e}")
+            conn.rollback()
             return False
-
-
@@ -0,0 +1,304 @@
+"""
+Funções auxiliares para destaques (MVPs da semana e do mês)
+
+Os doze destaques (período × pipeline × perfil) são calculados a partir de
+duas buscas por pipeline no HubSpot: deals ganhos (EVs e LDRs) e agendamentos
+(SDRs), cobrindo desde o início da semana ou do mês, o que vier primeiro.
+"""
+import os
+import time
+import requests
+from datetime import datetime, timezone
+from utils.mappings import get_analyst_name
+from utils.datetime_utils import (
+    get_week_start_brazil_utc,
+    get_month_start_brazil_utc,
+    parse_hubspot_timestamp,
+    convert_utc_to_brazil
+)
+
+HUBSPOT_SEARCH_URL = 'https://api.hubapi.com/crm/v3/objects/deals/search'
+
+# Deal ID a ser excluído (gambiarra temporária)
+EXCLUDED_DEAL_ID = '34863967009'
+
+# Configuração por pipeline: stage de ganho e propriedades de data
+PIPELINES = {
+    '6810518': {
+        'name': 'NEW',
+        'slug': 'new',
+        'won_stage': '6810524',
+        'won_property': 'hs_v2_date_entered_6810524',
+        'scheduled_property': 'hs_v2_date_entered_7417230'
+    },
+    '4007305': {
+        'name': 'Expansão',
+        'slug': 'expansao',
+        'won_stage': '13487286',
+        'won_property': 'hs_v2_date_entered_13487286',
+        'scheduled_property': 'hs_v2_date_entered_13487283'
+    }
+}
+
+PERIODOS = {
+    'semana': 'Semana',
+    'mes': 'Mês'
+}
+
+ROLES = ['evs', 'sdrs', 'ldrs']
+
+def get_destaques_cache_key(role, periodo, pipeline):
+    """Nome da chave de cache de um destaque (ex.: destaques_evs_semana_new)"""
+    return f"destaques_{role}_{periodo}_{PIPELINES[pipeline]['slug']}"
+
+DESTAQUES_CACHE_KEYS = [
+    get_destaques_cache_key(role, periodo, pipeline)
+    for role in ROLES
+    for periodo in PERIODOS
+    for pipeline in PIPELINES
+]
+
+def get_period_start_utc(periodo):
+    """Retorna o início do período ('semana' ou 'mes') em UTC"""
+    if periodo == 'semana':
+        return get_week_start_brazil_utc()
+    return get_month_start_brazil_utc()
+
+def _hubspot_headers():
+    return {
+        'Authorization': f"Bearer {os.getenv('HUBSPOT_PRIVATE_APP_TOKEN')}",
+        'Content-Type': 'application/json'
+    }
+
+def fetch_all_deals(url, headers, payload_base, strict=False):
+    """
+    Função auxiliar para buscar deals com paginação
+    
+    Args:
+        strict: Se True, levanta exceção em erro da API em vez de retornar parcial
+    """
+    deals = []
+    after = None
+    while True:
+        payload = payload_base.copy()
+        if after:
+            payload["after"] = after
+
+        response = requests.post(url, headers=headers, json=payload, timeout=30)
+        if response.status_code == 429:
+            print(f"[AVISO] Rate limit atingido, aguardando 1 segundo...")
+            time.sleep(1)
+            continue
+        elif response.status_code != 200:
+            print(f"[AVISO] Erro na API: {response.status_code} - {response.text}")
+            if strict:
+                raise RuntimeError(f"HubSpot retornou status {response.status_code}")
+            break
+
+        data = response.json()
+        results = data.get("results", [])
+        deals.extend(results)
+
+        paging = data.get("paging", {})
+        after = paging.get("next", {}).get("after")
+
+        if not after:
+            break
+
+        time.sleep(0.3)
+
+    return deals
+
+def fetch_won_deals(pipeline, start_utc, strict=False):
+    """Busca deals ganhos do pipeline desde start_utc (usados para EVs e LDRs)"""
+    config = PIPELINES[pipeline]
+    date_property = config['won_property']
+    start_ms = int(start_utc.timestamp() * 1000)
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+
+    payload = {
+        "filterGroups": [{
+            "filters": [
+                {"propertyName": "pipeline", "operator": "EQ", "value": pipeline},
+                {"propertyName": date_property, "operator": "GTE", "value": str(start_ms)},
+                {"propertyName": date_property, "operator": "LT", "value": str(now_ms)},
+                {"propertyName": "dealstage", "operator": "EQ", "value": config['won_stage']},
+                {"propertyName": "tipo_de_negociacao", "operator": "NEQ", "value": "Variação Cambial"}
+            ]
+        }],
+        "properties": ["dealname", "analista_comercial", "criado_por_", "closedate", "amount", date_property, "tipo_de_negociacao"],
+        "limit": 200
+    }
+
+    deals = fetch_all_deals(HUBSPOT_SEARCH_URL, _hubspot_headers(), payload, strict)
+    print(f"[OK] Deals ganhos ({config['name']}) encontrados: {len(deals)}")
+    return deals
+
+def fetch_scheduled_deals(pipeline, start_utc, strict=False):
+    """Busca deals agendados do pipeline desde start_utc (usados para SDRs)"""
+    config = PIPELINES[pipeline]
+    date_property = config['scheduled_property']
+    start_ms = int(start_utc.timestamp() * 1000)
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+
+    payload = {
+        "filterGroups": [{
+            "filters": [
+                {"propertyName": "pipeline", "operator": "EQ", "value": pipeline},
+                {"propertyName": date_property, "operator": "GTE", "value": str(start_ms)},
+                {"propertyName": date_property, "operator": "LT", "value": str(now_ms)}
+            ]
+        }],
+        "properties": ["dealname", "pr_vendedor", date_property],
+        "limit": 200
+    }
+
+    deals = fetch_all_deals(HUBSPOT_SEARCH_URL, _hubspot_headers(), payload, strict)
+    print(f"[OK] Deals agendados ({config['name']}) encontrados: {len(deals)}")
+    return deals
+
+def _deals_since(deals, date_property, start_utc):
+    """Filtra deals cuja propriedade de data é posterior a start_utc"""
+    filtered = []
+    for deal in deals:
+        timestamp = deal.get('properties', {}).get(date_property)
+        if timestamp and parse_hubspot_timestamp(timestamp) >= start_utc:
+            filtered.append(deal)
+    return filtered
+
+def _without_excluded(deals):
+    return [deal for deal in deals if str(deal.get('id', '')) != EXCLUDED_DEAL_ID]
+
+def build_evs_top3(deals):
+    """Top 3 EVs por receita (desempate por quantidade)"""
+    ev_stats = {}
+    for deal in _without_excluded(deals):
+        props = deal.get('properties', {})
+        owner_id = props.get('analista_comercial')
+        amount = props.get('amount', '0')
+
+        if owner_id:
+            if owner_id not in ev_stats:
+                ev_stats[owner_id] = {'count': 0, 'revenue': 0}
+
+            ev_stats[owner_id]['count'] += 1
+            ev_stats[owner_id]['revenue'] += float(amount) if amount else 0
+
+    top_evs = sorted(ev_stats.items(), key=lambda x: (x[1]['revenue'], x[1]['count']), reverse=True)
+
+    return [{
+        'position': i + 1,
+        'userId': owner_id,
+        'userName': get_analyst_name(owner_id),
+        'dealCount': stats['count'],
+        'revenue': stats['revenue']
+    } for i, (owner_id, stats) in enumerate(top_evs[:3])]
+
+def build_sdrs_top3(deals, date_property):
+    """Top 3 SDRs por agendamentos (desempate pelo último agendamento mais cedo)"""
+    sdr_stats = {}
+    for deal in _without_excluded(deals):
+        props = deal.get('properties', {})
+        sdr_id = props.get('pr_vendedor')
+        timestamp = props.get(date_property)
+
+        if sdr_id and timestamp:
+            dt_brazil = convert_utc_to_brazil(parse_hubspot_timestamp(timestamp))
+
+            if sdr_id not in sdr_stats:
+                sdr_stats[sdr_id] = {'count': 0, 'timestamps': []}
+
+            sdr_stats[sdr_id]['count'] += 1
+            sdr_stats[sdr_id]['timestamps'].append(dt_brazil)
+
+    max_datetime = datetime(9999, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
+    top_sdrs = sorted(sdr_stats.items(), key=lambda x: (-x[1]['count'], max(x[1]['timestamps']) if x[1]['timestamps'] else max_datetime))
+
+    return [{
+        'position': i + 1,
+        'userId': sdr_id,
+        'userName': get_analyst_name(sdr_id),
+        'scheduledCount': stats['count']
+    } for i, (sdr_id, stats) in enumerate(top_sdrs[:3])]
+
+def build_ldrs_top3(deals):
+    """Top 3 LDRs por deals ganhos (desempate por receita)"""
+    ldr_stats = {}
+    for deal in _without_excluded(deals):
+        props = deal.get('properties', {})
+        ldr_id = props.get('criado_por_')
+        amount = props.get('amount', '0')
+
+        if ldr_id:
+            if ldr_id not in ldr_stats:
+                ldr_stats[ldr_id] = {'count': 0, 'revenue': 0}
+
+            ldr_stats[ldr_id]['count'] += 1
+            ldr_stats[ldr_id]['revenue'] += float(amount) if amount else 0
+
+    top_ldrs = sorted(ldr_stats.items(), key=lambda x: (x[1]['count'], x[1]['revenue']), reverse=True)
+
+    return [{
+        'position': i + 1,
+        'userId': ldr_id,
+        'userName': get_analyst_name(ldr_id),
+        'wonDealsCount': stats['count'],
+        'revenue': stats['revenue']
+    } for i, (ldr_id, stats) in enumerate(top_ldrs[:3])]
+
+def _destaque_result(role, periodo, pipeline, won_deals=None, scheduled_deals=None):
+    """Monta a resposta de um destaque a partir dos deals já filtrados pelo período"""
+    if role == 'evs':
+        top3 = build_evs_top3(won_deals)
+    elif role == 'ldrs':
+        top3 = build_ldrs_top3(won_deals)
+    else:
+        top3 = build_sdrs_top3(scheduled_deals, PIPELINES[pipeline]['scheduled_property'])
+
+    return {
+        'status': 'success',
+        'periodo': PERIODOS[periodo],
+        'pipeline': PIPELINES[pipeline]['name'],
+        'top3': top3
+    }
+
+def compute_destaque(role, periodo, pipeline, strict=False):
+    """
+    Calcula um único destaque buscando no HubSpot apenas o necessário
+
+    Args:
+        strict: Se True, levanta exceção em erro da API (use para resultados
+                que vão para o cache) em vez de calcular com dados parciais
+    """
+    start_utc = get_period_start_utc(periodo)
+    if role == 'sdrs':
+        return _destaque_result(role, periodo, pipeline, scheduled_deals=fetch_scheduled_deals(pipeline, start_utc, strict))
+    return _destaque_result(role, periodo, pipeline, won_deals=fetch_won_deals(pipeline, start_utc, strict))
+
+def compute_all_destaques():
+    """
+    Calcula os doze destaques de uma vez (usado pelo cache em background).
+
+    Para cada pipeline faz uma busca de deals ganhos e uma de agendamentos desde
+    o início mais antigo entre semana e mês, e separa os períodos em memória.
+
+    Returns:
+        dict {chave de cache: resposta do destaque}
+    """
+    period_starts = {periodo: get_period_start_utc(periodo) for periodo in PERIODOS}
+    fetch_start = min(period_starts.values())
+
+    results = {}
+    for pipeline, config in PIPELINES.items():
+        won_deals = fetch_won_deals(pipeline, fetch_start, strict=True)
+        scheduled_deals = fetch_scheduled_deals(pipeline, fetch_start, strict=True)
+
+        for periodo, start_utc in period_starts.items():
+            period_won = _deals_since(won_deals, config['won_property'], start_utc)
+            period_scheduled = _deals_since(scheduled_deals, config['scheduled_property'], start_utc)
+
+            for role in ROLES:
+                key = get_destaques_cache_key(role, periodo, pipeline)
+                results[key] = _destaque_result(role, periodo, pipeline, period_won, period_scheduled)
+
+    return results
@@ -0,0 +1,246 @@
+"""
+Profiler de consultas SQL
+
+As conexões do pool (utils.db) usam ProfilingConnection: todo cursor criado
+por elas, de qualquer cursor_factory (ex.: RealDictCursor), mede o tempo de
+cada execute/executemany. As estatísticas são agrupadas por fingerprint (o
+texto da consulta normalizado, sem literais) e marcadas com o endpoint (ou a
+função) que executou a consulta.
+
+Quando uma consulta SELECT passa de SLOW_QUERY_THRESHOLD segundos, o plano
+com EXPLAIN (ANALYZE, BUFFERS) é capturado uma única vez por fingerprint, em
+background e em outra conexão, dentro de uma transação somente leitura.
+"""
+import os
+import re
+import sys
+import time
+import hashlib
+import threading
+from flask import has_request_context, request
+from psycopg2 import extensions
+
+SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', '1'))
+QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+
+# Limite de fingerprints guardados (os de menor tempo total são descartados)
+MAX_FINGERPRINTS = 500
+
+# Tempo máximo em milissegundos do EXPLAIN ANALYZE (que executa a consulta de novo)
+EXPLAIN_STATEMENT_TIMEOUT_MS = 60000
+
+# Endpoints guardados por fingerprint
+MAX_SOURCES = 10
+
+_stats_lock = threading.Lock()
+_query_stats = {}
+
+# Desliga o profiler na thread que está capturando um EXPLAIN
+_local = threading.local()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_SKIP_FILES = (__file__, os.path.join('psycopg2', 'extras.py'), os.path.join('utils', 'db.py'))
+
+def _query_text(cursor, query):
+    if isinstance(query, bytes):
+        return query.decode('utf-8', errors='replace')
+    if isinstance(query, str):
+        return query
+    try:
+        return query.as_string(cursor)  # psycopg2.sql.Composed
+    except Exception:
+        return str(query)
+
+def normalize_query(query):
+    """Texto da consulta sem literais e com espaços normalizados"""
+    normalized = _STRING_LITERAL.sub('?', query)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _IN_LIST.sub('(?)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+def _fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+def _get_source():
+    """Endpoint da requisição atual, ou a função que executou a consulta"""
+    if has_request_context():
+        return f"{request.method} {request.path}"
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.endswith(_SKIP_FILES):
+            return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'desconhecido'
+
+def _is_explainable(normalized):
+    """Só consultas de leitura: EXPLAIN ANALYZE executa a consulta de novo"""
+    lowered = normalized.lower()
+    if not lowered.startswith(('select', 'with')):
+        return False
+    return not re.search(r"\b(insert|update|delete|create|drop|alter|truncate)\b", lowered)
+
+def _evict_if_needed():
+    """Abre espaço para um novo fingerprint (chamar antes de inseri-lo)"""
+    if len(_query_stats) < MAX_FINGERPRINTS:
+        return
+    smallest = min(_query_stats, key=lambda key: _query_stats[key]['total'])
+    del _query_stats[smallest]
+
+def _record(cursor, query, params, duration, error=None):
+    text = _query_text(cursor, query)
+    normalized = normalize_query(text)
+    fingerprint = _fingerprint(normalized)
+    source = _get_source()
+    slow = duration >= SLOW_QUERY_THRESHOLD
+
+    capture_explain = False
+    with _stats_lock:
+        stats = _query_stats.get(fingerprint)
+        if stats is None:
+            _evict_if_needed()
+            stats = _query_stats[fingerprint] = {
+                'fingerprint': fingerprint,
+                'query': normalized[:2000],
+                'calls': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'slow_calls': 0,
+                'errors': 0,
+                'sources': {},
+                'last_seen': None,
+                'explain': None,
+                'explain_error': None,
+                'explain_captured_at': None,
+                'explain_duration': None
+            }
+        stats['calls'] += 1
+        stats['total'] += duration
+        stats['max'] = max(stats['max'], duration)
+        stats['last_seen'] = time.time()
+        if error is not None:
+            stats['errors'] += 1
+        if source in stats['sources'] or len(stats['sources']) < MAX_SOURCES:
+            stats['sources'][source] = stats['sources'].get(source, 0) + 1
+        if slow:
+            stats['slow_calls'] += 1
+            if stats['explain_captured_at'] is None and _is_explainable(normalized):
+                # Marca antes de capturar para não disparar dois EXPLAIN
+                stats['explain_captured_at'] = time.time()
+                capture_explain = True
+
+    if slow:
+        print(f"[AVISO] Consulta lenta ({duration:.2f}s) em {source}: {fingerprint} {normalized[:120]}")
+    if capture_explain:
+        threading.Thread(
+            target=_capture_explain,
+            args=(fingerprint, text, params),
+            daemon=True,
+            name='explain-capture'
+        ).start()
+
+def _capture_explain(fingerprint, query, params):
+    """Executa EXPLAIN (ANALYZE, BUFFERS) em outra conexão e guarda o plano"""
+    # Import local: utils.db usa este módulo na criação do pool
+    from utils.db import get_db_connection_context
+
+    _local.disabled = True
+    start_time = time.time()
+    plan, error = None, None
+    try:
+        with get_db_connection_context() as conn:
+            if not conn:
+                return
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SET TRANSACTION READ ONLY")
+                cursor.execute(f"SET LOCAL statement_timeout = {EXPLAIN_STATEMENT_TIMEOUT_MS}")
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {query}", params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                cursor.close()
+            except Exception as e:
+                error = str(e)
+            finally:
+                conn.rollback()
+    finally:
+        _local.disabled = False
+
+    with _stats_lock:
+        stats = _query_stats.get(fingerprint)
+        if stats is not None:
+            stats['explain'] = plan
+            stats['explain_error'] = error
+            stats['explain_captured_at'] = time.time()
+            stats['explain_duration'] = round(time.time() - start_time, 3)
+    if error:
+        print(f"[AVISO] Erro ao capturar EXPLAIN de {fingerprint}: {error}")
+    else:
+        print(f"[OK] EXPLAIN capturado para {fingerprint}")
+
+def _profiled_execute(method):
+    def execute(self, query, vars=None):
+        if getattr(_local, 'disabled', False):
+            return method(self, query, vars)
+        start_time = time.perf_counter()
+        error = None
+        try:
+            return method(self, query, vars)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            try:
+                _record(self, query, vars if method.__name__ == 'execute' else None, time.perf_counter() - start_time, error)
+            except Exception as record_error:
+                print(f"[AVISO] Erro no profiler de consultas: {record_error}")
+    execute.__name__ = method.__name__
+    return execute
+
+_profiled_cursor_classes = {}
+
+def profiled_cursor_class(cursor_class):
+    """Subclasse de cursor_class que mede execute e executemany"""
+    profiled = _profiled_cursor_classes.get(cursor_class)
+    if profiled is None:
+        profiled = type(f"Profiled{cursor_class.__name__}", (cursor_class,), {
+            'execute': _profiled_execute(cursor_class.execute),
+            'executemany': _profiled_execute(cursor_class.executemany)
+        })
+        _profiled_cursor_classes[cursor_class] = profiled
+    return profiled
+
+class ProfilingConnection(extensions.connection):
+    """Conexão cujos cursores medem cada consulta (ver módulo)"""
+
+    def cursor(self, *args, **kwargs):
+        cursor_factory = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = profiled_cursor_class(cursor_factory)
+        return super().cursor(*args, **kwargs)
+
+def get_slow_queries(limit=20, sort='total'):
+    """
+    Fingerprints mais caros.
+
+    Args:
+        limit: Quantidade de fingerprints
+        sort: 'total' (tempo acumulado), 'max' ou 'avg'
+    """
+    with _stats_lock:
+        queries = [dict(stats, sources=dict(stats['sources'])) for stats in _query_stats.values()]
+
+    for stats in queries:
+        stats['avg'] = round(stats['total'] / stats['calls'], 4) if stats['calls'] else 0
+        stats['total'] = round(stats['total'], 3)
+        stats['max'] = round(stats['max'], 4)
+
+    sort_key = sort if sort in ('total', 'max', 'avg') else 'total'
+    queries.sort(key=lambda stats: stats[sort_key], reverse=True)
+    return queries[:limit]
+
+def reset_query_stats():
+    """Limpa as estatísticas (os EXPLAIN voltam a ser capturados)"""
+    with _stats_lock:
+        _query_stats.clear()
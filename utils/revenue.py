@@ -1,94 +1,330 @@
 """
 Funções auxiliares para cálculos de receita
-"""
-import os
-import json
-from datetime import datetime, timezone, timedelta
-from utils.db import get_db_connection_context
-from psycopg2.extras import RealDictCursor
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MANUAL_REVENUE_CONFIG_FILE = os.path.join(BASE_DIR, 'data', 'manual_revenue_config.json')
+Todos os totais de receita (Black November, mês atual, dezembro, até ontem,
+hoje, pipeline de Renovação e faixas) saem de uma única consulta com
+agregações FILTER sobre o rollup diário (utils.revenue_rollup), ou sobre a
+tabela deals enquanto o rollup não estiver disponível. A consulta cobre só o
+mês atual; Black November e dezembro, depois de encerrados, são calculados à
+parte e guardados por mais tempo. O resultado fica no
+cache por alguns segundos e é compartilhado pelas rotas de receita. A série
+diária acumulada (get_revenue_series) lê o mesmo rollup, agrupado por dia.
+"""
+import threading
+from datetime import date, timedelta
+from utils.db import read_query
+from utils.cache import get_cache_entry, set_cached
+from utils.revenue_rollup import REVENUE_TIERS, get_revenue_rollup_state
+from utils.stages import get_revenue_stage_ids
+from utils.config_store import get_config
+from utils.datetime_utils import get_today_brazil, get_next_month_start, get_brazil_date_range_window
 
 def load_manual_revenue_config():
-    """Carrega a configuração do modo manual de faturamento"""
+    """Retorna a configuração do modo manual de faturamento (ver utils.config_store)"""
+    return get_config('manual_revenue')
+
+# Pipeline de Renovação (somado à parte quando includeRenewalPipeline está ativo)
+RENEWAL_PIPELINE_ID = '7075777'
+
+# Pipelines considerados na meta de Natal (dezembro)
+DECEMBER_PIPELINES = ('6810518', '4007305')
+
+BLACK_NOVEMBER_START = date(2025, 11, 1)
+DECEMBER_START = date(2025, 12, 1)
+
+BLACK_NOVEMBER_GOAL = 1500000
+DECEMBER_GOAL = 739014.83
+
+# Tempo em segundos em que um resultado da agregação é reaproveitado
+REVENUE_AGGREGATES_TTL = 30
+
+REVENUE_AGGREGATES_CACHE_KEY = 'revenue_aggregates'
+
+# Totais de Black November e dezembro depois que o mês terminou (mudam pouco:
+# só quando um deal antigo é editado)
+REVENUE_CLOSED_PERIODS_CACHE_KEY = 'revenue_closed_periods'
+REVENUE_CLOSED_PERIODS_TTL = 6 * 3600
+
+# Campos de AGGREGATES_SELECT de cada período fixo
+BLACK_NOVEMBER_FIELDS = ('black_november_total', 'tier_1', 'tier_2', 'tier_3', 'tier_4')
+DECEMBER_FIELDS = ('december_total',)
+
+# Receita diária por pipeline de cada mês (ex.: revenue_series_days_2025-11)
+REVENUE_SERIES_CACHE_PREFIX = 'revenue_series_days_'
+
+# Idade máxima em segundos da receita diária lida do rollup (cobre
+# reconstruções completas, que não mudam o watermark)
+REVENUE_SERIES_MAX_AGE = 600
+
+_aggregates_lock = threading.Lock()
+_series_lock = threading.Lock()
+
+# Agregação direta sobre deals (usada enquanto o rollup não está disponível).
+# Os limites *_utc são os dias do Brasil convertidos para UTC, comparados
+# direto com deals.closedate (usa idx_deals_closedate)
+DEALS_AGGREGATES_QUERY = """
+    WITH classificado AS (
+        SELECT
+            d.valor_ganho,
+            d.pipeline,
+            COALESCE(d.pipeline, '') = %(renewal_pipeline)s AS renovacao,
+            d.pipeline IS NULL AS sem_pipeline,
+            d.closedate >= %(month_start_utc)s AND d.closedate < %(month_end_utc)s AS no_mes,
+            d.closedate < %(today_start_utc)s AS antes_de_hoje,
+            d.closedate >= %(today_start_utc)s AND d.closedate < %(today_end_utc)s AS hoje,
+            d.closedate >= %(bn_start_utc)s AND d.closedate < %(bn_end_utc)s AS black_november,
+            d.closedate >= %(dec_start_utc)s AND d.closedate < %(dec_end_utc)s AS dezembro,
+            CASE WHEN d.valor_ganho >= %(tier_1)s THEN d.valor_ganho ELSE 0 END AS tier_1,
+            CASE WHEN d.valor_ganho >= %(tier_2)s THEN d.valor_ganho ELSE 0 END AS tier_2,
+            CASE WHEN d.valor_ganho >= %(tier_3)s THEN d.valor_ganho ELSE 0 END AS tier_3,
+            CASE WHEN d.valor_ganho >= %(tier_4)s THEN d.valor_ganho ELSE 0 END AS tier_4
+        FROM deals d
+        WHERE d.closedate >= %(scan_start_utc)s
+            AND d.closedate < %(scan_end_utc)s
+            AND d.dealstage = ANY(%(revenue_stages)s)
+            AND COALESCE(d.tipo_de_receita, '') <> 'Pontual'
+            AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
+            AND d.valor_ganho IS NOT NULL
+            AND d.valor_ganho > 0
+    )
+    {select}
+"""
+
+# Agregação sobre o rollup diário (custo independente do tamanho de deals)
+ROLLUP_AGGREGATES_QUERY = """
+    WITH classificado AS (
+        SELECT
+            total AS valor_ganho,
+            pipeline,
+            pipeline = %(renewal_pipeline)s AS renovacao,
+            pipeline = '' AS sem_pipeline,
+            day >= %(month_start)s AND day < %(month_end)s AS no_mes,
+            day < %(today)s AS antes_de_hoje,
+            day = %(today)s AS hoje,
+            day >= %(bn_start)s AND day < %(bn_end)s AS black_november,
+            day >= %(dec_start)s AND day < %(dec_end)s AS dezembro,
+            tier_1,
+            tier_2,
+            tier_3,
+            tier_4
+        FROM revenue_daily_rollup
+        WHERE revenue_type <> 'Pontual'
+            AND day >= %(scan_start)s
+            AND day < %(scan_end)s
+    )
+    {select}
+"""
+
+# Totais calculados sobre "classificado" (mesmo SELECT para as duas fontes).
+# Os totais sem Renovação (*_total) excluem deals sem pipeline, como o filtro
+# d.pipeline <> '7075777' fazia; eles ficam em *_no_pipeline e só entram nos
+# totais que incluem a Renovação
+AGGREGATES_SELECT = """
+    SELECT
+        COALESCE(SUM(valor_ganho) FILTER (WHERE black_november), 0) AS black_november_total,
+        COALESCE(SUM(tier_1) FILTER (WHERE black_november), 0) AS tier_1,
+        COALESCE(SUM(tier_2) FILTER (WHERE black_november), 0) AS tier_2,
+        COALESCE(SUM(tier_3) FILTER (WHERE black_november), 0) AS tier_3,
+        COALESCE(SUM(tier_4) FILTER (WHERE black_november), 0) AS tier_4,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE dezembro AND pipeline = ANY(%(december_pipelines)s)), 0) AS december_total,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE no_mes AND NOT renovacao AND NOT sem_pipeline), 0) AS month_total,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE no_mes AND renovacao), 0) AS month_renewal,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE no_mes AND sem_pipeline), 0) AS month_no_pipeline,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE no_mes AND antes_de_hoje AND NOT renovacao AND NOT sem_pipeline), 0) AS until_yesterday_total,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE no_mes AND antes_de_hoje AND renovacao), 0) AS until_yesterday_renewal,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE no_mes AND antes_de_hoje AND sem_pipeline), 0) AS until_yesterday_no_pipeline,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE hoje AND NOT renovacao AND NOT sem_pipeline), 0) AS today_total,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE hoje AND renovacao), 0) AS today_renewal,
+        COALESCE(SUM(valor_ganho) FILTER (WHERE hoje AND sem_pipeline), 0) AS today_no_pipeline
+    FROM classificado
+"""
+
+# Receita por dia × pipeline de um mês, sobre o rollup
+ROLLUP_SERIES_QUERY = """
+    SELECT day, pipeline, SUM(total) AS total
+    FROM revenue_daily_rollup
+    WHERE revenue_type <> 'Pontual'
+        AND day >= %(start)s
+        AND day < %(end)s
+    GROUP BY day, pipeline
+"""
+
+# Mesma consulta sobre deals (enquanto o rollup não está disponível)
+DEALS_SERIES_QUERY = """
+    SELECT
+        DATE(d.closedate - INTERVAL '3 hour') AS day,
+        COALESCE(d.pipeline, '') AS pipeline,
+        SUM(d.valor_ganho) AS total
+    FROM deals d
+    WHERE d.closedate >= %(start_utc)s
+        AND d.closedate < %(end_utc)s
+        AND d.dealstage = ANY(%(revenue_stages)s)
+        AND COALESCE(d.tipo_de_receita, '') <> 'Pontual'
+        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
+        AND d.valor_ganho IS NOT NULL
+        AND d.valor_ganho > 0
+    GROUP BY 1, 2
+"""
+
+def _query_aggregates(scan_start, scan_end, month_start, today, use_rollup):
+    """
+    Executa AGGREGATES_SELECT sobre os dias do Brasil em [scan_start, scan_end).
+
+    Totais cujo período fica fora da varredura saem zerados.
+
+    Returns:
+        dict {nome: total}, ou None em caso de erro
+    """
+    params = {
+        'month_start': month_start,
+        'month_end': get_next_month_start(month_start),
+        'today': today,
+        'today_start': today,
+        'bn_start': BLACK_NOVEMBER_START,
+        'bn_end': get_next_month_start(BLACK_NOVEMBER_START),
+        'dec_start': DECEMBER_START,
+        'dec_end': get_next_month_start(DECEMBER_START),
+        'renewal_pipeline': RENEWAL_PIPELINE_ID,
+        'december_pipelines': list(DECEMBER_PIPELINES),
+        'scan_start': scan_start,
+        'scan_end': scan_end,
+    }
+    params.update(REVENUE_TIERS)
+
+    if use_rollup:
+        query = ROLLUP_AGGREGATES_QUERY
+    else:
+        query = DEALS_AGGREGATES_QUERY
+        params['revenue_stages'] = get_revenue_stage_ids()
+        params['today_end'] = today + timedelta(days=1)
+        for bound in ('month', 'today', 'bn', 'dec', 'scan'):
+            window = get_brazil_date_range_window(params[f'{bound}_start'], params[f'{bound}_end'], naive=True)
+            params[f'{bound}_start_utc'], params[f'{bound}_end_utc'] = window
+
     try:
-        if os.path.exists(MANUAL_REVENUE_CONFIG_FILE):
-            with open(MANUAL_REVENUE_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {'enabled': False, 'additionalValue': 0, 'includeRenewalPipeline': False}
+        result = read_query(query.format(select=AGGREGATES_SELECT), params, fetch='one')
     except Exception as e:
-        print(f"Erro ao carregar configuração manual: {e}")
-        return {'enabled': False, 'additionalValue': 0, 'includeRenewalPipeline': False}
+        print(f"Erro ao calcular agregados de receita: {e}")
+        return None
+    if result is None:
+        return None
+    return {name: float(value or 0) for name, value in result.items()}
+
+def _closed_period_fields(month_start):
+    """Totais dos períodos fixos (Black November, dezembro) já encerrados antes de month_start"""
+    fields = []
+    if get_next_month_start(BLACK_NOVEMBER_START) <= month_start:
+        fields.extend(BLACK_NOVEMBER_FIELDS)
+    if get_next_month_start(DECEMBER_START) <= month_start:
+        fields.extend(DECEMBER_FIELDS)
+    return fields
+
+def get_closed_period_aggregates(month_start, today, use_rollup):
+    """
+    Totais de Black November e dezembro depois que esses meses terminaram.
+
+    Calculados em uma consulta própria, limitada aos meses encerrados, e
+    guardados por REVENUE_CLOSED_PERIODS_TTL segundos, para que a consulta dos
+    agregados varra apenas o mês atual.
+
+    Returns:
+        dict com os campos de _closed_period_fields (vazio se nenhum período
+        terminou), ou None em caso de erro
+    """
+    fields = _closed_period_fields(month_start)
+    if not fields:
+        return {}
+
+    source = 'rollup' if use_rollup else 'deals'
+    entry = get_cache_entry(REVENUE_CLOSED_PERIODS_CACHE_KEY)
+    if (entry is not None and entry.value
+            and entry.value['until'] == month_start.isoformat()
+            and entry.value['source'] == source
+            and entry.age() < REVENUE_CLOSED_PERIODS_TTL):
+        return entry.value['totals']
+
+    scan_start = min(BLACK_NOVEMBER_START, DECEMBER_START)
+    scan_end = min(month_start, max(get_next_month_start(BLACK_NOVEMBER_START), get_next_month_start(DECEMBER_START)))
+    result = _query_aggregates(scan_start, scan_end, month_start, today, use_rollup)
+    if result is None:
+        return None
+
+    totals = {field: result[field] for field in fields}
+    set_cached(REVENUE_CLOSED_PERIODS_CACHE_KEY, {
+        'until': month_start.isoformat(),
+        'source': source,
+        'totals': totals
+    }, publish=False)
+    return totals
+
+def compute_revenue_aggregates():
+    """
+    Calcula todos os totais de receita em uma única consulta.
+
+    Considera deals recorrentes (não 'Pontual', sem 'Variação Cambial') em
+    stages de ganho, faturamento ou aguardando, com valor_ganho > 0, usando a
+    o dia de fechamento no horário de Brasília (ver utils.datetime_utils).
+    Lê o rollup diário quando ele está pronto; senão varre a tabela deals.
+    A consulta cobre apenas o mês atual: Black November e dezembro, depois de
+    encerrados, vêm de get_closed_period_aggregates.
+
+    Returns:
+        dict com os totais (month_*, until_yesterday_* e today_* separados em
+        pipeline de Renovação e demais pipelines), ou None em caso de erro
+    """
+    today = get_today_brazil()
+    month_start = today.replace(day=1)
+
+    rollup_status = get_revenue_rollup_state()
+    use_rollup = bool(rollup_status and rollup_status['ready'])
+
+    aggregates = _query_aggregates(month_start, get_next_month_start(month_start), month_start, today, use_rollup)
+    if aggregates is None:
+        return None
+
+    closed = get_closed_period_aggregates(month_start, today, use_rollup)
+    if closed is None:
+        return None
+    aggregates.update(closed)
+
+    aggregates['date'] = today.isoformat()
+    aggregates['source'] = 'rollup' if use_rollup else 'deals'
+    return aggregates
+
+def get_revenue_aggregates():
+    """
+    Retorna os agregados de receita, reaproveitando um resultado recente.
+
+    Chamadas simultâneas (ex.: as rotas de receita recalculadas em paralelo
+    pelo cache) aguardam a mesma consulta em vez de repetir a varredura.
+    """
+    entry = get_cache_entry(REVENUE_AGGREGATES_CACHE_KEY)
+    if entry is not None and entry.value and entry.age() < REVENUE_AGGREGATES_TTL:
+        return entry.value
+
+    with _aggregates_lock:
+        entry = get_cache_entry(REVENUE_AGGREGATES_CACHE_KEY)
+        if entry is not None and entry.value and entry.age() < REVENUE_AGGREGATES_TTL:
+            return entry.value
+
+        aggregates = compute_revenue_aggregates()
+        if aggregates is not None:
+            set_cached(REVENUE_AGGREGATES_CACHE_KEY, aggregates, publish=False)
+        return aggregates
+
+def _total_result(total, goal):
+    return {
+        'total': total,
+        'goal': goal,
+        'has_data': total > 0
+    }
 
 def get_black_november_revenue():
     """Busca faturamento da Black November"""
-    with get_db_connection_context() as conn:
-        if not conn:
-            return None
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            query = """
-                WITH base AS (
-                    SELECT
-                        d.hs_object_id,
-                        d.dealname,
-                        d.pipeline,
-                        d.dealstage,
-                        d.tipo_de_negociacao,
-                        d.tipo_de_receita,
-                        d.valor_ganho,
-                        d.closedate,
-                        p.stage_label,
-                        p.deal_isclosed,
-                        p.pipeline_label
-                    FROM deals d
-                    LEFT JOIN deal_stages_pipelines p ON d.dealstage = CAST(p.stage_id AS TEXT)
-                    WHERE COALESCE(d.tipo_de_receita, '') <> 'Pontual'
-                        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
-                ),
-                enriquecido AS (
-                    SELECT
-                        *,
-                        (closedate - INTERVAL '3 hour') AS closedate_ajustada
-                    FROM base
-                ),
-                filtrado AS (
-                    SELECT *
-                    FROM enriquecido
-                    WHERE (
-                        LOWER(stage_label) LIKE '%ganho%'
-                        OR LOWER(stage_label) LIKE '%faturamento%'
-                        OR LOWER(stage_label) LIKE '%aguardando%'
-                    )
-                    AND closedate_ajustada >= DATE_TRUNC('month', '2025-11-01'::timestamp)
-                    AND closedate_ajustada < DATE_TRUNC('month', '2025-11-01'::timestamp + INTERVAL '1 month')
-                    AND valor_ganho IS NOT NULL
-                    AND valor_ganho > 0
-                )
-                SELECT 
-                    COALESCE(SUM(valor_ganho), 0) as total_revenue,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 1200000 THEN valor_ganho ELSE 0 END), 0) as tier_1,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 900000 THEN valor_ganho ELSE 0 END), 0) as tier_2,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 600000 THEN valor_ganho ELSE 0 END), 0) as tier_3,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 300000 THEN valor_ganho ELSE 0 END), 0) as tier_4
-                FROM filtrado
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if result and result['total_revenue'] and float(result['total_revenue']) > 0:
-                total = float(result['total_revenue'])
-            else:
-                total = 0.0
-            cursor.close()
-            return {
-                'total': total,
-                'goal': 1500000,
-                'has_data': total > 0
-            }
-        except Exception as e:
-            print(f"Erro ao buscar dados: {e}")
-            return None
+    aggregates = get_revenue_aggregates()
+    if aggregates is None:
+        return None
+    return _total_result(aggregates['black_november_total'], BLACK_NOVEMBER_GOAL)
 
 def get_current_month_revenue(exclude_renewal_pipeline=False):
     """
@@ -97,156 +333,21 @@ def get_current_month_revenue(exclude_renewal_pipeline=False):
     Args:
         exclude_renewal_pipeline: Se True, exclui deals do pipeline de Renovação (7075777)
     """
-    BRAZIL_TZ_OFFSET = timedelta(hours=-3)
-    now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-    current_year = now_brazil.year
-    current_month = now_brazil.month
-    
-    # Formata a data do início do mês atual no formato PostgreSQL
-    month_start_str = f"{current_year}-{current_month:02d}-01"
-    
-    # Pipeline de Renovação que deve ser excluído quando a configuração estiver desativada
-    RENEWAL_PIPELINE_ID = '7075777'
-    
-    with get_db_connection_context() as conn:
-        if not conn:
-            return None
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Adiciona filtro para excluir pipeline de renovação se necessário
-            renewal_filter = ""
-            if exclude_renewal_pipeline:
-                renewal_filter = f"AND d.pipeline <> '{RENEWAL_PIPELINE_ID}'"
-            
-            query = f"""
-                WITH base AS (
-                    SELECT
-                        d.hs_object_id,
-                        d.dealname,
-                        d.pipeline,
-                        d.dealstage,
-                        d.tipo_de_negociacao,
-                        d.tipo_de_receita,
-                        d.valor_ganho,
-                        d.closedate,
-                        p.stage_label,
-                        p.deal_isclosed,
-                        p.pipeline_label
-                    FROM deals d
-                    LEFT JOIN deal_stages_pipelines p ON d.dealstage = CAST(p.stage_id AS TEXT)
-                    WHERE COALESCE(d.tipo_de_receita, '') <> 'Pontual'
-                        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
-                        {renewal_filter}
-                ),
-                enriquecido AS (
-                    SELECT
-                        *,
-                        (closedate - INTERVAL '3 hour') AS closedate_ajustada
-                    FROM base
-                ),
-                filtrado AS (
-                    SELECT *
-                    FROM enriquecido
-                    WHERE (
-                        LOWER(stage_label) LIKE '%ganho%'
-                        OR LOWER(stage_label) LIKE '%faturamento%'
-                        OR LOWER(stage_label) LIKE '%aguardando%'
-                    )
-                    AND closedate_ajustada >= DATE_TRUNC('month', '{month_start_str}'::timestamp)
-                    AND closedate_ajustada < DATE_TRUNC('month', '{month_start_str}'::timestamp) + INTERVAL '1 month'
-                    AND valor_ganho IS NOT NULL
-                    AND valor_ganho > 0
-                )
-                SELECT 
-                    COALESCE(SUM(valor_ganho), 0) as total_revenue,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 1200000 THEN valor_ganho ELSE 0 END), 0) as tier_1,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 900000 THEN valor_ganho ELSE 0 END), 0) as tier_2,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 600000 THEN valor_ganho ELSE 0 END), 0) as tier_3,
-                    COALESCE(SUM(CASE WHEN valor_ganho >= 300000 THEN valor_ganho ELSE 0 END), 0) as tier_4
-                FROM filtrado
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if result and result['total_revenue'] and float(result['total_revenue']) > 0:
-                total = float(result['total_revenue'])
-            else:
-                total = 0.0
-            cursor.close()
-            return {
-                'total': total,
-                'goal': 1500000,  # Meta padrão, pode ser sobrescrita pela meta manual
-                'has_data': total > 0
-            }
-        except Exception as e:
-            print(f"Erro ao buscar dados do mês atual: {e}")
-            return None
+    aggregates = get_revenue_aggregates()
+    if aggregates is None:
+        return None
+    total = aggregates['month_total']
+    if not exclude_renewal_pipeline:
+        total += aggregates['month_renewal'] + aggregates['month_no_pipeline']
+    # Meta padrão, pode ser sobrescrita pela meta manual
+    return _total_result(total, BLACK_NOVEMBER_GOAL)
 
 def get_december_revenue():
     """Busca faturamento de Dezembro (Natal)"""
-    with get_db_connection_context() as conn:
-        if not conn:
-            return None
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            query = """
-                WITH base AS (
-                    SELECT
-                        d.hs_object_id,
-                        d.dealname,
-                        d.pipeline,
-                        d.dealstage,
-                        d.tipo_de_negociacao,
-                        d.tipo_de_receita,
-                        d.valor_ganho,
-                        d.closedate,
-                        p.stage_label,
-                        p.deal_isclosed,
-                        p.pipeline_label
-                    FROM deals d
-                    LEFT JOIN deal_stages_pipelines p ON d.dealstage = CAST(p.stage_id AS TEXT)
-                    WHERE COALESCE(d.tipo_de_receita, '') <> 'Pontual'
-                        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
-                        AND d.pipeline IN ('6810518', '4007305')
-                ),
-                enriquecido AS (
-                    SELECT
-                        *,
-                        (closedate - INTERVAL '3 hour') AS closedate_ajustada
-                    FROM base
-                ),
-                filtrado AS (
-                    SELECT *
-                    FROM enriquecido
-                    WHERE (
-                        LOWER(stage_label) LIKE '%ganho%'
-                        OR LOWER(stage_label) LIKE '%faturamento%'
-                        OR LOWER(stage_label) LIKE '%aguardando%'
-                    )
-                    AND closedate_ajustada >= DATE_TRUNC('month', '2025-12-01'::timestamp)
-                    AND closedate_ajustada < DATE_TRUNC('month', '2025-12-01'::timestamp + INTERVAL '1 month')
-                    AND valor_ganho IS NOT NULL
-                    AND valor_ganho > 0
-                )
-                SELECT 
-                    COALESCE(SUM(valor_ganho), 0) as total_revenue
-                FROM filtrado
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if result and result['total_revenue'] and float(result['total_revenue']) > 0:
-                total = float(result['total_revenue'])
-            else:
-                total = 0.0
-            cursor.close()
-            return {
-                'total': total,
-                'goal': 739014.83,  # Meta de Natal
-                'has_data': total > 0
-            }
-        except Exception as e:
-            print(f"Erro ao buscar dados de dezembro: {e}")
-            return None
+    aggregates = get_revenue_aggregates()
+    if aggregates is None:
+        return None
+    return _total_result(aggregates['december_total'], DECEMBER_GOAL)
 
 def get_revenue_until_yesterday(exclude_renewal_pipeline=False):
     """
@@ -255,85 +356,13 @@ def get_revenue_until_yesterday(exclude_renewal_pipeline=False):
     Args:
         exclude_renewal_pipeline: Se True, exclui deals do pipeline de Renovação (7075777)
     """
-    BRAZIL_TZ_OFFSET = timedelta(hours=-3)
-    now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-    current_year = now_brazil.year
-    current_month = now_brazil.month
-    
-    # Formata a data do início do mês atual no formato PostgreSQL
-    month_start_str = f"{current_year}-{current_month:02d}-01"
-    RENEWAL_PIPELINE_ID = '7075777'
-    
-    with get_db_connection_context() as conn:
-        if not conn:
-            return None
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Adiciona filtro para excluir pipeline de renovação se necessário
-            renewal_filter = ""
-            if exclude_renewal_pipeline:
-                renewal_filter = f"AND d.pipeline <> '{RENEWAL_PIPELINE_ID}'"
-            
-            query = f"""
-                WITH base AS (
-                    SELECT
-                        d.hs_object_id,
-                        d.dealname,
-                        d.pipeline,
-                        d.dealstage,
-                        d.tipo_de_negociacao,
-                        d.tipo_de_receita,
-                        d.valor_ganho,
-                        d.closedate,
-                        p.stage_label,
-                        p.deal_isclosed,
-                        p.pipeline_label
-                    FROM deals d
-                    LEFT JOIN deal_stages_pipelines p ON d.dealstage = CAST(p.stage_id AS TEXT)
-                    WHERE COALESCE(d.tipo_de_receita, '') <> 'Pontual'
-                        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
-                        {renewal_filter}
-                ),
-                enriquecido AS (
-                    SELECT
-                        *,
-                        (closedate - INTERVAL '3 hour') AS closedate_ajustada
-                    FROM base
-                ),
-                filtrado AS (
-                    SELECT *
-                    FROM enriquecido
-                    WHERE (
-                        LOWER(stage_label) LIKE '%ganho%'
-                        OR LOWER(stage_label) LIKE '%faturamento%'
-                        OR LOWER(stage_label) LIKE '%aguardando%'
-                    )
-                    AND closedate_ajustada >= DATE_TRUNC('month', '{month_start_str}'::timestamp)
-                    AND closedate_ajustada < DATE_TRUNC('month', '{month_start_str}'::timestamp) + INTERVAL '1 month'
-                    AND DATE(closedate_ajustada) < DATE(CURRENT_TIMESTAMP AT TIME ZONE 'America/Sao_Paulo')
-                    AND valor_ganho IS NOT NULL
-                    AND valor_ganho > 0
-                )
-                SELECT 
-                    COALESCE(SUM(valor_ganho), 0) as total_revenue
-                FROM filtrado
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if result and result['total_revenue'] and float(result['total_revenue']) > 0:
-                total = float(result['total_revenue'])
-            else:
-                total = 0.0
-            cursor.close()
-            return {
-                'total': total,
-                'goal': 1500000,
-                'has_data': total > 0
-            }
-        except Exception as e:
-            print(f"Erro ao buscar dados até ontem: {e}")
-            return None
+    aggregates = get_revenue_aggregates()
+    if aggregates is None:
+        return None
+    total = aggregates['until_yesterday_total']
+    if not exclude_renewal_pipeline:
+        total += aggregates['until_yesterday_renewal'] + aggregates['until_yesterday_no_pipeline']
+    return _total_result(total, BLACK_NOVEMBER_GOAL)
 
 def get_today_revenue(exclude_renewal_pipeline=False):
     """
@@ -342,236 +371,181 @@ def get_today_revenue(exclude_renewal_pipeline=False):
     Args:
         exclude_renewal_pipeline: Se True, exclui deals do pipeline de Renovação (7075777)
     """
-    RENEWAL_PIPELINE_ID = '7075777'
-    
-    with get_db_connection_context() as conn:
-        if not conn:
-            return None
-        try:
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Adiciona filtro para excluir pipeline de renovação se necessário
-            renewal_filter = ""
-            if exclude_renewal_pipeline:
-                renewal_filter = f"AND d.pipeline <> '{RENEWAL_PIPELINE_ID}'"
-            
-            query = f"""
-                WITH base AS (
-                    SELECT
-                        d.hs_object_id,
-                        d.dealname,
-                        d.pipeline,
-                        d.dealstage,
-                        d.tipo_de_negociacao,
-                        d.tipo_de_receita,
-                        d.valor_ganho,
-                        d.closedate,
-                        p.stage_label,
-                        p.deal_isclosed,
-                        p.pipeline_label
-                    FROM deals d
-                    LEFT JOIN deal_stages_pipelines p ON d.dealstage = CAST(p.stage_id AS TEXT)
-                    WHERE COALESCE(d.tipo_de_receita, '') <> 'Pontual'
-                        AND COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial'
-                        {renewal_filter}
-                ),
-                enriquecido AS (
-                    SELECT
-                        *,
-                        (closedate - INTERVAL '3 hour') AS closedate_ajustada
-                    FROM base
-                ),
-                filtrado AS (
-                    SELECT *
-                    FROM enriquecido
-                    WHERE (
-                        LOWER(stage_label) LIKE '%ganho%'
-                        OR LOWER(stage_label) LIKE '%faturamento%'
-                        OR LOWER(stage_label) LIKE '%aguardando%'
-                    )
-                    AND DATE(closedate_ajustada) = DATE(CURRENT_TIMESTAMP AT TIME ZONE 'America/Sao_Paulo')
-                    AND valor_ganho IS NOT NULL
-                    AND valor_ganho > 0
-                )
-                SELECT 
-                    COALESCE(SUM(valor_ganho), 0) as total_today
-                FROM filtrado
-            """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            if result and result['total_today']:
-                total_today = float(result['total_today'])
-            else:
-                total_today = 0.0
-            cursor.close()
-            return {
-                'total_today': total_today,
-                'date': datetime.now().strftime('%Y-%m-%d')
-            }
-        except Exception as e:
-            print(f"Erro ao buscar faturamento do dia: {e}")
-            return None
+    aggregates = get_revenue_aggregates()
+    if aggregates is None:
+        return None
+    total_today = aggregates['today_total']
+    if not exclude_renewal_pipeline:
+        total_today += aggregates['today_renewal'] + aggregates['today_no_pipeline']
+    return {
+        'total_today': total_today,
+        'date': aggregates['date']
+    }
 
-def get_month_start_brazil_utc():
-    """Retorna o início do mês atual (1º dia 00:00) no Brasil (GMT-3) convertido para UTC"""
-    BRAZIL_TZ_OFFSET = timedelta(hours=-3)
-    now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-    month_start_brazil = now_brazil.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_start_utc = month_start_brazil - BRAZIL_TZ_OFFSET
-    return month_start_utc
+def get_renewal_pipeline_revenue(period='month'):
+    """
+    Receita do pipeline de Renovação (7075777) no período
+    
+    Usa os mesmos critérios de stage e tipo de receita dos demais totais.
+    
+    Args:
+        period: 'month' (mês atual), 'until_yesterday' ou 'today'
+    """
+    aggregates = get_revenue_aggregates()
+    if aggregates is None:
+        return 0.0
+    return aggregates[f'{period}_renewal']
 
-def get_renewal_pipeline_revenue(start_date_utc=None, end_date_utc=None):
+def parse_revenue_month(month):
     """
-    Busca receita do pipeline de Renovação (7075777) diretamente do HubSpot API
-    Busca TODOS os stages válidos (com "ganho", "faturamento" ou "aguardando" no label)
-    para manter consistência com a query do banco de dados
+    Converte o parâmetro month das rotas no primeiro dia do mês.
+
+    Aceita 'current' (mês atual), 'november', 'december' ou 'AAAA-MM'.
+
+    Returns:
+        date, ou None se o valor for inválido
     """
-    RENEWAL_PIPELINE_ID = '7075777'
-    BRAZIL_TZ_OFFSET = timedelta(hours=-3)
-    
+    month = (month or 'current').lower()
+    if month in ('current', 'atual', 'current-month'):
+        return get_today_brazil().replace(day=1)
+    if month in ('november', 'novembro'):
+        return BLACK_NOVEMBER_START
+    if month in ('december', 'dezembro'):
+        return DECEMBER_START
     try:
-        if start_date_utc and end_date_utc:
-            month_start_utc = start_date_utc
-            month_end_utc = end_date_utc
-        else:
-            month_start_utc = get_month_start_brazil_utc()
-            now_brazil = datetime.now(timezone.utc) + BRAZIL_TZ_OFFSET
-            if now_brazil.month == 12:
-                next_month = now_brazil.replace(year=now_brazil.year + 1, month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-            else:
-                next_month = now_brazil.replace(month=now_brazil.month + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
-            month_end_brazil = next_month - timedelta(seconds=1)
-            month_end_utc = month_end_brazil - BRAZIL_TZ_OFFSET
-        
-        month_start_ms = int(month_start_utc.timestamp() * 1000)
-        month_end_ms = int(month_end_utc.timestamp() * 1000)
-        
-        hubspot_token = os.getenv('HUBSPOT_PRIVATE_APP_TOKEN')
-        if not hubspot_token:
-            print("Erro: HUBSPOT_PRIVATE_APP_TOKEN não configurado")
-            return 0.0
-        
-        import requests
-        import time
-        
-        # Primeiro, busca todos os stages do pipeline de Renovação
-        pipelines_url = 'https://api.hubapi.com/crm/v3/pipelines/deals'
-        pipelines_headers = {
-            'Authorization': f'Bearer {hubspot_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        pipelines_response = requests.get(pipelines_url, headers=pipelines_headers, timeout=30)
-        valid_stage_ids = []
-        
-        if pipelines_response.status_code == 200:
-            pipelines_data = pipelines_response.json()
-            for pipeline in pipelines_data.get('results', []):
-                pipeline_id = str(pipeline.get('id'))
-                if pipeline_id == RENEWAL_PIPELINE_ID:
-                    stages = pipeline.get('stages', [])
-                    for stage in stages:
-                        stage_id = str(stage.get('id'))
-                        stage_label = stage.get('label', '').lower()
-                        # Inclui stages com "ganho", "faturamento" ou "aguardando" no label
-                        # (mesmos critérios da query do banco)
-                        if any(keyword in stage_label for keyword in ['ganho', 'faturamento', 'aguardando']):
-                            valid_stage_ids.append(stage_id)
-                    break
-        
-        if not valid_stage_ids:
-            print(f"[AVISO] Nenhum stage válido encontrado para o pipeline de Renovação {RENEWAL_PIPELINE_ID}")
-            return 0.0
-        
-        url = 'https://api.hubapi.com/crm/v3/objects/deals/search'
-        headers = {
-            'Authorization': f'Bearer {hubspot_token}',
-            'Content-Type': 'application/json'
+        year, month_number = month.split('-')
+        return date(int(year), int(month_number), 1)
+    except ValueError:
+        return None
+
+def _query_daily_revenue(month_start, use_rollup):
+    """Receita por dia e pipeline de um mês: {'AAAA-MM-DD': {pipeline: total}}"""
+    month_end = get_next_month_start(month_start)
+    if use_rollup:
+        query = ROLLUP_SERIES_QUERY
+        params = {'start': month_start, 'end': month_end}
+    else:
+        window = get_brazil_date_range_window(month_start, month_end, naive=True)
+        query = DEALS_SERIES_QUERY
+        params = {'start_utc': window.start, 'end_utc': window.end, 'revenue_stages': get_revenue_stage_ids()}
+
+    try:
+        rows = read_query(query, params)
+    except Exception as e:
+        print(f"Erro ao buscar receita diaria: {e}")
+        return None
+    if rows is None:
+        return None
+
+    days = {}
+    for row in rows:
+        days.setdefault(row['day'].isoformat(), {})[row['pipeline']] = float(row['total'] or 0)
+    return days
+
+def get_daily_revenue(month_start):
+    """
+    Receita diária por pipeline de um mês, guardada no cache.
+
+    Lendo do rollup, o resultado é reaproveitado enquanto o watermark do rollup
+    não mudar (nenhum deal novo ou alterado) e é recalculado assim que a
+    atualização incremental processa deals novos. Sem o rollup, é reaproveitado
+    por REVENUE_AGGREGATES_TTL segundos.
+
+    Returns:
+        dict com 'days', 'source' e 'watermark', ou None em caso de erro
+    """
+    cache_key = f'{REVENUE_SERIES_CACHE_PREFIX}{month_start:%Y-%m}'
+    rollup_status = get_revenue_rollup_state()
+    use_rollup = bool(rollup_status and rollup_status['ready'])
+    watermark = rollup_status['watermark'] if use_rollup else None
+
+    def is_current(entry):
+        if entry is None or not entry.value:
+            return False
+        if use_rollup:
+            return (entry.value['source'] == 'rollup'
+                    and entry.value['watermark'] == watermark
+                    and entry.age() < REVENUE_SERIES_MAX_AGE)
+        return entry.value['source'] == 'deals' and entry.age() < REVENUE_AGGREGATES_TTL
+
+    entry = get_cache_entry(cache_key)
+    if is_current(entry):
+        return entry.value
+
+    with _series_lock:
+        entry = get_cache_entry(cache_key)
+        if is_current(entry):
+            return entry.value
+
+        days = _query_daily_revenue(month_start, use_rollup)
+        if days is None:
+            return None
+        daily = {
+            'days': days,
+            'source': 'rollup' if use_rollup else 'deals',
+            'watermark': watermark
         }
-        
-        # Busca deals de TODOS os stages válidos
-        # Nota: A API do HubSpot limita a 6 filtros por grupo, então filtramos tipo_de_receita,
-        # tipo_de_negociacao e valor_ganho no processamento dos deals
-        payload_base = {
-            "filterGroups": [{
-                "filters": [
-                    {"propertyName": "pipeline", "operator": "EQ", "value": RENEWAL_PIPELINE_ID},
-                    {"propertyName": "dealstage", "operator": "IN", "values": valid_stage_ids},
-                    {"propertyName": "closedate", "operator": "GTE", "value": str(month_start_ms)},
-                    {"propertyName": "closedate", "operator": "LTE", "value": str(month_end_ms)}
-                ]
-            }],
-            "properties": [
-                "dealname", "dealstage", "closedate", "valor_ganho",
-                "tipo_de_receita", "tipo_de_negociacao", "pipeline"
-            ],
-            "limit": 100
+        set_cached(cache_key, daily, publish=False)
+        return daily
+
+def get_revenue_series(month_start, by_pipeline=False, include_renewal_pipeline=False):
+    """
+    Receita acumulada por dia (horário de Brasília) de um mês, para gráficos burn-up.
+
+    A série vai do dia 1 até o último dia do mês ou até hoje, o que vier
+    primeiro; dias sem receita entram com valor zero.
+
+    Args:
+        month_start: Primeiro dia do mês
+        by_pipeline: Se True, inclui a receita e o acumulado de cada pipeline
+        include_renewal_pipeline: Se True, inclui o pipeline de Renovação (7075777)
+
+    Returns:
+        dict com 'series' (date, revenue, cumulative e, se pedido, pipelines),
+        ou None em caso de erro
+    """
+    daily = get_daily_revenue(month_start)
+    if daily is None:
+        return None
+
+    today = get_today_brazil()
+    last_day = min(get_next_month_start(month_start) - timedelta(days=1), today)
+
+    series = []
+    cumulative = 0.0
+    pipeline_cumulative = {}
+    day = month_start
+    while day <= last_day:
+        totals = daily['days'].get(day.isoformat(), {})
+        if not include_renewal_pipeline:
+            # Sem Renovação, deals sem pipeline ('') também ficam fora, como nos totais do mês
+            totals = {pipeline: total for pipeline, total in totals.items() if pipeline not in (RENEWAL_PIPELINE_ID, '')}
+
+        day_total = sum(totals.values(), 0.0)
+        cumulative += day_total
+        point = {
+            'date': day.isoformat(),
+            'revenue': round(day_total, 2),
+            'cumulative': round(cumulative, 2)
         }
-        
-        all_deals = []
-        after = None
-        
-        while True:
-            payload = payload_base.copy()
-            if after:
-                payload["after"] = after
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            
-            if response.status_code == 429:
-                print("[AVISO] Rate limit atingido (Renovacao), aguardando 2 segundos...")
-                time.sleep(2)
-                continue
-            elif response.status_code != 200:
-                print(f"[AVISO] Erro na API HubSpot (Renovacao): {response.status_code} - {response.text}")
-                break
-            
-            data = response.json()
-            results = data.get("results", [])
-            
-            if not results:
-                break
-            
-            all_deals.extend(results)
-            
-            paging = data.get("paging", {})
-            after = paging.get("next", {}).get("after")
-            
-            if not after:
-                break
-            
-            time.sleep(0.5)
-        
-        total_revenue = 0.0
-        
-        for deal in all_deals:
-            props = deal.get('properties', {})
-            tipo_receita = props.get('tipo_de_receita', '')
-            tipo_negociacao = props.get('tipo_de_negociacao', '')
-            valor_ganho_str = props.get('valor_ganho', '0')
-            
-            # Aplica filtros que não puderam ser aplicados na API (limite de 6 filtros)
-            if tipo_receita == 'Pontual':
-                continue
-            if tipo_negociacao == 'Variação Cambial':
-                continue
-            
-            try:
-                valor_ganho = float(valor_ganho_str) if valor_ganho_str else 0.0
-            except (ValueError, TypeError):
-                valor_ganho = 0.0
-            
-            if valor_ganho <= 0:
-                continue
-            
-            total_revenue += valor_ganho
-        
-        print(f"[INFO] Receita total do pipeline de Renovação: R$ {total_revenue:,.2f} ({len(all_deals)} deals)")
-        return total_revenue
-        
-    except Exception as e:
-        print(f"[ERRO] Erro ao buscar receita do pipeline de Renovacao: {e}")
-        import traceback
-        traceback.print_exc()
-        return 0.0
+        if by_pipeline:
+            for pipeline, total in totals.items():
+                pipeline_cumulative[pipeline] = pipeline_cumulative.get(pipeline, 0.0) + total
+            point['pipelines'] = {
+                pipeline: {
+                    'revenue': round(totals.get(pipeline, 0.0), 2),
+                    'cumulative': round(pipeline_total, 2)
+                }
+                for pipeline, pipeline_total in pipeline_cumulative.items()
+            }
+        series.append(point)
+        day += timedelta(days=1)
 
+    return {
+        'month': f'{month_start:%Y-%m}',
+        'series': series,
+        'total': round(cumulative, 2),
+        'has_renewal_pipeline': include_renewal_pipeline,
+        'source': daily['source'],
+        'date': today.isoformat()
+    }
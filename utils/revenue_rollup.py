@@ -0,0 +1,238 @@
+"""
+Rollup incremental de receita
+
+Mantém em revenue_daily_rollup a receita por dia × pipeline × classe de stage
+(won, billing, waiting; ver utils.stages) × tipo de receita (migrations/002_create_revenue_rollup.sql). Cada atualização
+reprocessa apenas os deals com hs_lastmodifieddate posterior ao watermark e
+recalcula os dias afetados; uma reconstrução completa periódica cobre deals
+removidos da tabela deals. As rotas de receita leem o rollup em vez de varrer
+os deals do mês (ver utils.revenue.compute_revenue_aggregates).
+"""
+import time
+import psycopg2
+from utils.db import get_db_connection_context, read_query
+from utils.stages import get_stage_ids
+from psycopg2.extras import RealDictCursor
+
+ROLLUP_NAME = 'revenue_daily'
+
+# Lock consultivo do Postgres que serializa a atualização entre instâncias
+ROLLUP_LOCK_ID = 7075777001
+
+# Reprocessa deals modificados pouco antes do watermark (a sincronização
+# HubSpot → banco pode gravar deals fora de ordem); reprocessar é idempotente
+WATERMARK_OVERLAP_MINUTES = 10
+
+# Intervalo entre reconstruções completas do rollup
+FULL_REBUILD_INTERVAL = 24 * 3600
+
+# Faixas de valor por deal
+REVENUE_TIERS = {
+    'tier_1': 1200000,
+    'tier_2': 900000,
+    'tier_3': 600000,
+    'tier_4': 300000
+}
+
+# Deals lidos da tabela deals e classificados ({where} filtra pelo watermark)
+CHANGED_DEALS_QUERY = """
+    CREATE TEMP TABLE rollup_changed ON COMMIT DROP AS
+    SELECT DISTINCT ON (CAST(d.hs_object_id AS TEXT))
+        CAST(d.hs_object_id AS TEXT) AS deal_id,
+        DATE(d.closedate - INTERVAL '3 hour') AS day,
+        COALESCE(d.pipeline, '') AS pipeline,
+        CASE
+            WHEN d.dealstage = ANY(%(won_stages)s) THEN 'won'
+            WHEN d.dealstage = ANY(%(billing_stages)s) THEN 'billing'
+            WHEN d.dealstage = ANY(%(waiting_stages)s) THEN 'waiting'
+        END AS stage_class,
+        COALESCE(d.tipo_de_receita, '') AS revenue_type,
+        d.valor_ganho,
+        d.hs_lastmodifieddate,
+        COALESCE(d.tipo_de_negociacao, '') <> 'Variação Cambial' AS elegivel
+    FROM deals d
+    {where}
+    ORDER BY CAST(d.hs_object_id AS TEXT), d.hs_lastmodifieddate DESC NULLS LAST
+"""
+
+INSERT_DEALS_QUERY = """
+    INSERT INTO revenue_rollup_deals (deal_id, day, pipeline, stage_class, revenue_type, valor_ganho, hs_lastmodifieddate)
+    SELECT deal_id, day, pipeline, stage_class, revenue_type, valor_ganho, hs_lastmodifieddate
+    FROM rollup_changed
+    WHERE elegivel
+        AND stage_class IS NOT NULL
+        AND day IS NOT NULL
+        AND valor_ganho IS NOT NULL
+        AND valor_ganho > 0
+"""
+
+# Recalcula os totais diários ({where} restringe aos dias afetados)
+INSERT_DAILY_QUERY = """
+    INSERT INTO revenue_daily_rollup (day, pipeline, stage_class, revenue_type, total, deal_count, tier_1, tier_2, tier_3, tier_4)
+    SELECT
+        day,
+        pipeline,
+        stage_class,
+        revenue_type,
+        SUM(valor_ganho),
+        COUNT(*),
+        COALESCE(SUM(valor_ganho) FILTER (WHERE valor_ganho >= %(tier_1)s), 0),
+        COALESCE(SUM(valor_ganho) FILTER (WHERE valor_ganho >= %(tier_2)s), 0),
+        COALESCE(SUM(valor_ganho) FILTER (WHERE valor_ganho >= %(tier_3)s), 0),
+        COALESCE(SUM(valor_ganho) FILTER (WHERE valor_ganho >= %(tier_4)s), 0)
+    FROM revenue_rollup_deals
+    {where}
+    GROUP BY day, pipeline, stage_class, revenue_type
+"""
+
+def _read_state(cursor):
+    cursor.execute("""
+        SELECT
+            watermark,
+            last_full_rebuild,
+            EXTRACT(EPOCH FROM now() - last_full_rebuild) AS full_rebuild_age
+        FROM revenue_rollup_state
+        WHERE name = %s
+    """, (ROLLUP_NAME,))
+    return cursor.fetchone()
+
+def _stage_params():
+    """IDs dos stages de receita por classe (classificação em utils.stages)"""
+    return {
+        'won_stages': get_stage_ids('won'),
+        'billing_stages': get_stage_ids('billing'),
+        'waiting_stages': get_stage_ids('waiting')
+    }
+
+def _rebuild(cursor, stage_params):
+    """Reconstrói o rollup inteiro a partir da tabela deals"""
+    cursor.execute(CHANGED_DEALS_QUERY.format(where=''), stage_params)
+    cursor.execute("DELETE FROM revenue_rollup_deals")
+    cursor.execute(INSERT_DEALS_QUERY)
+    cursor.execute("DELETE FROM revenue_daily_rollup")
+    cursor.execute(INSERT_DAILY_QUERY.format(where=''), REVENUE_TIERS)
+
+def _update_incremental(cursor, watermark, stage_params):
+    """Reprocessa os deals modificados desde o watermark e os dias afetados"""
+    cursor.execute(
+        CHANGED_DEALS_QUERY.format(where="WHERE d.hs_lastmodifieddate > %(since)s - %(overlap)s * INTERVAL '1 minute'"),
+        {'since': watermark, 'overlap': WATERMARK_OVERLAP_MINUTES, **stage_params}
+    )
+
+    # Dias afetados: onde cada deal estava antes e onde está agora
+    cursor.execute("""
+        CREATE TEMP TABLE rollup_days ON COMMIT DROP AS
+        SELECT day FROM revenue_rollup_deals WHERE deal_id IN (SELECT deal_id FROM rollup_changed)
+        UNION
+        SELECT day FROM rollup_changed WHERE day IS NOT NULL
+    """)
+
+    cursor.execute("DELETE FROM revenue_rollup_deals WHERE deal_id IN (SELECT deal_id FROM rollup_changed)")
+    cursor.execute(INSERT_DEALS_QUERY)
+    cursor.execute("DELETE FROM revenue_daily_rollup WHERE day IN (SELECT day FROM rollup_days)")
+    cursor.execute(INSERT_DAILY_QUERY.format(where="WHERE day IN (SELECT day FROM rollup_days)"), REVENUE_TIERS)
+
+def get_revenue_rollup_state():
+    """
+    Estado do rollup, sem atualizá-lo (a atualização é feita pelo cache, ver
+    utils.cache_manager).
+
+    Returns:
+        dict com 'ready' e 'watermark', ou None se o banco ou as tabelas do
+        rollup (migrations/002_create_revenue_rollup.sql) não estiverem
+        disponíveis; nesse caso as leituras varrem os deals
+    """
+    try:
+        rows = read_query(
+            "SELECT watermark, last_full_rebuild FROM revenue_rollup_state WHERE name = %s",
+            (ROLLUP_NAME,)
+        )
+    except psycopg2.Error as e:
+        print(f"[AVISO] Estado do rollup de receita indisponivel: {e}")
+        return None
+    if rows is None:
+        return None
+    state = rows[0] if rows else None
+    return {
+        'ready': bool(state and state['last_full_rebuild']),
+        'watermark': state['watermark'].isoformat() if state and state['watermark'] else None
+    }
+
+def update_revenue_rollup():
+    """
+    Atualiza o rollup de receita (incremental, ou completo quando necessário).
+
+    Returns:
+        dict com o estado da atualização ('ready' indica se o rollup pode ser
+        lido), ou None se o banco não estiver disponível
+    """
+    start_time = time.time()
+    with get_db_connection_context() as conn:
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            state = _read_state(cursor)
+            ready = bool(state and state['last_full_rebuild'])
+            status = {
+                'ready': ready,
+                'updated': False,
+                'full_rebuild': False,
+                'changed_deals': 0,
+                'watermark': state['watermark'].isoformat() if state and state['watermark'] else None
+            }
+
+            needs_full = not ready or state['full_rebuild_age'] >= FULL_REBUILD_INTERVAL
+
+            # Sem a classificação dos stages todo deal ficaria sem classe e o
+            # rollup seria zerado: mantém o rollup e o estado como estão (uma
+            # classe sem stages, ex.: 'waiting', apenas fica sem deals)
+            stage_params = _stage_params()
+            if not any(stage_params.values()):
+                conn.rollback()
+                print("[AVISO] Rollup de receita nao atualizado: lista de stages vazia")
+                return status
+
+            # Outra instância já está atualizando: usa o rollup como está
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (ROLLUP_LOCK_ID,))
+            if not cursor.fetchone()['locked']:
+                conn.rollback()
+                return status
+
+            if needs_full:
+                _rebuild(cursor, stage_params)
+            else:
+                _update_incremental(cursor, state['watermark'], stage_params)
+
+            cursor.execute("SELECT COUNT(*) AS changed, MAX(hs_lastmodifieddate) AS watermark FROM rollup_changed")
+            changed = cursor.fetchone()
+            watermark = changed['watermark']
+            if state and state['watermark'] and (watermark is None or watermark < state['watermark']):
+                watermark = state['watermark']
+
+            cursor.execute("""
+                INSERT INTO revenue_rollup_state (name, watermark, last_full_rebuild, updated_at)
+                VALUES (%s, %s, CASE WHEN %s THEN now() END, now())
+                ON CONFLICT (name) DO UPDATE SET
+                    watermark = EXCLUDED.watermark,
+                    last_full_rebuild = COALESCE(EXCLUDED.last_full_rebuild, revenue_rollup_state.last_full_rebuild),
+                    updated_at = now()
+            """, (ROLLUP_NAME, watermark, needs_full))
+            conn.commit()
+            cursor.close()
+
+            status.update({
+                'ready': True,
+                'updated': True,
+                'full_rebuild': needs_full,
+                'changed_deals': changed['changed'],
+                'watermark': watermark.isoformat() if watermark else None,
+                'duration': round(time.time() - start_time, 3)
+            })
+            if needs_full:
+                print(f"[OK] Rollup de receita reconstruido em {status['duration']:.2f}s ({changed['changed']} deals)")
+            return status
+        except Exception as e:
+            conn.rollback()
+            print(f"[AVISO] Erro ao atualizar rollup de receita: {e}")
+            return None
@@ -0,0 +1,100 @@
+"""
+Agrupamento de requisições simultâneas (single-flight)
+
+Quando vários painéis pedem a mesma rota ao mesmo tempo, apenas a primeira
+requisição executa a função (e as buscas no HubSpot); as demais aguardam e
+recebem uma cópia da mesma resposta.
+"""
+import os
+import threading
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, make_response, Response
+
+# Tempo máximo em segundos que uma requisição aguarda a que está em andamento
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', '60'))
+
+# Parâmetros ignorados na chave (cache-busting dos painéis: ?_=timestamp)
+IGNORED_PARAMS = {'_'}
+
+class _Flight:
+    """Execução em andamento de uma rota, compartilhada pelas requisições iguais"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None  # (corpo, status, headers)
+        self.error = None
+        self.waiters = 0
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def get_request_key():
+    """
+    Chave da requisição atual: caminho + parâmetros normalizados (ordenados).
+
+    Inclui Accept-Encoding e If-None-Match, que mudam o corpo da resposta
+    (compressão ou 304) quando ela vem do cache pré-serializado.
+    """
+    params = sorted(
+        (name, value)
+        for name, values in request.args.lists()
+        if name not in IGNORED_PARAMS
+        for value in values
+    )
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    if_none_match = request.headers.get('If-None-Match', '')
+    return f"{request.path}?{urlencode(params)}|{accept_encoding}|{if_none_match}"
+
+def _build_response(result, coalesced):
+    body, status, headers = result
+    response = Response(body, status=status, headers=headers)
+    if coalesced:
+        response.headers['X-Coalesced'] = 'true'
+    return response
+
+def single_flight(f):
+    """
+    Decorator que agrupa requisições simultâneas com os mesmos parâmetros.
+
+    Deve ficar abaixo de @require_auth, para que a autenticação continue sendo
+    verificada em cada requisição. Cada requisição recebe seu próprio objeto
+    Response, construído a partir do corpo, status e headers da execução única.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = get_request_key()
+
+        with _flights_lock:
+            flight = _flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                _flights[key] = flight
+            else:
+                flight.waiters += 1
+
+        if not is_leader:
+            if not flight.done.wait(SINGLE_FLIGHT_TIMEOUT):
+                print(f"[AVISO] Timeout aguardando requisicao em andamento: {key}")
+                return f(*args, **kwargs)
+            if flight.error is not None:
+                raise flight.error
+            return _build_response(flight.result, coalesced=True)
+
+        try:
+            response = make_response(f(*args, **kwargs))
+            flight.result = (response.get_data(), response.status_code, list(response.headers.items()))
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with _flights_lock:
+                del _flights[key]
+            flight.done.set()
+            if flight.waiters:
+                print(f"[OK] {flight.waiters} requisicoes agrupadas em {key}")
+
+        return _build_response(flight.result, coalesced=False)
+
+    return decorated_function
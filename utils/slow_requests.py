@@ -0,0 +1,45 @@
+"""
+Log de requisições lentas
+
+Requisições que passam de SLOW_REQUEST_THRESHOLD segundos são registradas
+com o uso do pool de conexões pela própria requisição (conexões obtidas,
+espera e tempo com a conexão) e o estado do pool no momento, para separar
+lentidão do banco de esgotamento do pool.
+"""
+import os
+import time
+from flask import g, request
+from utils.db import start_request_db_stats, get_request_db_stats, get_pool_status
+
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '2'))
+
+def _start_timer():
+    g.request_started = time.time()
+    start_request_db_stats()
+
+def _log_slow_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+
+    duration = time.time() - started
+    if duration < SLOW_REQUEST_THRESHOLD:
+        return response
+
+    db_stats = get_request_db_stats() or {}
+    pool_status = get_pool_status()
+    print(
+        f"[AVISO] Requisicao lenta: {request.method} {request.full_path.rstrip('?')} "
+        f"{duration:.2f}s status={response.status_code} | "
+        f"db: {db_stats.get('checkouts', 0)} conexoes, "
+        f"espera {db_stats.get('wait', 0):.3f}s, uso {db_stats.get('hold', 0):.3f}s, "
+        f"falhas {db_stats.get('failures', 0)} | "
+        f"pool: {pool_status.get('in_use', '-')} em uso, {pool_status.get('idle', '-')} ociosas, "
+        f"max {pool_status.get('maxconn', '-')}, esgotado {pool_status.get('exhausted', 0)}x"
+    )
+    return response
+
+def register_slow_request_log(app):
+    """Registra os hooks que medem cada requisição"""
+    app.before_request(_start_timer)
+    app.after_request(_log_slow_request)
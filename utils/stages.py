@@ -0,0 +1,108 @@
+"""
+Índice de classificação dos stages de deals
+
+Carrega a tabela deal_stages_pipelines e classifica cada stage uma única vez
+pelo label. As consultas filtram com `dealstage = ANY(%s)` usando as listas
+de IDs daqui, em vez de juntar deal_stages_pipelines e aplicar LIKE no label
+de cada linha (o que impede o uso do índice em deals.dealstage).
+"""
+import threading
+from utils.db import read_query
+from utils.cache import get_cached, set_cached, register_cache_key
+
+# Palavras do label que definem a classe do stage (na ordem de prioridade)
+STAGE_LABEL_KEYWORDS = [
+    ('won', 'ganho'),
+    ('billing', 'faturamento'),
+    ('waiting', 'aguardando'),
+    ('lost', 'perdido')
+]
+
+STAGE_CLASSES = ['won', 'billing', 'waiting', 'lost', 'open']
+
+# Stages que contam como receita
+REVENUE_STAGE_CLASSES = ['won', 'billing', 'waiting']
+
+STAGE_INDEX_CACHE_KEY = 'deal_stages'
+STAGE_INDEX_TTL = 3600
+
+_load_lock = threading.Lock()
+
+def classify_stage(label, is_closed=False):
+    """
+    Classifica um stage pelo label: won, billing, waiting, lost ou open.
+
+    Stages fechados cujo label não indica ganho, faturamento ou espera são
+    tratados como perdidos.
+    """
+    label = (label or '').lower()
+    for stage_class, keyword in STAGE_LABEL_KEYWORDS:
+        if keyword in label:
+            return stage_class
+    return 'lost' if is_closed else 'open'
+
+def load_stage_index():
+    """
+    Lê deal_stages_pipelines e monta o índice de classificação.
+
+    Returns:
+        dict {'stages': {stage_id: classe}, 'by_class': {classe: [stage_ids]}},
+        ou None se o banco não estiver disponível
+    """
+    try:
+        rows = read_query("SELECT stage_id, stage_label, deal_isclosed FROM deal_stages_pipelines")
+    except Exception as e:
+        print(f"[AVISO] Erro ao carregar stages: {e}")
+        return None
+    if rows is None:
+        return None
+
+    stages = {}
+    by_class = {stage_class: [] for stage_class in STAGE_CLASSES}
+    for row in rows:
+        stage_id = str(row['stage_id'])
+        stage_class = classify_stage(row['stage_label'], bool(row['deal_isclosed']))
+        stages[stage_id] = stage_class
+        by_class[stage_class].append(stage_id)
+
+    return {'stages': stages, 'by_class': by_class}
+
+def register_stage_index():
+    """Registra o índice no cache para ser recarregado periodicamente"""
+    register_cache_key(STAGE_INDEX_CACHE_KEY, ttl=STAGE_INDEX_TTL, refresh=load_stage_index, timeout=30)
+
+def get_stage_index():
+    """Retorna o índice de stages (carrega na primeira chamada)"""
+    index = get_cached(STAGE_INDEX_CACHE_KEY)
+    if index:
+        return index
+
+    with _load_lock:
+        index = get_cached(STAGE_INDEX_CACHE_KEY)
+        if index:
+            return index
+        index = load_stage_index()
+        if index:
+            set_cached(STAGE_INDEX_CACHE_KEY, index)
+        return index
+
+def get_stage_ids(*stage_classes):
+    """
+    IDs dos stages das classes informadas (para `dealstage = ANY(%s)`).
+
+    Returns:
+        Lista de IDs (vazia se o índice não pôde ser carregado)
+    """
+    index = get_stage_index()
+    if not index:
+        print("[AVISO] Indice de stages indisponivel")
+        return []
+
+    stage_ids = []
+    for stage_class in stage_classes:
+        stage_ids.extend(index['by_class'].get(stage_class, []))
+    return stage_ids
+
+def get_revenue_stage_ids():
+    """IDs dos stages que contam como receita (ganho, faturamento, aguardando)"""
+    return get_stage_ids(*REVENUE_STAGE_CLASSES)
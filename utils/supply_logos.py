@@ -3,6 +3,7 @@ Funções auxiliares para estatísticas de logos da BU Supply
 """
 import time
 from utils.db import get_db_connection_context
+from utils.datetime_utils import get_brazil_window
 from psycopg2.extras import RealDictCursor
 
 # Valor base fixo até 30/11
@@ -50,7 +51,7 @@ def get_supply_logos_stats(force_refresh=False):
               COUNT(
                 DISTINCT
                 CASE
-                  WHEN LOWER("source"."Deal Stages Pipelines - Dealstage_pipeline_label") LIKE '%vendas nmrr%'
+                  WHEN LOWER("source"."Deal Stages Pipelines - Dealstage_pipeline_label") LIKE '%%vendas nmrr%%'
                   THEN "source"."hs_object_id"
                 END
               ) AS "qtd_new",
@@ -59,7 +60,7 @@ def get_supply_logos_stats(force_refresh=False):
               COUNT(
                 DISTINCT
                 CASE
-                  WHEN LOWER("source"."Deal Stages Pipelines - Dealstage_pipeline_label") LIKE '%expansão%'
+                  WHEN LOWER("source"."Deal Stages Pipelines - Dealstage_pipeline_label") LIKE '%%expansão%%'
                    AND "source"."Line Items - hs_object_id__in_produto_esta_nesta_negociacao" = '1'
                    AND "source"."hs_object_id" <> '42020535705'
                   THEN "source"."hs_object_id"
@@ -369,6 +370,9 @@ def get_supply_logos_stats(force_refresh=False):
                         WHERE
                           COALESCE("public"."deals"."tipo_de_receita", '') <> 'Pontual'
                           AND COALESCE("public"."deals"."tipo_de_negociacao", '') <> 'Variação Cambial'
+                          -- Mês atual no horário de Brasília, direto na coluna indexada
+                          AND "public"."deals"."closedate" >= %(month_start)s
+                          AND "public"."deals"."closedate" < %(month_end)s
                         LIMIT
                           1048575
                       ) AS "source"
@@ -386,17 +390,15 @@ def get_supply_logos_stats(force_refresh=False):
               ) AS "source"
             WHERE
               (
-                LOWER("source"."Deal Stages Pipelines - Dealstage_stage_label") LIKE '%ganho%'
-                OR LOWER("source"."Deal Stages Pipelines - Dealstage_stage_label") LIKE '%faturamento%'
+                LOWER("source"."Deal Stages Pipelines - Dealstage_stage_label") LIKE '%%ganho%%'
+                OR LOWER("source"."Deal Stages Pipelines - Dealstage_stage_label") LIKE '%%faturamento%%'
               )
-              AND "source"."closedate_ajustada" >= DATE_TRUNC('month', NOW())
-              AND "source"."closedate_ajustada" < DATE_TRUNC('month', (NOW() + INTERVAL '1 month'))
               AND (
-                LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%logos%'
-                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%logmanager%'
-                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%catálogo%'
-                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%logautomation%'
-                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%automação%'
+                LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%%logos%%'
+                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%%logmanager%%'
+                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%%catálogo%%'
+                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%%logautomation%%'
+                OR LOWER("source"."Line Items - hs_object_id__produto_principal") LIKE '%%automação%%'
               )
             GROUP BY
               "source"."Line Items - hs_object_id__produto_principal"
@@ -406,7 +408,8 @@ def get_supply_logos_stats(force_refresh=False):
               "source"."Line Items - hs_object_id__produto_principal" ASC;
             """
             
-            cursor.execute(query)
+            month = get_brazil_window('month', naive=True)
+            cursor.execute(query, {'month_start': month.start, 'month_end': month.end})
             results = cursor.fetchall()
             
             # Processa os resultados